@@ -99,8 +99,7 @@ def test_hashed_index(cache_name, label, color, sample_set, sample_sizes, tokeni
                     html_text = fp.read()
 
                 doc_name = str(index)  # Use a pseudo doc name for speed
-                for term in word_tokenize(html_text, **tokenize_args):
-                    bow.add_term_occurrence(term, doc_name)
+                bow.add_document(doc_name, word_tokenize(html_text, **tokenize_args))
 
             if prune:
                 bow.prune(**prune_args)
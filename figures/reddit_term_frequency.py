@@ -46,8 +46,7 @@ for subreddit_index, subreddit in enumerate(subreddit_list):
 
                 article = goose.extract(raw_html=html_text)
 
-                for term in word_tokenize(article.cleaned_text, remove_urls=True, stopwords=[]):
-                    term_index.add_term_occurrence(term, path)
+                term_index.add_document(path, word_tokenize(article.cleaned_text, remove_urls=True, stopwords=[]))
 
         print('Saving for future pre-loading...')
         term_index.save(file_name, compressed=True)
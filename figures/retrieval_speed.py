@@ -0,0 +1,83 @@
+from __future__ import division, print_function
+
+import time
+import random
+import numpy as np
+
+from math import log10
+from collections import Counter
+
+from matplotlib import pyplot as plt
+
+from index.hashedindex import HashedIndex
+from index.retrieval import RankedRetrieval
+
+# Micro-benchmark comparing the time taken to score a query against every
+# document using generate_document_vector with the RankedRetrieval search
+# on synthetic corpora with a Zipfian term distribution.
+
+random.seed(0)
+
+vocabulary = ['term%d' % i for i in xrange(20000)]
+document_length = 300
+n_queries = 5
+sample_sizes = (100, 200, 400, 800)
+
+
+def random_terms(n):
+    return [vocabulary[int(random.paretovariate(0.8)) % len(vocabulary)] for _ in xrange(n)]
+
+
+def score_with_vectors(index, query):
+    n = len(index.documents())
+    query_vector = np.zeros(len(index.terms()))
+    for term, count in Counter(query).items():
+        if term in index:
+            df = index.get_document_frequency(term)
+            query_vector[index.get_term_id(term)] = count * log10((1 + n) / (1 + df))
+
+    results = []
+    for doc in index.documents():
+        vector = index.generate_document_vector(doc)
+        denominator = np.linalg.norm(vector) * np.linalg.norm(query_vector)
+        results.append((doc, np.dot(vector, query_vector) / denominator if denominator else 0))
+
+    results.sort(key=lambda x: x[1], reverse=True)
+    return results[:10]
+
+
+vector_runtimes = []
+retrieval_runtimes = []
+
+for n_samples in sample_sizes:
+    index = HashedIndex()
+    for i in xrange(n_samples):
+        index.add_document('document%d' % i, random_terms(document_length))
+
+    queries = [random_terms(20) for _ in xrange(n_queries)]
+
+    t0 = time.time()
+    for query in queries:
+        score_with_vectors(index, query)
+    vector_runtimes.append((time.time() - t0) / n_queries)
+
+    t0 = time.time()
+    retrieval = RankedRetrieval(index)
+    setup = time.time() - t0
+
+    t0 = time.time()
+    for query in queries:
+        retrieval.search(query)
+    retrieval_runtimes.append((time.time() - t0) / n_queries)
+
+    print('%d documents: generate_document_vector %.4fs/query, RankedRetrieval %.6fs/query (%.4fs setup)' % (
+        n_samples, vector_runtimes[-1], retrieval_runtimes[-1], setup
+    ))
+
+plt.plot(sample_sizes, vector_runtimes, label='generate_document_vector', marker='o')
+plt.plot(sample_sizes, retrieval_runtimes, label='RankedRetrieval', marker='o')
+plt.yscale('log')
+plt.xlabel('Number of Documents')
+plt.ylabel('Runtime per Query (seconds)')
+plt.legend(loc='upper left')
+plt.show()
@@ -30,10 +30,9 @@ def generate_feature_matrix(wiki, data, n_concepts=10, **word_concept_params):
     config.use_meta_language = False
     goose = Goose(config)
 
-    results = {}
-    concepts = set()
+    articles = []
 
-    # Iterate through the data and perform training
+    # Iterate through the data and extract the text of each page
     for index, (abs_path, label) in enumerate(data.items()):
         if not os.path.exists(abs_path):
             continue
@@ -50,23 +49,33 @@ def generate_feature_matrix(wiki, data, n_concepts=10, **word_concept_params):
 
         if len(article.cleaned_text) > 500:
             logging.info('%s (%s)', article.title, label)
+            articles.append((abs_path, article))
+        else:
+            logging.info('Document is of insufficient length')
 
-            search_results, terms, query_vector = wiki.word_concepts(article.cleaned_text, article.title, **word_concept_params)
+    # Word concepts of all pages are generated together so that shared terms are only fetched once
+    word_concepts = wiki.word_concepts_batch(
+        [extracted.cleaned_text for (_, extracted) in articles],
+        [extracted.title for (_, extracted) in articles],
+        **word_concept_params
+    )
 
-            if search_results:
-                results[abs_path] = [(sr.page_id, sr.weight) for sr in search_results[:n_concepts]]
+    results = {}
+    concepts = set()
 
-                # Remove any concepts which have a weight of 0
-                results[abs_path] = filter(lambda x: x[1] > 0, results[abs_path])
+    for (abs_path, _), (search_results, terms, query_vector) in zip(articles, word_concepts):
+        if search_results:
+            results[abs_path] = [(sr.page_id, sr.weight) for sr in search_results[:n_concepts]]
 
-                for search_result in search_results[:n_concepts]:
-                    concepts.add(search_result.page_id)
+            # Remove any concepts which have a weight of 0
+            results[abs_path] = filter(lambda x: x[1] > 0, results[abs_path])
 
-                logging.info(search_results[:n_concepts])
-            else:
-                logging.warn('No word concepts returned')
+            for search_result in search_results[:n_concepts]:
+                concepts.add(search_result.page_id)
+
+            logging.info(search_results[:n_concepts])
         else:
-            logging.info('Document is of insufficient length')
+            logging.warn('No word concepts returned')
 
     shape = (len(results), len(concepts))
 
@@ -4,34 +4,43 @@ import numpy as np
 
 from goose import Goose, Configuration
 from textparser import word_tokenize
-from index.hashedindex import HashedIndex
+from index.hashedindex import build_index
 
+# Created on first use within each indexing worker process
+_goose = None
 
-def generate_feature_matrix(data, stemmer, **prune_params):
-    config = Configuration()
-    config.enable_image_fetching = False
-    config.use_meta_language = False
-    goose = Goose(config)
 
-    _parser = HTMLParser()
+def _extract_tokens(source):
+    global _goose
 
-    sr_index = HashedIndex()
+    url_path, stemmer = source
+    if not os.path.exists(url_path):
+        return None
 
-    for url_path, label in data.items():
+    if _goose is None:
+        config = Configuration()
+        config.enable_image_fetching = False
+        config.use_meta_language = False
+        _goose = Goose(config)
 
-        if os.path.exists(url_path):
-            with open(url_path, 'r') as html_file:
-                html_text = html_file.read()
+    with open(url_path, 'r') as html_file:
+        html_text = html_file.read()
 
-            text = unicode(goose.extract(raw_html=html_text).cleaned_text)
-            text = _parser.unescape(text)
+    text = unicode(_goose.extract(raw_html=html_text).cleaned_text)
+    text = HTMLParser().unescape(text)
 
-            for token in word_tokenize(text, stemmer=stemmer):
-                sr_index.add_term_occurrence(token, url_path)
+    return word_tokenize(text, stemmer=stemmer)
+
+
+def generate_feature_matrix(data, stemmer, sparse=False, processes=None, **prune_params):
+    sr_index = build_index(
+        [(url_path, (url_path, stemmer)) for url_path in data],
+        _extract_tokens, processes=processes,
+    )
 
     sr_index.prune(**prune_params)
 
-    X = sr_index.generate_feature_matrix(mode='tfidf')
+    X = sr_index.generate_feature_matrix(mode='tfidf', sparse=sparse)
 
     y = np.zeros(len(sr_index.documents()))
     for index, doc in enumerate(sr_index.documents()):
@@ -7,6 +7,7 @@ an entire data source into a HashedIndex for later use to generate a numpy featu
 import os
 import json
 import random
+import hashlib
 
 from utils import search_files
 from url import Url
@@ -93,3 +94,37 @@ def load_data_source(data_path, subreddit, page_samples, seed=None, relative=Tru
         data[url_path] = None   # Unlabelled data
 
     return data
+
+
+def generate_manifest(pages_dir, rel_paths):
+    """
+    Generates a manifest of the pages in a Reddit Data Source which maps each
+    relative path to a hash of the page contents. Pages which do not exist
+    are left out of the manifest.
+    :param pages_dir: path to the pages directory of a Reddit Data Source.
+    :param rel_paths: iterable of page paths relative to pages_dir.
+    :return: dictionary of (path, content hash)
+    """
+    manifest = {}
+    for rel_path in rel_paths:
+        abs_path = os.path.join(pages_dir, rel_path)
+        if os.path.exists(abs_path):
+            with open(abs_path, 'rb') as fp:
+                manifest[rel_path] = hashlib.sha1(fp.read()).hexdigest()
+
+    return manifest
+
+
+def compare_manifests(old_manifest, new_manifest):
+    """
+    Compares two manifests generated with generate_manifest.
+    :return: tuple of (added, changed, removed) lists of paths
+    """
+    added = [path for path in new_manifest if path not in old_manifest]
+    removed = [path for path in old_manifest if path not in new_manifest]
+    changed = [
+        path for path, content_hash in new_manifest.items()
+        if path in old_manifest and old_manifest[path] != content_hash
+    ]
+
+    return added, changed, removed
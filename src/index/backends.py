@@ -0,0 +1,275 @@
+"""
+Storage backends for the Wikipedia index. A backend creates connections and
+cursors and fills in the parts of the SQL used by wiki_setup and WikiIndex which
+differ between database engines. Statements are written with the %s parameter
+style and {placeholders} for the dialect specific fragments, see Backend.sql.
+"""
+
+import math
+import sqlite3
+import tempfile
+import unicodedata
+
+
+class Backend(object):
+
+    name = None
+
+    # Dialect specific fragments substituted by sql
+    dialect = {}
+
+    # Additional indexes created by create_indexes for each table
+    indexes = {}
+
+    # Whether uncommitted changes are discarded by a rollback
+    transactional = True
+
+    def sql(self, statement):
+        """
+        Substitutes the dialect specific fragments in the specified statement.
+        """
+        return statement.format(**self.dialect)
+
+    def create_indexes(self, cur, table):
+        for name, columns in self.indexes.get(table, ()):
+            cur.execute('CREATE INDEX %s ON %s (%s);' % (name, table, columns))
+
+    def get_tables(self, cur):
+        raise NotImplementedError()
+
+    def is_disconnect(self, error):
+        """
+        Returns True if the specified exception means the connection was lost.
+        """
+        return False
+
+    def binary(self, value):
+        """
+        Wraps a byte string so that it is bound as a BLOB parameter.
+        """
+        return value
+
+    def name_key(self, name):
+        """
+        Returns the key under which the specified name is unique in the PageName
+        and TermName columns, so that names can be resolved to IDs in memory.
+        """
+        return name
+
+    def bulk_insert(self, cur, table, columns, rows, ignore=False):
+        """
+        Inserts all the rows into the table in as few round trips as the backend
+        allows. Rows which duplicate a unique key are skipped if ignore is True.
+        """
+        cur.executemany('%s INTO %s (%s) VALUES (%s);' % (
+            self.sql('{insert_ignore}') if ignore else 'INSERT', table, ', '.join(columns), ', '.join(['%s'] * len(columns))
+        ), rows)
+
+
+def _tsv_field(value):
+    # Escapes a value for the default FIELDS and LINES options of LOAD DATA
+    if value is None:
+        return '\\N'
+    elif isinstance(value, unicode):
+        value = value.encode('utf8')
+    else:
+        value = str(value)
+
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class MySQLBackend(Backend):
+    """
+    Backend for a MySQL server. Requires MySQLdb to be installed.
+    """
+
+    name = 'mysql'
+
+    indexes = {
+        'TermOccurrences': [('TermOccurrencesCounter', 'Counter')],
+        'TfidfValues': [('TfidfValuesTfidf', 'Tfidf')],
+        'TfidfTotals': [('TfidfTotalsTotal', 'Total')],
+    }
+
+    def __init__(self, user, passwd, host, db, charset=None, engine='MYISAM', local_infile=False):
+        """
+        :param local_infile bulk insert with LOAD DATA LOCAL INFILE, which must also be enabled on the server
+        """
+        self.user = user
+        self.passwd = passwd
+        self.host = host
+        self.db = db
+        self.charset = charset
+        self.engine = engine
+        self.local_infile = local_infile
+
+        self.dialect = {
+            'primary_key': 'INT AUTO_INCREMENT PRIMARY KEY',
+            'table_options': 'ENGINE=%s CHARACTER SET=utf8' % engine,
+            'fixed_table_options': 'ENGINE=%s ROW_FORMAT=FIXED' % engine,
+            'insert_ignore': 'INSERT IGNORE',
+        }
+
+    def __str__(self):
+        return '%s@%s' % (self.db, self.host)
+
+    @property
+    def transactional(self):
+        return self.engine.upper() == 'INNODB'
+
+    @property
+    def errors(self):
+        import MySQLdb
+        return (MySQLdb.DatabaseError, )
+
+    def connect(self):
+        import MySQLdb
+
+        params = dict(user=self.user, passwd=self.passwd, host=self.host, db=self.db)
+        if self.charset is not None:
+            params['charset'] = self.charset
+        if self.local_infile:
+            params['local_infile'] = 1
+
+        connection = MySQLdb.connect(**params)
+        connection.autocommit(False)
+        return connection
+
+    def cursor(self, connection, streaming=False):
+        """
+        Returns a new cursor. Streaming cursors fetch rows from the
+        server as they are iterated rather than all at once.
+        """
+        import MySQLdb.cursors
+
+        if streaming:
+            return connection.cursor(cursorclass=MySQLdb.cursors.SSCursor)
+        else:
+            return connection.cursor(cursorclass=MySQLdb.cursors.Cursor)
+
+    def name_key(self, name):
+        # Approximates the case and accent insensitive utf8_general_ci collation
+        if isinstance(name, str):
+            name = name.decode('utf8')
+
+        name = unicodedata.normalize('NFKD', name)
+        return u''.join([c for c in name if not unicodedata.combining(c)]).lower().rstrip(u' ')
+
+    def bulk_insert(self, cur, table, columns, rows, ignore=False):
+        """
+        Inserts all the rows into the table by loading them from a temporary tab separated
+        file if local_infile is enabled, otherwise with a multi row INSERT.
+        """
+        if not self.local_infile:
+            return Backend.bulk_insert(self, cur, table, columns, rows, ignore)
+
+        with tempfile.NamedTemporaryFile(suffix='.tsv') as fp:
+            for row in rows:
+                fp.write('\t'.join([_tsv_field(value) for value in row]) + '\n')
+            fp.flush()
+
+            cur.execute("""
+                LOAD DATA LOCAL INFILE %%s %s
+                INTO TABLE %s CHARACTER SET utf8 (%s);
+            """ % ('IGNORE' if ignore else '', table, ', '.join(columns)), (fp.name, ))
+
+    def get_tables(self, cur):
+        cur.execute('SHOW TABLES')
+        return set([table for (table, ) in cur.fetchall()])
+
+    def is_disconnect(self, error):
+        import MySQLdb
+
+        # MySQL server has gone away, Lost connection to MySQL server (during query)
+        return isinstance(error, MySQLdb.OperationalError) and error.args[:1] in ((2006, ), (2013, ), (2055, ))
+
+
+class SQLiteCursor(sqlite3.Cursor):
+    """
+    Cursor which accepts the %s parameter style used by MySQLdb so
+    that the same statements can be executed on both backends.
+    """
+
+    def execute(self, sql, parameters=None):
+        if parameters:
+            return sqlite3.Cursor.execute(self, sql.replace('%s', '?'), parameters)
+        else:
+            return sqlite3.Cursor.execute(self, sql)
+
+    def executemany(self, sql, seq_of_parameters):
+        return sqlite3.Cursor.executemany(self, sql.replace('%s', '?'), seq_of_parameters)
+
+
+def _log(x):
+    # Mirrors the MySQL LOG function which returns NULL for non positive values
+    return math.log(x) if x > 0 else None
+
+
+class SQLiteBackend(Backend):
+    """
+    Backend for a SQLite database file, which allows an index to be built and
+    queried without a database server. The database is opened in WAL mode so
+    that it can be read while the index is being written.
+    """
+
+    name = 'sqlite'
+
+    dialect = {
+        'primary_key': 'INTEGER PRIMARY KEY',
+        'table_options': '',
+        'fixed_table_options': 'WITHOUT ROWID',
+        'insert_ignore': 'INSERT OR IGNORE',
+    }
+
+    # Covering indexes for the get_top_documents and incoming link queries
+    indexes = {
+        'TfidfValues': [('TfidfValuesTermTfidf', 'TermID, Tfidf DESC, PageID')],
+        'PageLinks': [('PageLinksTarget', 'TargetPageID')],
+    }
+
+    errors = (sqlite3.DatabaseError, )
+
+    def __init__(self, db):
+        """
+        :param db path to the SQLite database file
+        """
+        self.db = db
+
+    def __str__(self):
+        return self.db
+
+    def connect(self):
+        # Connections are only used by one thread at a time but may be passed between threads by a pool
+        connection = sqlite3.connect(self.db, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL;')
+        connection.execute('PRAGMA synchronous=NORMAL;')
+        connection.create_function('LOG', 1, _log)
+        return connection
+
+    def cursor(self, connection, streaming=False):
+        """
+        Returns a new cursor. SQLite cursors always fetch rows as they are iterated.
+        """
+        return connection.cursor(SQLiteCursor)
+
+    def binary(self, value):
+        # Byte strings are otherwise bound as TEXT
+        return sqlite3.Binary(value)
+
+    def get_tables(self, cur):
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        return set([table for (table, ) in cur.fetchall()])
+
+
+def get_backend(backend='mysql', **params):
+    """
+    Returns the backend with the specified name created with the given
+    parameters, which are usually loaded from db.json. The sqlite backend
+    interprets the db parameter as the path to the database file.
+    """
+    if backend == 'mysql':
+        return MySQLBackend(**params)
+    elif backend == 'sqlite':
+        return SQLiteBackend(params['db'])
+    else:
+        raise ValueError('Unknown backend: %s' % backend)
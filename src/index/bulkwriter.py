@@ -0,0 +1,368 @@
+"""
+Buffered writer used by wiki_setup to add pages to the index. Page and Term IDs are
+allocated from in-process dictionaries and the pages, terms, term occurrences and links
+are written in large batches with Backend.bulk_insert when the writer is flushed, rather
+than with several queries for every page and one for every link.
+
+Occurrences of every term are written to TermOccurrences as pages are added, while the
+total Counter of each term is kept in memory. Terms which never occur min_term_count
+times across all pages are deleted along with their occurrences by prune, once.
+"""
+
+from array import array
+
+
+def _set_flag(flags, index):
+    if index >= len(flags):
+        # Grow geometrically so that IDs allocated in order extend the flags in amortised constant time
+        flags.extend(bytearray(max(index + 1 - len(flags), len(flags))))
+
+    flags[index] = 1
+
+
+def _get_flag(flags, index):
+    return index < len(flags) and flags[index] == 1
+
+
+def _add_count(counts, index, value):
+    if index >= len(counts):
+        counts.extend(array('I', [0]) * max(index + 1 - len(counts), len(counts)))
+
+    counts[index] += value
+
+
+def _get_count(counts, index):
+    return counts[index] if index < len(counts) else 0
+
+
+def _truncate(name, length):
+    # Mirrors the truncation of the VARCHAR name columns, which count characters
+    if isinstance(name, str):
+        name = name.decode('utf8')
+
+    return name[:length]
+
+
+class IDMap(object):
+    """
+    Maps names to IDs allocated in memory. A full index holds millions of pages and
+    terms so names are stored as utf8 byte strings, which take a quarter of the memory
+    of unicode strings on UCS4 builds of Python. Names which the database would store
+    as the same value, because they are equal under its collation or once truncated
+    to the length of their column, are given the same ID. The collation is only
+    approximated, see BulkWriter.flush for names which still collide.
+    """
+
+    def __init__(self, name_key, length):
+        """
+        :param name_key function returning the key under which a name is unique
+        :param length length of the column names are stored in
+        """
+        self.name_key = name_key
+        self.length = length
+        self.next_id = 1
+        self._ids = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _key(self, name):
+        key = self.name_key(_truncate(name, self.length))
+        return key.encode('utf8') if isinstance(key, unicode) else key
+
+    def add(self, name, id):
+        self._ids[self._key(name)] = id
+        self.next_id = max(self.next_id, id + 1)
+
+    def get(self, name):
+        """
+        Returns the ID of the name along with True if a new ID was allocated for it.
+        """
+        key = self._key(name)
+
+        id = self._ids.get(key)
+        if id is not None:
+            return id, False
+
+        id = self._ids[key] = self.next_id
+        self.next_id += 1
+
+        return id, True
+
+
+class BulkWriter(object):
+
+    # Maximum number of pages updated by a single statement, which binds five parameters per page
+    update_chunk_size = 150
+
+    # Maximum number of pages marked as processed or terms deleted by a single statement
+    delete_chunk_size = 500
+
+    # Lengths of the PageName and TermName columns created by wiki_setup
+    page_name_length = 250
+    term_name_length = 40
+
+    def __init__(self, backend, cur, max_rows=500000, min_term_count=3):
+        """
+        :param backend backend of the database being written to
+        :param cur cursor used to write to the database
+        :param max_rows number of buffered rows after which the writer is flushed automatically
+        :param min_term_count total Counter of the occurrences of a term required for it to be kept by prune
+        """
+        self.backend = backend
+        self.cur = cur
+        self.max_rows = max_rows
+        self.min_term_count = min_term_count
+
+        # Names are keyed by Backend.name_key so that they are resolved as the database would
+        self.page_ids = IDMap(backend.name_key, self.page_name_length)
+        self.term_ids = IDMap(backend.name_key, self.term_name_length)
+        self._processed = bytearray()   # Processed flag of each PageID
+        self._term_counts = array('I')  # Total Counter of the occurrences of each TermID
+
+        # Rows waiting to be written by flush
+        self._new_pages = {}      # PageID -> (PageName, Length, Processed)
+        self._updated_pages = []  # (PageID, PageName, Length) of written pages which have since been processed
+        self._terms = {}          # TermID -> TermName of the terms first seen since the last flush
+        self._occurrences = []    # (TermID, PageID, Counter)
+        self._links = []          # (PageID, TargetPageID, Counter)
+
+    def __repr__(self):
+        return '<BulkWriter %s: %d pages, %d terms, %d buffered rows>' % (
+            self.backend, len(self.page_ids), len(self.term_ids), self.buffered_rows()
+        )
+
+    def load(self):
+        """
+        Seeds the dictionaries with the Pages and Terms which are already in the
+        database, which is required when continuing a previous index operation.
+        """
+        # Rows are iterated rather than fetched at once so that streaming cursors are not held in memory
+        self.cur.execute('SELECT PageID, PageName, Processed FROM Pages;')
+        for page_id, page_name, processed in self.cur:
+            self.page_ids.add(page_name, page_id)
+            if processed:
+                self._set_processed(page_id)
+
+        self.cur.execute('SELECT TermID, TermName FROM Terms;')
+        for term_id, term_name in self.cur:
+            self.term_ids.add(term_name, term_id)
+
+        # Pages which are not marked as processed are written again when they are added
+        self.cur.execute("""
+            SELECT TermOccurrences.TermID, SUM(TermOccurrences.Counter)
+            FROM TermOccurrences JOIN Pages ON Pages.PageID = TermOccurrences.PageID
+            WHERE Pages.Processed = 1
+            GROUP BY TermOccurrences.TermID;
+        """)
+        for term_id, counter in self.cur:
+            _add_count(self._term_counts, term_id, int(counter))
+
+    def buffered_rows(self):
+        return len(self._new_pages) + len(self._updated_pages) + len(self._occurrences) + len(self._links)
+
+    def is_processed(self, page_id):
+        return _get_flag(self._processed, page_id)
+
+    def term_count(self, term_id):
+        """
+        Returns the total Counter of the occurrences of a term added so far.
+        """
+        return _get_count(self._term_counts, term_id)
+
+    def rare_terms(self):
+        """
+        Returns the IDs of the terms which have occurred less than min_term_count times.
+        """
+        return [term_id for term_id in xrange(1, self.term_ids.next_id) if self.term_count(term_id) < self.min_term_count]
+
+    def _set_processed(self, page_id):
+        _set_flag(self._processed, page_id)
+
+    def _get_page_id(self, page_name):
+        page_name = _truncate(page_name, self.page_name_length)
+
+        page_id, created = self.page_ids.get(page_name)
+        if created:
+            self._new_pages[page_id] = (page_name, 0, 0)
+
+        return page_id
+
+    def add_page(self, page_name, length, term_counts, link_counts):
+        """
+        Adds a processed page along with the number of times each term occurs in it and
+        the number of links to each target page. Pages which are linked to but have not
+        been processed are added as unprocessed pages. Returns False if a page with the
+        same name was already processed, in which case nothing is added.
+        """
+        page_name = _truncate(page_name, self.page_name_length)
+
+        page_id = self._get_page_id(page_name)
+        if self.is_processed(page_id):
+            return False  # No decent way to resolve this conflict (Issue #76)
+
+        self._set_processed(page_id)
+        if page_id in self._new_pages:
+            self._new_pages[page_id] = (page_name, length, 1)
+        else:
+            self._updated_pages.append((page_id, page_name, length))
+
+        # Terms and links whose names resolve to the same ID are counted together
+        term_ids = {}
+        for term_name, counter in term_counts.iteritems():
+            term_name = _truncate(term_name, self.term_name_length)
+            term_id, created = self.term_ids.get(term_name)
+            if created:
+                self._terms[term_id] = term_name
+            term_ids[term_id] = term_ids.get(term_id, 0) + counter
+
+        for term_id, counter in term_ids.iteritems():
+            _add_count(self._term_counts, term_id, counter)
+            self._occurrences.append((term_id, page_id, counter))
+
+        page_links = {}
+        for target_page_name, counter in link_counts.iteritems():
+            target_page_id = self._get_page_id(target_page_name)
+            page_links[target_page_id] = page_links.get(target_page_id, 0) + counter
+
+        self._links.extend([(page_id, target_page_id, counter) for (target_page_id, counter) in page_links.iteritems()])
+
+        if self.buffered_rows() >= self.max_rows:
+            self.flush()
+
+        return True
+
+    def _reconcile_pages(self):
+        """
+        Resolves the new pages which the database did not insert because their name is
+        equal to that of an existing page under its collation, such as names which only
+        differ in a sharp s and an s in MySQL. Buffered rows of such a page are moved to
+        the existing page as if its name had been resolved to it in memory, and dropped
+        if both pages were processed.
+        """
+        cur = self.cur
+
+        # IDs of the new pages are allocated in order so they form a contiguous range
+        first_id, last_id = min(self._new_pages), max(self._new_pages)
+
+        cur.execute('SELECT COUNT(*) FROM Pages WHERE PageID BETWEEN %s AND %s;', (first_id, last_id))
+        if cur.fetchall()[0][0] == len(self._new_pages):
+            return
+
+        cur.execute('SELECT PageID FROM Pages WHERE PageID BETWEEN %s AND %s;', (first_id, last_id))
+        inserted = set([page_id for (page_id, ) in cur.fetchall()])
+
+        mapping = {}
+        dropped = set()
+        for page_id, (page_name, length, processed) in sorted(self._new_pages.iteritems()):
+            if page_id in inserted:
+                continue
+
+            cur.execute('SELECT PageID FROM Pages WHERE PageName = %s;', (page_name, ))
+            existing_id = cur.fetchall()[0][0]
+
+            self.page_ids.add(page_name, existing_id)
+            mapping[page_id] = existing_id
+
+            if processed:
+                if self.is_processed(existing_id):
+                    dropped.add(page_id)  # No decent way to resolve this conflict (Issue #76)
+                else:
+                    self._set_processed(existing_id)
+                    self._updated_pages.append((existing_id, page_name, length))
+
+        self._new_pages = dict([(p, row) for (p, row) in self._new_pages.iteritems() if p in inserted])
+
+        occurrences = []
+        for term_id, page_id, counter in self._occurrences:
+            if page_id in dropped:
+                self._term_counts[term_id] -= counter
+            else:
+                occurrences.append((term_id, mapping.get(page_id, page_id), counter))
+        self._occurrences = occurrences
+
+        # Links to both names of a page are counted together
+        links = {}
+        for page_id, target_page_id, counter in self._links:
+            if page_id not in dropped:
+                key = (mapping.get(page_id, page_id), mapping.get(target_page_id, target_page_id))
+                links[key] = links.get(key, 0) + counter
+        self._links = [key + (counter, ) for (key, counter) in links.iteritems()]
+
+    def flush(self):
+        """
+        Writes all buffered rows to the database. The cost of a flush only depends on
+        the number of rows buffered since the previous one. Pages are only marked as
+        processed once all their rows are written, and rows which already exist are
+        skipped, so that the pages of a flush which was interrupted on an engine without
+        transactions are written again in full when they are added after continuing.
+        """
+        backend = self.backend
+        cur = self.cur
+
+        if self._new_pages:
+            # Names which collide under a collation that name_key does not fully model are
+            # skipped by the database and resolved to the existing pages afterwards
+            backend.bulk_insert(cur, 'Pages', ('PageID', 'PageName', 'Length', 'Processed'), [
+                (page_id, page_name, length, 0) for (page_id, (page_name, length, _)) in sorted(self._new_pages.iteritems())
+            ], ignore=True)
+            self._reconcile_pages()
+
+        processed = sorted(
+            [page_id for (page_id, (_, _, p)) in self._new_pages.iteritems() if p] + [row[0] for row in self._updated_pages]
+        )
+
+        # Pages which were added as link targets before being processed
+        for i in xrange(0, len(self._updated_pages), self.update_chunk_size):
+            chunk = self._updated_pages[i:i + self.update_chunk_size]
+
+            cases = ' '.join(['WHEN %s THEN %s'] * len(chunk))
+
+            parameters = []
+            for column in (1, 2):
+                for row in chunk:
+                    parameters.extend((row[0], row[column]))
+            parameters.extend([row[0] for row in chunk])
+
+            cur.execute("""
+                UPDATE Pages
+                SET PageName = CASE PageID %s END, Length = CASE PageID %s END
+                WHERE PageID IN (%s);
+            """ % (cases, cases, ', '.join(['%s'] * len(chunk))), parameters)
+
+        if self._terms:
+            backend.bulk_insert(cur, 'Terms', ('TermID', 'TermName'), sorted(self._terms.iteritems()))
+
+        if self._occurrences:
+            backend.bulk_insert(cur, 'TermOccurrences', ('TermID', 'PageID', 'Counter'), self._occurrences, ignore=True)
+
+        if self._links:
+            backend.bulk_insert(cur, 'PageLinks', ('PageID', 'TargetPageID', 'Counter'), self._links, ignore=True)
+
+        for i in xrange(0, len(processed), self.delete_chunk_size):
+            chunk = processed[i:i + self.delete_chunk_size]
+            cur.execute('UPDATE Pages SET Processed = 1 WHERE PageID IN (%s);' % ', '.join(['%s'] * len(chunk)), chunk)
+
+        self._new_pages = {}
+        self._updated_pages = []
+        self._terms = {}
+        self._occurrences = []
+        self._links = []
+
+    def prune(self):
+        """
+        Writes the buffered rows and deletes the terms which have occurred less than
+        min_term_count times along with their occurrences. Called once all pages have
+        been added, so each term is only deleted once. Returns the number of deleted terms.
+        """
+        self.flush()
+
+        rare_terms = self.rare_terms()
+        for i in xrange(0, len(rare_terms), self.delete_chunk_size):
+            chunk = rare_terms[i:i + self.delete_chunk_size]
+            parameters = ', '.join(['%s'] * len(chunk))
+
+            self.cur.execute('DELETE FROM TermOccurrences WHERE TermID IN (%s);' % parameters, chunk)
+            self.cur.execute('DELETE FROM Terms WHERE TermID IN (%s);' % parameters, chunk)
+
+        return len(rare_terms)
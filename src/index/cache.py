@@ -0,0 +1,94 @@
+import threading
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Bounded dictionary-like cache which evicts the least recently used
+    entries once maxsize entries are stored. Keeps count of the number
+    of cache hits and misses. All operations are thread-safe.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __repr__(self):
+        return '<LRUCache: {}/{} entries, {} hits, {} misses>'.format(
+            len(self._data), self.maxsize, self.hits, self.misses
+        )
+
+    def get(self, key, default=None):
+        """
+        Returns the value cached for the given key or default if it is
+        not cached. Updates the hit and miss counters accordingly.
+        """
+        with self._lock:
+            return self._get(key, default)
+
+    def _get(self, key, default):
+        if key in self._data:
+            self.hits += 1
+
+            # Reinsert to mark the entry as the most recently used
+            value = self._data.pop(key)
+            self._data[key] = value
+            return value
+        else:
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """
+        Stores a value in the cache, evicting the least recently used
+        entry if the cache is full.
+        """
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+            elif len(self._data) >= self.maxsize:
+                if not self.maxsize:
+                    return
+                self._data.popitem(last=False)
+
+            self._data[key] = value
+
+    def lookup(self, keys):
+        """
+        Looks up several keys at once. Returns a tuple of a dictionary
+        of the cached (key, value) pairs and a list of the missing keys.
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                value = self._get(key, _missing)
+                if value is _missing:
+                    missing.append(key)
+                else:
+                    found[key] = value
+
+        return found, missing
+
+    def clear(self):
+        """
+        Removes all entries and resets the hit and miss counters.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Sentinel used to distinguish cached None values from missing keys
+_missing = object()
@@ -1,18 +1,129 @@
 from __future__ import division
 
+import os
+import struct
 import datetime
 import numpy as np
 
 from math import log10
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from index.vocabulary import Vocabulary
+from index.weighting import WeightingEngine, weight_postings
 
 
 DOCUMENT_DOES_NOT_EXIST = 'The specified document does not exist'
 TERM_DOES_NOT_EXIST = 'The specified term does not exist'
 
+BINARY_MAGIC = 'HIDX'
+BINARY_VERSION = 2
+
+# Magic, version, meta data length and header length of the binary format
+_binary_prefix = struct.Struct('<4sIQQ')
+
+# Extension of the file storing the meta data of a JSON formatted index
+META_EXTENSION = '.meta'
+
+
+def _to_numpy(values):
+    """
+    Returns a numpy copy of an array('I') or numpy array using a single
+    memory copy.
+    """
+    if isinstance(values, np.ndarray):
+        return np.array(values, dtype=np.uintc)
+
+    if not values:
+        return np.zeros(0, dtype=np.uintc)
+
+    # Copy so that the result stays valid if the array is later resized
+    return np.frombuffer(values, dtype=np.uintc).copy()
+
+
+def _align(offset, alignment=8):
+    return offset + (-offset % alignment)
+
+
+def _read_binary_prefix(fp, path):
+    """
+    Reads and validates the fixed size prefix of a binary HashedIndex
+    file. Returns the length of the meta data and of the header.
+    """
+    data = fp.read(_binary_prefix.size)
+    if len(data) < _binary_prefix.size:
+        raise IOError('Not a binary HashedIndex file: %s' % path)
+
+    magic, version, meta_length, header_length = _binary_prefix.unpack(data)
+
+    if magic != BINARY_MAGIC:
+        raise IOError('Not a binary HashedIndex file: %s' % path)
+
+    if version != BINARY_VERSION:
+        raise IOError('Unsupported binary HashedIndex version: %d' % version)
+
+    return meta_length, header_length
+
+
+def _read_binary_header(path):
+    """
+    Reads the meta data and the JSON header of a binary HashedIndex file.
+    """
+    import json
+
+    with open(path, 'rb') as fp:
+        meta_length, header_length = _read_binary_prefix(fp, path)
+        meta = json.loads(fp.read(meta_length))
+        header = json.loads(fp.read(header_length))
+
+    return meta, header
+
+
+def _file_signature(path):
+    """
+    Returns the size and modification time of a file, which are stored in the
+    meta data file of a JSON formatted index to detect that the index changed.
+    """
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def is_binary_index(path):
+    """
+    Returns True if the file at the specified path is a binary HashedIndex.
+    """
+    with open(path, 'rb') as fp:
+        return fp.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def hash_parameters(parameters):
+    """
+    Returns a stable hash of a JSON serialisable dictionary of parameters.
+    This is stored alongside the meta data of saved indexes so that a cached
+    index can be checked for staleness without comparing the parameters.
+    """
+    import json
+    import hashlib
+
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True)).hexdigest()
+
+
+def _to_array(values):
+    """
+    Returns an array('I') copy of the specified numpy array.
+    """
+    return array('I', np.asarray(values, dtype=np.uintc).tostring())
+
 
 class HashedIndex(object):
     """
     InvertedIndex structure in the form of a hash list implementation.
+    Terms and documents are interned to dense integer IDs on first sight
+    and the postings of each term are stored as a pair of compact arrays
+    (document IDs sorted in ascending order, counts). Postings of an index
+    loaded with load_binary remain in the memory mapped file until they
+    are first modified.
     """
 
     def __init__(self, initial_terms=None):
@@ -20,15 +131,15 @@ class HashedIndex(object):
         Construct a new HashedIndex. An optional list of initial terms
         may be passed which will be automatically added to the new HashedIndex.
         """
-        self._documents = {}
-        self._terms = {}
         self._freeze = False
+        self.clear()
         if initial_terms is not None:
             for term in initial_terms:
-                self._terms[term] = {}
+                self._add_term(term)
 
     def __getitem__(self, term):
-        return self._terms[term]
+        doc_ids, counts = self._get_postings(self._terms.get_id(term))
+        return dict(zip([self._documents.get_name(d) for d in doc_ids.tolist()], counts.tolist()))
 
     def __contains__(self, term):
         return term in self._terms
@@ -39,14 +150,21 @@ class HashedIndex(object):
         )
 
     def __eq__(self, other):
-        return self._terms == other._terms and self._documents == other._documents
+        return self.items() == other.items() and self._document_items() == other._document_items()
+
+    def __ne__(self, other):
+        return not self == other
 
     def clear(self):
         """
         Resets the HashedIndex to a clean state without any terms or documents.
         """
-        self._terms = {}
-        self._documents = {}
+        self._terms = Vocabulary()
+        self._documents = Vocabulary()
+        self._document_lengths = array('I')
+        self._postings = []
+        self._mapped = None
+        self._invalidate()
 
     def freeze(self):
         """
@@ -62,24 +180,258 @@ class HashedIndex(object):
         """
         self._freeze = False
 
+    def _invalidate(self):
+        # Discards the postings ordered by document, which are rebuilt on demand
+        self._document_postings = None
+
+    def _add_term(self, term):
+        term_id = self._terms.add(term)
+        if term_id == len(self._postings):
+            self._postings.append((array('I'), array('I')))
+            self._invalidate()
+
+        return term_id
+
+    def _get_postings(self, term_id):
+        postings = self._postings[term_id]
+        if isinstance(postings, tuple):
+            return postings
+
+        # Postings still reside in the memory mapped file
+        indptr, doc_ids, counts = self._mapped
+        start, end = indptr[postings], indptr[postings + 1]
+        return doc_ids[start:end], counts[start:end]
+
+    def _get_mutable_postings(self, term_id):
+        self._invalidate()
+
+        postings = self._postings[term_id]
+        if not isinstance(postings, tuple):
+            doc_ids, counts = self._get_postings(term_id)
+            postings = (_to_array(doc_ids), _to_array(counts))
+            self._postings[term_id] = postings
+
+        return postings
+
+    def _add_document(self, document):
+        doc_id = self._documents.add(document)
+        if doc_id == len(self._document_lengths):
+            self._document_lengths.append(0)
+            self._invalidate()
+
+        return doc_id
+
+    def _document_items(self):
+        return dict(zip(self._documents, self._document_lengths))
+
+    def _add_posting(self, term_id, doc_id, count):
+        doc_ids, counts = self._get_mutable_postings(term_id)
+
+        # Documents are usually indexed one after the other so the
+        # posting (if it exists) will almost always be the last one
+        if not doc_ids or doc_ids[-1] < doc_id:
+            doc_ids.append(doc_id)
+            counts.append(count)
+        elif doc_ids[-1] == doc_id:
+            counts[-1] += count
+        else:
+            i = bisect_left(doc_ids, doc_id)
+            if doc_ids[i] == doc_id:
+                counts[i] += count
+            else:
+                doc_ids.insert(i, doc_id)
+                counts.insert(i, count)
+
     def add_term_occurrence(self, term, document):
         """
         Adds an occurrence of the term in the specified document.
         """
-        if document not in self._documents:
-            self._documents[document] = 0
+        doc_id = self._add_document(document)
 
         if term not in self._terms:
             if self._freeze:
                 return
             else:
-                self._terms[term] = {}
+                self._add_term(term)
+
+        self._add_posting(self._terms.get_id(term), doc_id, 1)
+        self._document_lengths[doc_id] += 1
+
+    def add_document(self, document, tokens):
+        """
+        Adds all the occurrences of the terms in the iterable of tokens
+        to the specified document in a single step. This is equivalent
+        to calling add_term_occurrence for each token but significantly
+        faster. New terms are ignored if the HashedIndex is frozen. As
+        with add_term_occurrence, a document without any tokens is not added.
+        """
+        term_counts = Counter(tokens)
+        if not term_counts:
+            return
+
+        doc_id = self._add_document(document)
+
+        length = 0
+        for term, count in term_counts.iteritems():
+            if term in self._terms:
+                term_id = self._terms.get_id(term)
+            elif self._freeze:
+                continue
+            else:
+                term_id = self._add_term(term)
+
+            self._add_posting(term_id, doc_id, count)
+            length += count
+
+        self._document_lengths[doc_id] += length
+
+    def add_documents(self, documents):
+        """
+        Adds an iterable of (document, tokens) pairs to the HashedIndex
+        using add_document.
+        """
+        for document, tokens in documents:
+            self.add_document(document, tokens)
+
+    def _merge_postings(self, term_id, doc_ids, counts):
+        if not len(doc_ids):
+            return
+
+        current_ids, current_counts = self._get_mutable_postings(term_id)
+
+        if not current_ids or current_ids[-1] < doc_ids[0]:
+            current_ids.extend(_to_array(doc_ids))
+            current_counts.extend(_to_array(counts))
+        else:
+            all_ids = np.concatenate((_to_numpy(current_ids), doc_ids))
+            all_counts = np.concatenate((_to_numpy(current_counts), counts))
+
+            # Sum the counts of documents found in both postings
+            unique_ids, inverse = np.unique(all_ids, return_inverse=True)
+            unique_counts = np.bincount(inverse, weights=all_counts)
+
+            self._postings[term_id] = (_to_array(unique_ids), _to_array(unique_counts))
+
+    def merge(self, other):
+        """
+        Merges the terms and documents of another HashedIndex into this
+        HashedIndex. The term frequencies and lengths of documents found
+        in both indexes are summed. New terms are ignored if this HashedIndex
+        is frozen. Merging partial indexes built over disjoint slices of a
+        data source in order produces the same HashedIndex as building it
+        serially.
+        """
+        doc_mapping = np.zeros(len(other._documents), dtype=np.int64)
+        for doc_id, document in enumerate(other._documents):
+            doc_mapping[doc_id] = self._add_document(document)
+            self._document_lengths[doc_mapping[doc_id]] += other._document_lengths[doc_id]
+
+        # Documents appended in order keep their postings sorted
+        ordered = (np.diff(doc_mapping) > 0).all()
+
+        for term_id, term in enumerate(other._terms):
+            doc_ids, counts = other._get_postings(term_id)
+            doc_ids = doc_mapping[_to_numpy(doc_ids)]
+            counts = _to_numpy(counts).astype(np.int64)
+
+            if term not in self._terms and self._freeze:
+                # Document lengths only account for terms which were added
+                for doc_id, count in zip(doc_ids, counts):
+                    self._document_lengths[doc_id] -= int(count)
+                continue
+
+            if not ordered:
+                order = np.argsort(doc_ids)
+                doc_ids, counts = doc_ids[order], counts[order]
 
-        if document not in self._terms[term]:
-            self._terms[term][document] = 0
+            self._merge_postings(self._add_term(term), doc_ids, counts)
 
-        self._documents[document] += 1
-        self._terms[term][document] += 1
+    def _remove_terms(self, term_ids):
+        if len(term_ids):
+            keep = np.ones(len(self._terms), dtype=bool)
+            keep[term_ids] = False
+
+            self._terms.compact(keep)
+            self._postings[:] = [postings for postings, k in zip(self._postings, keep) if k]
+            self._invalidate()
+
+    def remove_documents(self, documents):
+        """
+        Removes the specified documents from the HashedIndex along with all
+        their postings. Document IDs are compacted so that they remain dense
+        and terms which no longer appear in any document are removed.
+        """
+        removed = []
+        for document in documents:
+            if document not in self._documents:
+                raise IndexError(DOCUMENT_DOES_NOT_EXIST)
+            removed.append(self._documents.get_id(document))
+
+        if not removed:
+            return
+
+        keep = np.ones(len(self._documents), dtype=bool)
+        keep[removed] = False
+
+        first_removed = min(removed)
+        doc_mapping = self._documents.compact(keep)
+        self._invalidate()
+        self._document_lengths = _to_array(_to_numpy(self._document_lengths)[keep])
+
+        emptied = []
+        for term_id in xrange(len(self._postings)):
+            doc_ids, counts = self._get_postings(term_id)
+
+            # Postings are sorted so those before the first removed document are unaffected
+            if not len(doc_ids) or doc_ids[-1] < first_removed:
+                continue
+
+            doc_ids = doc_mapping[_to_numpy(doc_ids)]
+            selected = doc_ids >= 0
+
+            self._postings[term_id] = (_to_array(doc_ids[selected]), _to_array(_to_numpy(counts)[selected]))
+            if not selected.any():
+                emptied.append(term_id)
+
+        self._remove_terms(emptied)
+
+    def remove_document(self, document):
+        """
+        Removes the specified document from the HashedIndex. See remove_documents.
+        """
+        self.remove_documents([document])
+
+    def update_document(self, document, tokens):
+        """
+        Replaces the contents of the specified document with the iterable of
+        tokens. The document keeps its position in the HashedIndex and terms
+        which no longer appear in any document are removed. If the document
+        does not exist it is added.
+        """
+        if document not in self._documents:
+            self.add_document(document, tokens)
+            return
+
+        doc_id = self._documents.get_id(document)
+
+        emptied = []
+        for term_id in xrange(len(self._postings)):
+            doc_ids, counts = self._get_postings(term_id)
+
+            i = bisect_left(doc_ids, doc_id)
+            if i < len(doc_ids) and doc_ids[i] == doc_id:
+                doc_ids, counts = self._get_mutable_postings(term_id)
+                del doc_ids[i]
+                del counts[i]
+
+                if not doc_ids:
+                    emptied.append(term_id)
+
+        self._document_lengths[doc_id] = 0
+        self.add_document(document, tokens)
+
+        # Terms may have been re-added by the new contents of the document
+        self._remove_terms([term_id for term_id in emptied if not len(self._get_postings(term_id)[0])])
 
     def get_total_term_frequency(self, term):
         """
@@ -89,7 +441,8 @@ class HashedIndex(object):
         if term not in self._terms:
             raise IndexError(TERM_DOES_NOT_EXIST)
 
-        return sum(self._terms[term].values())
+        doc_ids, counts = self._get_postings(self._terms.get_id(term))
+        return int(sum(counts))
 
     def get_term_frequency(self, term, document):
         """
@@ -101,10 +454,14 @@ class HashedIndex(object):
         if term not in self._terms:
             raise IndexError(TERM_DOES_NOT_EXIST)
 
-        if document not in self._terms[term]:
+        doc_id = self._documents.get_id(document)
+        doc_ids, counts = self._get_postings(self._terms.get_id(term))
+
+        i = bisect_left(doc_ids, doc_id)
+        if i == len(doc_ids) or doc_ids[i] != doc_id:
             return 0
 
-        return self._terms[term][document]
+        return int(counts[i])
 
     def get_document_frequency(self, term):
         """
@@ -113,25 +470,56 @@ class HashedIndex(object):
         if term not in self._terms:
             raise IndexError(TERM_DOES_NOT_EXIST)
         else:
-            return len(self._terms[term])
+            doc_ids, counts = self._get_postings(self._terms.get_id(term))
+            return len(doc_ids)
 
     def get_document_length(self, document):
         """
         Returns the number of terms found within the specified document.
         """
         if document in self._documents:
-            return self._documents[document]
+            return self._document_lengths[self._documents.get_id(document)]
         else:
             raise IndexError(DOCUMENT_DOES_NOT_EXIST)
 
+    def get_term_id(self, term):
+        """
+        Returns the integer ID the specified term was interned to.
+        """
+        if term not in self._terms:
+            raise IndexError(TERM_DOES_NOT_EXIST)
+
+        return self._terms.get_id(term)
+
+    def get_document_id(self, document):
+        """
+        Returns the integer ID the specified document was interned to.
+        """
+        if document not in self._documents:
+            raise IndexError(DOCUMENT_DOES_NOT_EXIST)
+
+        return self._documents.get_id(document)
+
+    def term_vocabulary(self):
+        """
+        Returns the Vocabulary table mapping terms to their integer IDs.
+        """
+        return self._terms
+
+    def document_vocabulary(self):
+        """
+        Returns the Vocabulary table mapping documents to their integer IDs.
+        """
+        return self._documents
+
     def terms(self):
-        return self._terms.keys()
+        return self._terms.names()
 
     def documents(self):
-        return list(self._documents)
+        return self._documents.names()
 
     def items(self):
-        return self._terms
+        return dict([(term, self[term]) for term in self._terms])
 
     def get_tfidf(self, term, document):
         """
@@ -150,60 +538,158 @@ class HashedIndex(object):
         else:
             return 0.0
 
+    def get_document_frequencies(self):
+        """
+        Returns a numpy array with the document frequency of every term
+        indexed by term ID.
+        """
+        frequencies = np.zeros(len(self._postings), dtype=np.int64)
+        for term_id in xrange(len(self._postings)):
+            frequencies[term_id] = len(self._get_postings(term_id)[0])
+
+        return frequencies
+
+    def get_postings_arrays(self):
+        """
+        Returns the postings of the HashedIndex as three flat numpy arrays
+        (term index, document index, count) with one entry per non-zero
+        cell. Term and document indices follow the order returned by
+        terms() and documents() respectively.
+        """
+        frequencies = np.zeros(len(self._postings), dtype=np.int64)
+        all_doc_ids = [np.zeros(0, dtype=np.uintc)]
+        all_counts = [np.zeros(0, dtype=np.uintc)]
+
+        for term_id in xrange(len(self._postings)):
+            doc_ids, counts = self._get_postings(term_id)
+            frequencies[term_id] = len(doc_ids)
+            all_doc_ids.append(_to_numpy(doc_ids))
+            all_counts.append(_to_numpy(counts))
+
+        term_ids = np.repeat(np.arange(len(self._postings), dtype=np.int64), frequencies)
+        doc_ids = np.concatenate(all_doc_ids).astype(np.int64)
+        counts = np.concatenate(all_counts).astype(np.int64)
+
+        return term_ids, doc_ids, counts
+
+    def get_weighting_engine(self):
+        """
+        Returns a WeightingEngine over the current postings of the HashedIndex.
+        The engine can be kept around to generate feature matrices under several
+        weighting modes without re-reading the index.
+        """
+        term_ids, doc_ids, counts = self.get_postings_arrays()
+        document_lengths = _to_numpy(self._document_lengths)
+
+        return WeightingEngine(term_ids, doc_ids, counts, document_lengths, len(self._terms))
+
+    def _get_document_postings(self):
+        """
+        Returns the postings ordered by document as (indptr, term index, count)
+        arrays, where the postings of a document are the slice between its
+        entries in indptr, together with the document frequency of every term.
+        The result is cached until the HashedIndex is next modified.
+        """
+        if self._document_postings is None:
+            term_ids, doc_ids, counts = self.get_postings_arrays()
+
+            # A stable sort keeps the postings of each document ordered by term
+            order = np.argsort(doc_ids, kind='mergesort')
+
+            indptr = np.zeros(len(self._documents) + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum(np.bincount(doc_ids, minlength=len(self._documents)))
+
+            self._document_postings = (
+                indptr, term_ids[order], counts[order], np.bincount(term_ids, minlength=len(self._terms))
+            )
+
+        return self._document_postings
+
     def generate_document_vector(self, doc, mode='tfidf'):
         """
         Returns a representation of the specified document as a feature vector
         weighted according the mode specified (by default tf-dif). The result
         will be returned in the form of a numpy ndarray.
-        Available modes: tfidif, count, tf
+        Available modes: tfidf, count, tf, sublinear, bm25, tfidf_l2
         """
+        if doc not in self._documents:
+            raise IndexError(DOCUMENT_DOES_NOT_EXIST)
+
+        indptr, term_ids, counts, frequencies = self._get_document_postings()
+
+        doc_id = self._documents.get_id(doc)
+        start, end = indptr[doc_id], indptr[doc_id + 1]
+
         result = np.zeros(len(self._terms))
-        for i, term in enumerate(self._terms):
-            if mode == 'tfidf':
-                result[i] = self.get_tfidf(term, doc)
-            elif mode == 'count':
-                result[i] = self.get_term_frequency(term, doc)
-            elif mode == 'tf':
-                result[i] = self.get_term_frequency(term, doc) / self.get_document_length(doc)
-            else:
-                raise ValueError('Unexpected mode: %s', mode)
+        result[term_ids[start:end]] = weight_postings(
+            mode, term_ids[start:end], np.repeat(doc_id, end - start), counts[start:end],
+            frequencies, _to_numpy(self._document_lengths)
+        )
 
         return result
 
-    def generate_feature_matrix(self, mode='tfidf'):
+    def generate_feature_matrix(self, mode='tfidf', sparse=False):
         """
         Returns a feature numpy matrix representing the terms and
         documents in this Inverted Index using the tf-idf weighting
         scheme by default. The term counts in each document can
         alternatively be used by specifying scheme='count'
+        Available modes: tfidf, count, tf, sublinear, bm25, tfidf_l2
 
         The size of the matrix is equal to m x n where m is
         the number of documents and n is the number of terms.
-        """
-        result = np.zeros((len(self._documents), len(self._terms)))
+        Rows follow the order returned by documents() and columns
+        follow the order returned by terms().
 
-        for i, doc in enumerate(self._documents):
-            result[i, :] = self.generate_document_vector(doc, mode)
+        If sparse is True, a scipy.sparse.csr_matrix is returned
+        which is built directly from the non-zero postings.
+        """
+        return self.get_weighting_engine().generate_matrix(mode, sparse=sparse)
 
-        return result
+    def generate_sparse_feature_matrix(self, mode='tfidf'):
+        """
+        Returns a scipy.sparse.csr_matrix equivalent to the result of
+        generate_feature_matrix. Only non-zero cells are computed.
+        Rows follow the order returned by documents() and columns follow
+        the order returned by terms().
+        """
+        return self.generate_feature_matrix(mode, sparse=True)
 
-    def prune(self, min_frequency=2):
+    def prune(self, min_frequency=2, max_frequency=None, max_terms=None, stop_terms=None):
         """
         Prunes the HashedIndex so that terms under the specified min_frequency
         will be removed from the index. This method is useful for performing
         feature selection based on document frequency within the entire corpus.
+        The selection is performed in a single pass over the document frequencies
+        after which the term IDs and postings are compacted.
+        :param min_frequency minimum document frequency of a term
+        :param max_frequency maximum document frequency of a term, or the maximum
+               proportion of documents a term may appear in if specified as a float
+        :param max_terms maximum number of terms to keep, ranked by document frequency
+        :param stop_terms iterable of terms which should always be removed
         """
-        garbage = []
-        for term in self.terms():
-            freq = self.get_document_frequency(term)
+        frequencies = self.get_document_frequencies()
+        keep = frequencies >= min_frequency
 
-            if freq < min_frequency:
-                garbage.append(term)
+        if max_frequency is not None:
+            if isinstance(max_frequency, float):
+                max_frequency *= len(self._documents)
+            keep &= frequencies <= max_frequency
 
-        for term in garbage:
-            del(self._terms[term])
+        if stop_terms is not None:
+            stop_ids = [self._terms.get_id(term) for term in stop_terms if term in self._terms]
+            keep[stop_ids] = False
 
-    def to_dict(self, **kwargs):
+        if max_terms is not None and keep.sum() > max_terms:
+            # Stable sort so that ties are resolved in favour of earlier terms
+            ranking = np.argsort(-frequencies[keep], kind='mergesort')
+            selected = np.flatnonzero(keep)[ranking[:max_terms]]
+            keep[:] = False
+            keep[selected] = True
+
+        self._remove_terms(np.flatnonzero(~keep))
+
+    def _meta(self, **kwargs):
         meta_data = {
             'data-structure': str(self),
             'date': '{}'.format(datetime.datetime.now()),
@@ -215,36 +701,58 @@ class HashedIndex(object):
         for key, value in kwargs.items():
             meta_data[key] = value
 
+        if 'parameters' in kwargs:
+            meta_data['parameters-hash'] = hash_parameters(kwargs['parameters'])
+
+        return meta_data
+
+    def to_dict(self, **kwargs):
         return {
             # Store meta-data for analytical purposes
-            'meta': meta_data,
+            'meta': self._meta(**kwargs),
             # Actual HashedIndex data
-            'documents': self._documents,
-            'terms': self._terms,
+            'documents': self._document_items(),
+            'terms': self.items(),
         }
 
     def from_dict(self, data):
-        self._documents = data['documents']
-        self._terms = data['terms']
+        self.clear()
+
+        for document, length in data['documents'].items():
+            self._document_lengths[self._add_document(document)] = length
+
+        for term, postings in data['terms'].items():
+            doc_ids, counts = self._get_mutable_postings(self._add_term(term))
+            for doc_id, count in sorted([(self._add_document(d), c) for d, c in postings.items()]):
+                doc_ids.append(doc_id)
+                counts.append(count)
 
     def save(self, path, compressed=False, **kwargs):
         """
         Saves the state of the HashedIndex as a JSON formatted
         file to the specified path. The optional use of bz2
         compression is also available. Additional meta data can
-        be stored through the use of kwargs.
+        be stored through the use of kwargs. The meta data is also
+        written uncompressed to a separate file (path + META_EXTENSION)
+        so that it can be read by load_meta in a single small read,
+        along with the size and modification time of the saved file.
         """
         import json
 
+        data = self.to_dict(**kwargs)
+
         if compressed:
             import bz2
             fp = bz2.BZ2File(path, 'w')
         else:
             fp = open(path, 'w')
 
-        json.dump(self.to_dict(**kwargs), fp, indent=5)
+        json.dump(data, fp, indent=5)
         fp.close()
 
+        with open(path + META_EXTENSION, 'w') as fp:
+            json.dump({'meta': data['meta'], 'signature': _file_signature(path)}, fp)
+
     def load(self, path, compressed=False):
         """
         Loads a HashedIndex state from a JSON formatted file that
@@ -262,22 +770,121 @@ class HashedIndex(object):
         data = json.load(fp)
         fp.close()
 
-        self._documents = data['documents']
-        self._terms = data['terms']
+        self.from_dict(data)
 
         return data['meta']
 
+    def save_binary(self, path, **kwargs):
+        """
+        Saves the state of the HashedIndex in a versioned binary format
+        to the specified path. The file starts with a fixed size prefix
+        followed by the JSON meta data (so that it can be read on its own)
+        and a JSON header with the term and document tables. The document
+        lengths and the postings follow as contiguous integer arrays (in CSR
+        layout by term). Additional meta data can be stored through the use
+        of kwargs.
+        """
+        import json
+
+        term_ids, doc_ids, counts = self.get_postings_arrays()
+
+        indptr = np.zeros(len(self._terms) + 1, dtype=np.uint64)
+        indptr[1:] = np.cumsum(np.bincount(term_ids, minlength=len(self._terms)))
+
+        arrays = (
+            ('document_lengths', _to_numpy(self._document_lengths)),
+            ('indptr', indptr),
+            ('doc_ids', doc_ids.astype(np.uint32)),
+            ('counts', counts.astype(np.uint32)),
+        )
+
+        meta_text = json.dumps(self._meta(**kwargs))
+        header = {
+            'terms': self._terms.names(),
+            'documents': self._documents.names(),
+            'arrays': {},
+        }
+
+        # Arrays are written after the header aligned to 8 bytes. The header
+        # length depends on the offsets so they are determined iteratively.
+        offset = 0
+        while True:
+            header_text = json.dumps(header)
+            start = _align(_binary_prefix.size + len(meta_text) + len(header_text))
+            if start == offset:
+                break
+
+            offset = start
+            for name, values in arrays:
+                header['arrays'][name] = [start, values.dtype.str, len(values)]
+                start = _align(start + values.nbytes)
+
+        # Write to a temporary file first as the existing file may be memory mapped
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as fp:
+            fp.write(_binary_prefix.pack(BINARY_MAGIC, BINARY_VERSION, len(meta_text), len(header_text)))
+            fp.write(meta_text)
+            fp.write(header_text)
+
+            for name, values in arrays:
+                fp.seek(header['arrays'][name][0])
+                fp.write(values.tostring())
+
+        os.rename(temp_path, path)
+
+    def load_binary(self, path, mmap=True):
+        """
+        Loads a HashedIndex state from a binary file that was previously
+        saved using save_binary. By default the postings are memory mapped
+        so that only the postings which are accessed are read from disk.
+        Returns the meta data stored in the file.
+        """
+        meta, header = _read_binary_header(path)
+
+        arrays = {}
+        for name, (offset, dtype, length) in header['arrays'].items():
+            if not length:
+                arrays[name] = np.zeros(0, dtype=dtype)
+            elif mmap:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(length, ))
+            else:
+                with open(path, 'rb') as fp:
+                    fp.seek(offset)
+                    arrays[name] = np.fromfile(fp, dtype=dtype, count=length)
+
+        self.clear()
+        self._terms = Vocabulary(header['terms'])
+        self._documents = Vocabulary(header['documents'])
+        self._document_lengths = _to_array(arrays['document_lengths'])
+        self._mapped = (arrays['indptr'].astype(np.int64), arrays['doc_ids'], arrays['counts'])
+        self._postings = range(len(self._terms))
+        self._invalidate()
+
+        return meta
+
 
-# Work in progress, there is a related issue in the github bug tracker
 def load_meta(path, compressed=False):
     """
-    Loads the meta header from a JSON formatted HashedIndex state
-    file that was previously saved. If the file was compressed using
-    bz2, the compressed flag must be set to True. Returns the meta
-    data by itself.
+    Loads the meta header from a HashedIndex state file that was
+    previously saved. If the file was compressed using bz2, the
+    compressed flag must be set to True. Returns the meta data by
+    itself. Binary files and JSON files with a meta data file are
+    read in constant time, other JSON files are scanned until the
+    meta data is found. Meta data files which no longer match the
+    size and modification time of the JSON file are ignored.
     """
     import json
 
+    if not compressed and is_binary_index(path):
+        return load_binary_meta(path)
+
+    if os.path.exists(path + META_EXTENSION):
+        with open(path + META_EXTENSION, 'r') as fp:
+            meta_file = json.load(fp)
+
+        if meta_file.get('signature') == _file_signature(path):
+            return meta_file['meta']
+
     if compressed:
         import bz2
         fp = bz2.BZ2File(path, mode='r')
@@ -310,3 +917,86 @@ def load_meta(path, compressed=False):
 
     # Should be valid JSON
     return json.loads(meta_text)
+
+
+def load_binary_meta(path):
+    """
+    Loads the meta data from a binary HashedIndex state file that was
+    previously saved using save_binary. Only the fixed size prefix and
+    the meta data are read regardless of the size of the index.
+    """
+    import json
+
+    with open(path, 'rb') as fp:
+        meta_length, header_length = _read_binary_prefix(fp, path)
+        return json.loads(fp.read(meta_length))
+
+
+def convert_json_index(json_path, binary_path, compressed=False):
+    """
+    Converts a JSON formatted HashedIndex state file to the binary format
+    used by save_binary, preserving its meta data. If the JSON file was
+    compressed using bz2, the compressed flag must be set to True.
+    """
+    index = HashedIndex()
+    meta = index.load(json_path, compressed=compressed)
+
+    # Meta data describing the index itself is regenerated on save
+    for key in ('data-structure', 'date', 'terms', 'documents', 'parameters-hash'):
+        meta.pop(key, None)
+
+    index.save_binary(binary_path, **meta)
+
+
+def _index_shard(args):
+    documents, tokenize = args
+
+    index = HashedIndex()
+    for document, source in documents:
+        tokens = tokenize(source)
+        if tokens is not None:
+            index.add_document(document, tokens)
+
+    return index
+
+
+def build_index(documents, tokenize, processes=None, shards=None):
+    """
+    Builds a HashedIndex from a list of (document, source) pairs using
+    several worker processes. Each worker builds a partial HashedIndex over
+    a contiguous slice of the documents by calling tokenize(source), which
+    must return an iterable of tokens (or None to skip the document). The
+    partial indexes are then merged in order so the result is identical to
+    a serially built index. tokenize must be a module level function so
+    that it can be passed to the worker processes.
+    :param processes number of worker processes (defaults to the number of CPUs)
+    :param shards number of partial indexes to build (defaults to processes)
+    """
+    import multiprocessing
+
+    documents = list(documents)
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if shards is None:
+        shards = processes
+
+    size = max(1, -(-len(documents) // shards))
+    tasks = [(documents[i:i + size], tokenize) for i in xrange(0, len(documents), size)]
+
+    if processes > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            partial_indexes = pool.map(_index_shard, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        partial_indexes = map(_index_shard, tasks)
+
+    index = HashedIndex()
+    for partial_index in partial_indexes:
+        index.merge(partial_index)
+
+    return index
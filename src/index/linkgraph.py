@@ -0,0 +1,226 @@
+"""
+Sparse link graphs used for the second order ranking of word concepts. Link
+matrices are scipy.sparse.csr_matrix instances where rows are the target pages
+and columns the source pages, so matrix[i, j] holds the links from page j to
+page i. They are built from the links of a set of pages, which are either
+queried from the database or read from a PageLinkGraph held in memory.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from array import array
+from itertools import chain
+from scipy.sparse import csr_matrix
+
+
+def _index_of(keys, values):
+    """
+    Returns the position of each value in keys, or -1 if it is not present.
+    """
+    keys = np.asarray(keys)
+    if not len(keys):
+        return np.repeat(-1, len(values))
+
+    order = np.argsort(keys, kind='mergesort')
+    positions = np.searchsorted(keys, values, sorter=order)
+    positions[positions == len(keys)] = 0
+
+    indices = order[positions]
+    indices[keys[indices] != values] = -1
+
+    return indices
+
+
+def _ranges(indptr, rows):
+    """
+    Returns the indices of all the entries in the specified CSR rows along
+    with the row each entry belongs to.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+
+    # Offset of each entry from the start of its row
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    return np.repeat(starts, lengths) + offsets, np.repeat(rows, lengths)
+
+
+def _membership(pages, page_id_lists):
+    """
+    Returns a boolean pages x lists matrix which is True for each page in each list.
+    There are only as many lists as terms used for retrieval so it is kept dense.
+    """
+    membership = np.zeros((len(pages), len(page_id_lists)), dtype=bool)
+
+    values = np.fromiter(chain(*page_id_lists), dtype=np.int64)
+    list_index = np.repeat(np.arange(len(page_id_lists)), [len(page_ids) for page_ids in page_id_lists])
+
+    positions = _index_of(pages, values)
+    found = positions >= 0
+    membership[positions[found], list_index[found]] = True
+
+    return membership
+
+
+def build_link_matrix(pages, sources, targets, counts, page_id_lists=None, mode='count'):
+    """
+    Returns the sparse link matrix of the specified pages built from arrays of
+    (PageID, TargetPageID, Counter) links. Links to or from pages which are not
+    in the pages list are ignored.
+    If page_id_lists are given, links between pages retrieved in the same list are
+    ignored and each link is counted once for every list containing its source
+    page but not its target page.
+    :param mode count, log (log(count) + 1) or single (1 for any link)
+    """
+    if mode not in ('count', 'log', 'single'):
+        raise ValueError('Unrecognized mode: %s' % mode)
+
+    pages = np.asarray(pages, dtype=np.int64)
+    size = len(pages)
+
+    cols = _index_of(pages, np.asarray(sources, dtype=np.int64))
+    rows = _index_of(pages, np.asarray(targets, dtype=np.int64))
+    values = np.asarray(counts, dtype=float)
+
+    found = (rows >= 0) & (cols >= 0)
+    rows, cols, values = rows[found], cols[found], values[found]
+
+    if page_id_lists is not None:
+        membership = _membership(pages, page_id_lists)
+
+        # Number of lists containing the source but not the target page
+        lists = (membership[cols] & ~membership[rows]).sum(axis=1)
+
+        keep = lists > 0
+        rows, cols, values = rows[keep], cols[keep], values[keep] * lists[keep]
+
+    if mode == 'log':
+        nonzero = values > 0
+        values[nonzero] = np.log(values[nonzero]) + 1
+    elif mode == 'single':
+        values = np.ones(len(values))
+
+    matrix = csr_matrix((values, (rows, cols)), shape=(size, size))
+    if mode == 'single':
+        matrix.data[:] = 1
+
+    return matrix
+
+
+class PageLinkGraph(object):
+    """
+    All page links held in memory as page major CSR postings so that the link
+    matrix of any set of pages can be built without querying the database.
+    Page IDs index the row pointers directly so memory use grows with the
+    largest PageID as well as the number of links.
+    """
+
+    def __init__(self, indptr, targets, counts):
+        self.indptr = indptr
+        self.targets = targets
+        self.counts = counts
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __repr__(self):
+        return '<PageLinkGraph: %d pages, %d links>' % (len(self.indptr) - 1, len(self))
+
+    @classmethod
+    def from_links(cls, page_links):
+        """
+        Builds a graph from an iterable of (PageID, TargetPageID, Counter) rows.
+        """
+        columns = (array('l'), array('l'), array('l'))
+        for row in page_links:
+            for column, value in zip(columns, row):
+                column.append(value)
+
+        sources, targets, counts = [
+            np.frombuffer(c, dtype=np.int_).astype(np.int64) if len(c) else np.zeros(0, dtype=np.int64)
+            for c in columns
+        ]
+
+        order = np.lexsort((targets, sources))
+        size = sources.max() + 1 if len(sources) else 0
+
+        indptr = np.zeros(size + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(sources, minlength=size))
+
+        return cls(indptr, targets[order], counts[order])
+
+    def get_links(self, page_ids):
+        """
+        Returns arrays of the PageID, TargetPageID and Counter of all links
+        from the specified pages. Unknown pages have no links.
+        """
+        page_ids = np.unique(np.asarray(list(page_ids), dtype=np.int64))
+        page_ids = page_ids[(page_ids >= 0) & (page_ids < len(self.indptr) - 1)]
+
+        indices, sources = _ranges(self.indptr, page_ids)
+        return sources, self.targets[indices], self.counts[indices]
+
+
+def personalised_pagerank(link_matrix, weights, alpha=0.5, steps=10):
+    """
+    Returns the personalised PageRank of each page after the specified number of
+    power iterations. At each step the rank of a page is passed along its links with
+    probability alpha and otherwise returned to the pages in proportion to their
+    weights, as is the rank of pages without outgoing links. The result is scaled to
+    the sum of the weights so that it is comparable with the first order weights.
+    """
+    total = weights.sum()
+    if total <= 0:
+        return weights.copy()
+
+    personalisation = weights / total
+
+    outgoing = np.asarray(link_matrix.sum(axis=0)).ravel()
+    dangling = outgoing == 0
+    scale = np.zeros(len(outgoing))
+    scale[~dangling] = 1 / outgoing[~dangling]
+
+    rank = personalisation
+    for _ in xrange(steps):
+        rank = alpha * (link_matrix.dot(rank * scale) + rank[dangling].sum() * personalisation)
+        rank += (1 - alpha) * personalisation
+
+    return rank * total
+
+
+def second_order_ranking(weights, link_matrix, alpha=0.5, second_order='augmented', steps=10):
+    """
+    Returns the second order weights of the pages along with the number of
+    incoming and outgoing links of each page in the link matrix.
+    :param second_order augmented, original or pagerank
+    :param steps number of power iterations used by pagerank
+    """
+    weights = np.array(weights, dtype=float)
+    incoming = np.asarray(link_matrix.sum(axis=1)).ravel()
+    outgoing = np.asarray(link_matrix.sum(axis=0)).ravel()
+
+    if second_order == 'augmented':
+
+        # Consider changing as incoming == 0 are already removed below
+        weights[(incoming + outgoing < 2)] = 0
+
+        norm_weights = weights * incoming
+
+        nonzero = outgoing > 0
+        norm_weights[nonzero] /= outgoing[nonzero]
+
+        A = alpha * link_matrix.dot(norm_weights)
+        A *= weights ** 2
+        A += (1 - alpha) * weights
+    elif second_order == 'original':
+        A = alpha * link_matrix.dot(weights)
+        A += weights
+    elif second_order == 'pagerank':
+        A = personalised_pagerank(link_matrix, weights, alpha, steps)
+    else:
+        raise ValueError('Unrecognized second order ranking: %s' % second_order)
+
+    return A, incoming, outgoing
@@ -0,0 +1,123 @@
+import threading
+
+from contextlib import contextmanager
+
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of up to size database connections created by a backend.
+    Connections are created lazily and handed out to one thread at a time, so
+    several threads can run queries concurrently without sharing a cursor.
+    Connections which were lost are discarded and replaced with new ones.
+    """
+
+    def __init__(self, backend, size=4):
+        self.backend = backend
+        self.size = size
+
+        # Most recently used connections are handed out first
+        self._idle = []
+        self._created = 0
+
+        # Notified whenever a connection is released or discarded
+        self._available = threading.Condition()
+
+    def __repr__(self):
+        return '<ConnectionPool %s: %d/%d connections>' % (self.backend, self._created, self.size)
+
+    def _acquire(self):
+        with self._available:
+            while not self._idle and self._created >= self.size:
+                # Wait for another thread to release or discard a connection
+                self._available.wait()
+
+            if self._idle:
+                return self._idle.pop()
+
+            self._created += 1
+
+        try:
+            return self.backend.connect()
+        except:
+            with self._available:
+                self._created -= 1
+                self._available.notify()
+            raise
+
+    def _release(self, connection):
+        with self._available:
+            self._idle.append(connection)
+            self._available.notify()
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+        # A waiting thread may now create a replacement connection
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks out a connection for the duration of the with block. The
+        connection is discarded if the backend reports that it was lost.
+        """
+        connection = self._acquire()
+        lost = False
+        try:
+            yield connection
+        except Exception as e:
+            lost = self.backend.is_disconnect(e)
+            raise
+        finally:
+            # Also runs when an iterate() generator is closed before it is exhausted
+            if lost:
+                self._discard(connection)
+            else:
+                self._release(connection)
+
+    def execute(self, sql, parameters=None):
+        """
+        Executes a statement on a pooled connection and returns all resulting rows.
+        The statement is retried once on a new connection if the connection was lost.
+        """
+        for attempt in (1, 2):
+            try:
+                with self.connection() as connection:
+                    cur = self.backend.cursor(connection)
+                    try:
+                        cur.execute(sql, parameters)
+                        return cur.fetchall()
+                    finally:
+                        cur.close()
+            except Exception as e:
+                if attempt == 2 or not self.backend.is_disconnect(e):
+                    raise
+
+    def iterate(self, sql, parameters=None):
+        """
+        Executes a statement on a pooled connection and yields the resulting rows
+        as they are fetched. The connection is held until the rows are exhausted.
+        """
+        with self.connection() as connection:
+            cur = self.backend.cursor(connection, streaming=True)
+            try:
+                cur.execute(sql, parameters)
+                for row in cur:
+                    yield row
+            finally:
+                cur.close()
+
+    def close(self):
+        """
+        Closes all idle connections.
+        """
+        with self._available:
+            idle, self._idle = self._idle, []
+
+        for connection in idle:
+            self._discard(connection)
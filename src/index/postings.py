@@ -0,0 +1,23 @@
+"""
+Packed posting lists stored in the TopPostings table. The row of each term holds
+its top pages in descending order by Tfidf as a blob of little endian (PageID, Tfidf)
+pairs, so that the candidate pages of a term are read with a single key lookup.
+"""
+
+import numpy as np
+
+POSTING_DTYPE = np.dtype([('page_id', '<i4'), ('tfidf', '<f4')])
+
+
+def pack_postings(postings):
+    """
+    Packs a list of (PageID, Tfidf) into a blob.
+    """
+    return np.asarray(postings, dtype=[('page_id', np.int64), ('tfidf', np.float64)]).astype(POSTING_DTYPE).tostring()
+
+
+def unpack_postings(blob):
+    """
+    Returns a read only structured array with page_id and tfidf fields from a packed blob.
+    """
+    return np.frombuffer(blob, dtype=POSTING_DTYPE)
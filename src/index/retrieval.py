@@ -0,0 +1,92 @@
+"""
+Ranked retrieval over a HashedIndex. Documents are scored term-at-a-time by
+accumulating the weights of the postings of each query term, so only the
+documents which contain at least one query term are ever touched.
+"""
+
+from __future__ import division
+
+import heapq
+import numpy as np
+
+from collections import Counter
+
+from index.vocabulary import Vocabulary
+
+MODES = ('tfidf', 'bm25')
+
+
+class RankedRetrieval(object):
+    """
+    Answers top-k queries over a snapshot of a HashedIndex. The posting weights,
+    inverse document frequencies and document norms are computed once when the
+    RankedRetrieval is created. Changes made to the HashedIndex afterwards are
+    not reflected in the results.
+    """
+
+    def __init__(self, index, mode='tfidf', **kwargs):
+        """
+        :param index HashedIndex to search
+        :param mode tfidf (cosine similarity) or bm25
+        :param kwargs additional parameters for the weighting scheme (k1, b for bm25)
+        """
+        if mode not in MODES:
+            raise ValueError('Unexpected mode: %s' % mode)
+
+        engine = index.get_weighting_engine()
+
+        self.mode = mode
+        # Copied so that pruning or adding to the index does not change the term IDs of the snapshot
+        self._terms = Vocabulary(index.terms())
+        self._documents = index.documents()
+        self._doc_ids = engine.doc_ids
+        self._weights = engine.weights(mode, **kwargs)
+
+        # Postings are ordered by term so each term is a contiguous slice
+        self._indptr = np.zeros(engine.shape[1] + 1, dtype=np.int64)
+        self._indptr[1:] = np.cumsum(engine.document_frequencies)
+
+        n = engine.shape[0]
+        self._idf = np.log10((1 + n) / (1 + engine.document_frequencies))
+        self._norms = np.sqrt(np.bincount(self._doc_ids, weights=self._weights ** 2, minlength=n))
+
+    def __repr__(self):
+        return '<RankedRetrieval: %s, %d documents>' % (self.mode, len(self._documents))
+
+    def search(self, query, k=10):
+        """
+        Returns the top k documents for the given query as a list of
+        (document, score) tuples sorted in descending order by score. The
+        query may either be a text which is tokenized using word_tokenize
+        or an iterable of terms. Terms which are not in the index are ignored.
+        """
+        if isinstance(query, basestring):
+            from textparser import word_tokenize
+            query = word_tokenize(query)
+
+        query_terms = [
+            (self._terms.get_id(term), count)
+            for term, count in Counter(query).items() if term in self._terms
+        ]
+
+        accumulator = np.zeros(len(self._documents))
+        query_norm = 0.0
+
+        for term_id, count in query_terms:
+            start, end = self._indptr[term_id], self._indptr[term_id + 1]
+
+            if self.mode == 'tfidf':
+                weight = count * self._idf[term_id]
+                query_norm += weight ** 2
+            else:
+                weight = count
+
+            accumulator[self._doc_ids[start:end]] += weight * self._weights[start:end]
+
+        candidates = np.flatnonzero(accumulator)
+
+        if self.mode == 'tfidf':
+            accumulator[candidates] /= self._norms[candidates] * np.sqrt(query_norm)
+
+        top = heapq.nlargest(k, candidates, key=accumulator.__getitem__)
+        return [(self._documents[doc_id], accumulator[doc_id]) for doc_id in top]
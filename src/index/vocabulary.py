@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class Vocabulary(object):
+    """
+    Interning table which maps names (terms, documents) to dense integer IDs
+    in the order they were first seen and provides the reverse lookup.
+    """
+
+    def __init__(self, names=None):
+        self._ids = {}
+        self._names = []
+        if names is not None:
+            for name in names:
+                self.add(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def __eq__(self, other):
+        return self._names == other._names
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<Vocabulary: {} names>'.format(len(self._names))
+
+    def add(self, name):
+        """
+        Returns the ID of the specified name, allocating the next available
+        ID if the name has not been seen before.
+        """
+        name_id = self._ids.get(name)
+        if name_id is None:
+            name_id = len(self._names)
+            self._ids[name] = name_id
+            self._names.append(name)
+
+        return name_id
+
+    def get_id(self, name):
+        """
+        Returns the ID of the specified name. Raises a KeyError if the
+        name does not exist in the Vocabulary.
+        """
+        return self._ids[name]
+
+    def get_name(self, name_id):
+        """
+        Returns the name associated with the specified ID.
+        """
+        return self._names[name_id]
+
+    def names(self):
+        """
+        Returns a list of all names ordered by their ID.
+        """
+        return list(self._names)
+
+    def compact(self, keep):
+        """
+        Removes all names whose entry in the boolean array keep is False and
+        reassigns IDs so that they remain dense. Returns a numpy array which
+        maps each old ID to its new ID, or -1 if the name was removed.
+        """
+        keep = np.asarray(keep, dtype=bool)
+        mapping = np.cumsum(keep) - 1
+        mapping[~keep] = -1
+
+        self._names = [name for name, k in zip(self._names, keep) if k]
+        self._ids = dict([(b, a) for a, b in enumerate(self._names)])
+
+        return mapping
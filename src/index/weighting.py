@@ -0,0 +1,104 @@
+"""
+Vectorised term weighting schemes which operate over flat postings arrays. Each
+posting is described by a (term index, document index, count) triple and every
+weighting scheme is applied as a single numpy operation over all postings at once
+rather than once per cell of a feature matrix.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+MODES = ('tfidf', 'count', 'tf', 'sublinear', 'bm25', 'tfidf_l2')
+
+
+def weight_postings(mode, term_ids, doc_ids, counts, document_frequencies, document_lengths, k1=1.2, b=0.75):
+    """
+    Returns a numpy array with the weight of each posting according to the
+    specified mode. term_ids, doc_ids and counts must be aligned arrays with
+    one entry per posting while document_frequencies and document_lengths
+    are indexed by term index and document index respectively.
+    Available modes: tfidf, count, tf, sublinear, bm25, tfidf_l2
+    :param k1 term frequency saturation parameter used by bm25
+    :param b document length normalisation parameter used by bm25
+    """
+    if mode not in MODES:
+        raise ValueError('Unexpected mode: %s' % mode)
+
+    counts = np.asarray(counts, dtype=float)
+
+    if mode == 'count':
+        return counts
+
+    lengths = np.asarray(document_lengths, dtype=float)[doc_ids]
+
+    if mode == 'tf':
+        return counts / lengths
+
+    n = len(document_lengths)
+    df = np.asarray(document_frequencies, dtype=float)[term_ids]
+
+    if mode == 'bm25':
+        average_length = np.mean(document_lengths) if n else 0.0
+        idf = np.log10(1 + (n - df + 0.5) / (df + 0.5))
+        return idf * counts * (k1 + 1) / (counts + k1 * (1 - b + b * lengths / average_length))
+
+    # Add 1 to document frequency to prevent divide by 0
+    idf = np.log10((1 + n) / (1 + df))
+
+    if mode == 'sublinear':
+        return (1 + np.log10(counts)) * idf
+
+    weights = counts * idf
+
+    if mode == 'tfidf_l2':
+        norms = np.sqrt(np.bincount(doc_ids, weights=weights ** 2, minlength=n))
+        nonzero = norms[doc_ids] > 0
+        weights[nonzero] /= norms[doc_ids][nonzero]
+
+    return weights
+
+
+class WeightingEngine(object):
+    """
+    Holds the flat postings arrays of an index together with its document
+    frequency and document length vectors so that any number of weighting
+    schemes can be applied without rebuilding them.
+    """
+
+    def __init__(self, term_ids, doc_ids, counts, document_lengths, n_terms):
+        self.term_ids = np.asarray(term_ids, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        self.counts = np.asarray(counts)
+        self.document_lengths = np.asarray(document_lengths)
+        self.document_frequencies = np.bincount(self.term_ids, minlength=n_terms)
+        self.shape = (len(self.document_lengths), n_terms)
+
+    def __repr__(self):
+        return '<WeightingEngine: %d documents, %d terms, %d postings>' % (self.shape + (len(self.counts), ))
+
+    def weights(self, mode='tfidf', **kwargs):
+        """
+        Returns the weight of each posting according to the specified mode.
+        """
+        return weight_postings(
+            mode, self.term_ids, self.doc_ids, self.counts,
+            self.document_frequencies, self.document_lengths, **kwargs
+        )
+
+    def generate_matrix(self, mode='tfidf', sparse=False, **kwargs):
+        """
+        Returns an m x n matrix where m is the number of documents and n
+        is the number of terms, weighted according to the specified mode.
+        A scipy.sparse.csr_matrix is returned if sparse is True, otherwise
+        a dense numpy ndarray is returned.
+        """
+        values = self.weights(mode, **kwargs)
+
+        if sparse:
+            from scipy.sparse import csr_matrix
+            return csr_matrix((values, (self.doc_ids, self.term_ids)), shape=self.shape)
+        else:
+            result = np.zeros(self.shape)
+            result[self.doc_ids, self.term_ids] = values
+            return result
@@ -1,19 +1,102 @@
 from __future__ import division
 
 import math
-import MySQLdb
+import time
+import threading
 import numpy as np
 
 from numpy.linalg import norm
+from contextlib import contextmanager
 from collections import Counter
 
-from utils import to_csv, load_stopwords
+from utils import load_stopwords
+from index.pool import ConnectionPool
+from index.cache import LRUCache
+from index.backends import get_backend
+from index.postings import unpack_postings
+from index.linkgraph import PageLinkGraph, build_link_matrix, second_order_ranking, _index_of, _ranges
 from textparser import word_tokenize, tfidf
 
 # Will search in CWD, PYTHONPATH and PATH
 stopwords = load_stopwords('data/stopwords.txt')
 
 
+def _placeholders(n):
+    return ','.join(['%s'] * n)
+
+
+def _pad(values):
+    """
+    Pads a list of values to the next power of two in length by repeating the last
+    value, which does not change the result of an IN clause. Limits the number of
+    distinct statements executed for lists of varying length.
+    """
+    if values:
+        size = 1 << (len(values) - 1).bit_length()
+        values = values + values[-1:] * (size - len(values))
+
+    return values
+
+
+def tfidf_matrix(page_ids, term_ids, term_occurrences, document_frequencies, corpus_size):
+    """
+    Returns a pages x terms matrix of tfidf weights built from a list of (PageID, TermID, Counter)
+    rows. Rows and columns are ordered as page_ids and term_ids. Occurrences of pages or terms
+    not in these lists are ignored. The weights are the same as those computed by textparser.tfidf.
+    :param document_frequencies document frequency of each term in term_ids
+    """
+    matrix = np.zeros((len(page_ids), len(term_ids)))
+    if not len(term_occurrences) or not len(page_ids) or not len(term_ids):
+        return matrix
+
+    occurrences = np.asarray(term_occurrences, dtype=float)
+    rows = _index_of(page_ids, occurrences[:, 0])
+    cols = _index_of(term_ids, occurrences[:, 1])
+    tf = occurrences[:, 2]
+
+    found = (rows >= 0) & (cols >= 0) & (tf > 0)
+    rows, cols, tf = rows[found], cols[found], tf[found]
+
+    # Floor division matches textparser.tfidf which is used for the query vector
+    idf = np.log(corpus_size // np.asarray(document_frequencies))
+    matrix[rows, cols] = (1 + np.log(tf)) * idf[cols]
+
+    return matrix
+
+
+def cosine_similarity(matrix, vector):
+    """
+    Returns the cosine similarity of each row in the matrix with the vector.
+    Rows with no weights have a similarity of 0.
+    """
+    denominator = np.sqrt((matrix ** 2).sum(axis=1)) * norm(vector)
+
+    similarity = np.zeros(matrix.shape[0])
+    nonzero = denominator > 0
+    similarity[nonzero] = matrix[nonzero].dot(vector) / denominator[nonzero]
+
+    return similarity
+
+
+class _RowGroups(object):
+    """
+    Rows of three integer columns, such as term occurrences or page links, grouped
+    by their first column so that the rows of any set of keys are selected without a scan.
+    """
+
+    def __init__(self, rows):
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1, 3)
+
+        self.rows = rows[np.argsort(rows[:, 0], kind='mergesort')]
+        self.keys, starts = np.unique(self.rows[:, 0], return_index=True)
+        self.indptr = np.append(starts, len(self.rows))
+
+    def select(self, keys):
+        positions = _index_of(self.keys, np.asarray(keys, dtype=np.int64))
+        indices, _ = _ranges(self.indptr, positions[positions >= 0])
+        return self.rows[indices]
+
+
 class SearchResult(object):
 
     def __init__(self, page_id, page_name, vector, weight):
@@ -34,21 +117,44 @@ class WikiIndex(object):
     selected Wikipedia Index. See Github for specifications about the database design.
     """
 
-    def __init__(self, user, passwd, host, db):
-        self.connection = MySQLdb.connect(user=user, passwd=passwd, host=host, db=db)
-        self._cur = self.connection.cursor(cursorclass=MySQLdb.cursors.Cursor)
-        self._sscur = self.connection.cursor(cursorclass=MySQLdb.cursors.SSCursor)
-        self._db = db
-        self._host = host
+    def __init__(self, user=None, passwd=None, host=None, db=None, cache_size=100000, backend='mysql',
+                 pool_size=4, chunk_size=500):
+        """
+        :param cache_size maximum number of entries kept in each of the term and page caches
+        :param backend name of the storage backend (mysql or sqlite) or a backend instance.
+                       The sqlite backend uses db as the path to the database file.
+        :param pool_size maximum number of connections shared by the threads using the index
+        :param chunk_size maximum number of values bound to a single IN clause
+        """
+        if isinstance(backend, basestring):
+            backend = get_backend(backend, user=user, passwd=passwd, host=host, db=db)
+
+        self.backend = backend
+        self.chunk_size = chunk_size
+        self._pool = ConnectionPool(backend, pool_size)
+
+        # Total time in seconds spent in each stage of word_concepts
+        self.timings = Counter()
+        self._timings_lock = threading.Lock()
+
+        # Process-local caches of data which does not change between queries.
+        # Terms which do not exist are cached as None to avoid looking them up again.
+        self._term_cache = LRUCache(cache_size)       # TermName -> (TermID, DocumentFrequency)
+        self._frequency_cache = LRUCache(cache_size)  # TermID -> DocumentFrequency
+        self._page_cache = LRUCache(cache_size)       # PageID -> (PageName, Length, Total)
+        self._corpus_size = None
+
+        # All page links, only available once load_link_graph is called
+        self._link_graph = None
 
         # Determine the level of support in the specified database
-        self._cur.execute('SHOW TABLES')
-        self._available_tables = set()
-        for (table, ) in self._cur.fetchall():
-            self._available_tables.add(table)
+        with self._pool.connection() as connection:
+            cur = backend.cursor(connection)
+            self._available_tables = backend.get_tables(cur)
+            cur.close()
 
     def __repr__(self):
-        return '<WikiIndex %s@%s>' % (self._db, self._host)
+        return '<WikiIndex %s>' % self.backend
 
     def __enter__(self):
         return self
@@ -57,88 +163,221 @@ class WikiIndex(object):
         self.close()
 
     def close(self):
-        self._cur.close()
-        self._sscur.close()
-        self.connection.close()
+        self._pool.close()
 
     def supports_table(self, table):
         return table in self._available_tables
 
+    @contextmanager
+    def _timer(self, stage):
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            with self._timings_lock:
+                self.timings[stage] += time.time() - t0
+
+    def reset_timings(self):
+        """
+        Resets the per-stage timings accumulated by word_concepts.
+        """
+        self.timings = Counter()
+
+    def _select(self, sql, parameters=None):
+        """
+        Executes a parameterised query on a pooled connection and returns all rows.
+        """
+        return self._pool.execute(sql, parameters)
+
+    def _stream(self, sql, parameters=None):
+        """
+        Executes a parameterised query on a pooled connection and yields the rows as they are fetched.
+        """
+        return self._pool.iterate(sql, parameters)
+
+    def _select_in(self, sql, values, parameters=()):
+        """
+        Executes a query whose {values} placeholder is an IN list of the specified values
+        followed by any additional parameters. Values are bound in chunks of at most
+        chunk_size, each padded to a power of two in length so that the same statements
+        are reused. Returns the rows of all chunks.
+        """
+        values = list(values)
+        parameters = tuple(parameters)
+
+        rows = []
+        for i in xrange(0, len(values), self.chunk_size):
+            chunk = _pad(values[i:i + self.chunk_size])
+            rows.extend(self._select(
+                sql.replace('{values}', _placeholders(len(chunk))), tuple(chunk) + parameters
+            ))
+
+        return rows
+
+    def cache_stats(self):
+        """
+        Returns a dictionary of cache name to a (hits, misses, size) tuple.
+        """
+        return {
+            'terms': (self._term_cache.hits, self._term_cache.misses, len(self._term_cache)),
+            'frequencies': (self._frequency_cache.hits, self._frequency_cache.misses, len(self._frequency_cache)),
+            'pages': (self._page_cache.hits, self._page_cache.misses, len(self._page_cache)),
+        }
+
+    def clear_caches(self):
+        """
+        Empties all caches. Should be called if the underlying database is modified.
+        """
+        self._term_cache.clear()
+        self._frequency_cache.clear()
+        self._page_cache.clear()
+        self._corpus_size = None
+
+    def warm_up(self, n=10000):
+        """
+        Preloads the term caches with the n terms with the highest document
+        frequency, which are the terms most likely to occur in a query.
+        Returns the number of terms loaded.
+        """
+        results = self._select("""
+            SELECT T1.TermName, T1.TermID, T2.DocumentFrequency
+            FROM DocumentFrequencies T2
+            INNER JOIN Terms T1 ON T1.TermID = T2.TermID
+            ORDER BY T2.DocumentFrequency DESC
+            LIMIT %s;
+        """, (n, ))
+
+        for term_name, term_id, df in results:
+            self._term_cache.put(term_name, (term_id, df))
+            self._frequency_cache.put(term_id, df)
+
+        return len(results)
+
+    def _lookup_terms(self, term_name_list):
+        """
+        Returns a dictionary of TermName to (TermID, DocumentFrequency) for all the
+        specified terms which exist. DocumentFrequency is None if it is not available.
+        Terms which are not cached are retrieved in a single query.
+        """
+        found, missing = self._term_cache.lookup(set(term_name_list))
+
+        if missing:
+            if self.supports_table('DocumentFrequencies'):
+                results = self._select_in("""
+                    SELECT T1.TermName, T1.TermID, T2.DocumentFrequency
+                    FROM Terms T1
+                    LEFT JOIN DocumentFrequencies T2 ON T1.TermID = T2.TermID
+                    WHERE T1.TermName IN ({values});
+                """, missing)
+            else:
+                results = self._select_in("""
+                    SELECT TermName, TermID, NULL
+                    FROM Terms
+                    WHERE TermName IN ({values});
+                """, missing)
+
+            for term_name, term_id, df in results:
+                found[term_name] = (term_id, df)
+                self._term_cache.put(term_name, (term_id, df))
+                if df is not None:
+                    self._frequency_cache.put(term_id, df)
+
+            for term_name in missing:
+                if term_name not in found:
+                    self._term_cache.put(term_name, None)
+
+        return dict((k, v) for (k, v) in found.items() if v is not None)
+
+    def _lookup_pages(self, page_id_list):
+        """
+        Returns a dictionary of PageID to (PageName, Length, Total) for all the specified
+        pages which exist. Pages which are not cached are retrieved in a single query.
+        """
+        found, missing = self._page_cache.lookup(set(page_id_list))
+
+        if missing:
+            if self.supports_table('TfidfTotals'):
+                results = self._select_in("""
+                    SELECT T1.PageID, T1.PageName, T1.Length, T2.Total
+                    FROM Pages T1
+                    LEFT JOIN TfidfTotals T2 ON T1.PageID = T2.PageID
+                    WHERE T1.PageID IN ({values});
+                """, missing)
+            else:
+                results = self._select_in("""
+                    SELECT PageID, PageName, Length, NULL
+                    FROM Pages
+                    WHERE PageID IN ({values});
+                """, missing)
+
+            for page_id, page_name, length, total in results:
+                found[page_id] = (page_name, length, total)
+                self._page_cache.put(page_id, (page_name, length, total))
+
+        return found
+
     def get_document_frequencies(self, term_id_list):
         """
         Returns a list of (TermID, DocumentFrequency)
         """
-        var_string = to_csv(term_id_list)
+        found, missing = self._frequency_cache.lookup(set(term_id_list))
+
+        if missing:
+            results = self._select_in("""
+                SELECT TermID, DocumentFrequency
+                FROM DocumentFrequencies
+                WHERE TermID IN ({values})
+            """, missing)
 
-        self._cur.execute("""
-            SELECT TermID, DocumentFrequency
-            FROM DocumentFrequencies
-            WHERE TermID IN (%s)
-        """ % var_string)
-        return self._cur.fetchall()
+            for term_id, df in results:
+                found[term_id] = df
+                self._frequency_cache.put(term_id, df)
+
+        return found.items()
 
     def get_term_ids(self, term_name_list):
         """
         Returns a list of (TermName, TermID)
         """
-        var_string = to_csv(term_name_list)
-
-        self._cur.execute("""
-            SELECT TermName, TermID
-            FROM Terms
-            WHERE TermName IN (%s);
-        """ % var_string)
-        return self._cur.fetchall()
+        terms = self._lookup_terms(term_name_list)
+        return [(term_name, term_id) for (term_name, (term_id, _)) in terms.items()]
 
     def get_term_names(self, term_id_list):
         """
         Returns a list of (TermID, TermName)
         """
-        var_string = to_csv(term_id_list)
-
-        self._cur.execute("""
+        return self._select_in("""
             SELECT TermID, TermName
             FROM Terms
-            WHERE TermID IN (%s);
-        """ % var_string)
-        return self._cur.fetchall()
+            WHERE TermID IN ({values});
+        """, set(term_id_list))
 
     def get_page_ids(self, page_name_list):
         """
         Returns a list of (PageName, PageID)
         """
-        var_string = to_csv(page_name_list)
-
-        self._cur.execute("""
+        return self._select_in("""
             SELECT PageName, PageID
             FROM Pages
-            WHERE PageName IN (%s);
-        """ % var_string)
-        return self._cur.fetchall()
+            WHERE PageName IN ({values});
+        """, set(page_name_list))
 
     def get_page_names(self, page_id_list):
         """
         Returns a list of (PageID, PageName)
         """
-        var_string = to_csv(page_id_list)
-        self._cur.execute("""
+        return self._select_in("""
             SELECT PageID, PageName
             FROM Pages
-            WHERE PageID IN (%s);
-        """ % var_string)
-        return self._cur.fetchall()
+            WHERE PageID IN ({values});
+        """, set(page_id_list))
 
     def get_page_data(self, page_id_list):
         """
         Returns a list of (PageID, PageName, Length)
         """
-        var_string = to_csv(page_id_list)
-        self._cur.execute("""
-            SELECT PageID, PageName, Length
-            FROM Pages
-            WHERE PageID IN (%s);
-        """ % var_string)
-        return self._cur.fetchall()
+        pages = self._lookup_pages(page_id_list)
+        return [(page_id, page_name, length) for (page_id, (page_name, length, _)) in pages.items()]
 
     def get_page_links(self, page_id_list):
         """
@@ -146,138 +385,219 @@ class WikiIndex(object):
         """
         # Attempting to speed this up with a TargetID IN will
         # not work because there is no Index available on TargetID
-        var_string = to_csv(page_id_list)
-
-        self._cur.execute("""
+        return self._select_in("""
             SELECT PageID, TargetPageID, Counter
             FROM PageLinks
-            WHERE PageID IN (%s);
-        """ % (var_string, ))
-
-        return self._cur.fetchall()
+            WHERE PageID IN ({values});
+        """, set(page_id_list))
 
     def get_documents(self, term_id, min_tfidf=1.0, limit=200):
         """
         Returns a list of (PageID)
-        Results are limited to the specified value and only terms
-        with a Counter larger than min_counter are returned. Returned
-        results are sorted in descending order by Counter.
+        Results are limited to the specified value and only pages with
+        a Tfidf larger than min_tfidf are returned. Returned results are
+        sorted in descending order by Tfidf.
         """
         # Using TfidfValues or TermOccurrences should make a difference because
         # in relation to the same term they *all* have the same inverse document
         # frequency. This method does however benefit from normalisation of the
         # document length which could be aiding somewhat in retrieval performance.
-        self._cur.execute("""
-            SELECT PageID
-            FROM TfidfValues
-            WHERE TermID = %s AND Tfidf > %s
-            ORDER BY Tfidf DESC
-            LIMIT %s
-        """ % (term_id, min_tfidf, limit))
-        return self._cur.fetchall()
+        return [(page_id, ) for (_, page_id, _) in self.get_top_documents([term_id], min_tfidf, limit)]
+
+    def get_top_documents(self, term_id_list, min_tfidf=1.0, limit=200):
+        """
+        Returns a list of (TermID, PageID, Tfidf)
+        Performs the same operation as get_documents for all the specified
+        terms in a single query. Up to limit pages are returned per term.
+        The precomputed TopPostings are used if they are available, so that
+        TfidfValues is only read for terms with more pages above min_tfidf
+        than were kept in their postings.
+        """
+        if not self.supports_table('TopPostings'):
+            return self._top_documents(term_id_list, min_tfidf, limit)
+
+        rows = self._select_in("""
+            SELECT TermID, Complete, Postings
+            FROM TopPostings
+            WHERE TermID IN ({values});
+        """, set(term_id_list))
+
+        results = []
+        truncated = []
+        for term_id, complete, blob in rows:
+            postings = unpack_postings(blob)
+            above = postings['tfidf'] > min_tfidf
+
+            # Pages which were left out of the postings could still be above min_tfidf
+            if not complete and len(postings) < limit and above.all():
+                truncated.append(term_id)
+                continue
+
+            postings = postings[above][:limit]
+            results.extend(zip([term_id] * len(postings), postings['page_id'].tolist(), postings['tfidf'].tolist()))
+
+        if truncated:
+            results.extend(self._top_documents(truncated, min_tfidf, limit))
+
+        return results
+
+    def _top_documents(self, term_id_list, min_tfidf, limit):
+        """
+        Returns a list of (TermID, PageID, Tfidf) read from TfidfValues.
+        """
+        # Each subquery is wrapped in a derived table so that the statement is portable
+        subquery = """
+            SELECT * FROM (
+                SELECT TermID, PageID, Tfidf
+                FROM TfidfValues
+                WHERE TermID = %%s AND Tfidf > %%s
+                ORDER BY Tfidf DESC
+                LIMIT %%s
+            ) AS T%d
+        """
+
+        # Three parameters are bound for each term
+        term_id_list = list(term_id_list)
+        chunk_size = max(1, self.chunk_size // 3)
+
+        rows = []
+        for i in xrange(0, len(term_id_list), chunk_size):
+            chunk = term_id_list[i:i + chunk_size]
+            sql = ' UNION ALL '.join([subquery % j for j in xrange(len(chunk))])
+
+            parameters = []
+            for term_id in chunk:
+                parameters.extend((term_id, min_tfidf, limit))
+
+            rows.extend(self._select(sql, tuple(parameters)))
+
+        return rows
+
+    def get_term_data(self, term_name_list):
+        """
+        Returns a list of (TermName, TermID, DocumentFrequency)
+        Only terms which have a document frequency are returned.
+        """
+        terms = self._lookup_terms(term_name_list)
+        return [
+            (term_name, term_id, df)
+            for (term_name, (term_id, df)) in terms.items() if df is not None
+        ]
 
     def get_term_occurrences(self, page_id_list, term_id_list):
         """
         Returns a list of (PageID, TermID, Counter)
         """
-        v1 = to_csv(page_id_list)
-        v2 = to_csv(term_id_list)
+        page_ids = set(page_id_list)
+        term_ids = list(set(term_id_list))
+
+        # Terms are also bound in chunks for the large vocabularies of word_concepts_batch
+        rows = []
+        for i in xrange(0, len(term_ids), self.chunk_size):
+            chunk = _pad(term_ids[i:i + self.chunk_size])
+            rows.extend(self._select_in("""
+                SELECT PageID, TermID, Counter
+                FROM TermOccurrences
+                WHERE PageID IN ({values}) AND TermID IN (%s);
+            """ % _placeholders(len(chunk)), page_ids, chunk))
 
-        self._cur.execute("""
-            SELECT PageID, TermID, Counter
-            FROM TermOccurrences
-            WHERE PageID IN (%s) AND TermID IN (%s);
-        """ % (v1, v2))
-        return self._cur.fetchall()
+        return rows
 
     def get_tfidf_values(self, page_id_list, term_id_list):
         """
         Returns a list of (PageID, TermID, Tfidf)
         """
-        v1 = to_csv(page_id_list)
-        v2 = to_csv(term_id_list)
+        term_ids = _pad(list(set(term_id_list)))
+        if not term_ids:
+            return []
 
-        self._cur.execute("""
+        return self._select_in("""
             SELECT PageID, TermID, Tfidf
             FROM TfidfValues
-            WHERE PageID IN (%s) AND TermID IN (%s);
-        """ % (v1, v2))
-        return self._cur.fetchall()
+            WHERE PageID IN ({values}) AND TermID IN (%s);
+        """ % _placeholders(len(term_ids)), set(page_id_list), term_ids)
 
     def get_tfidf_totals(self, page_id_list):
         """
         Returns a list of (PageID, Total)
         """
-        var_string = to_csv(page_id_list)
+        pages = self._lookup_pages(page_id_list)
+        return [(page_id, total) for (page_id, (_, _, total)) in pages.items() if total is not None]
 
-        self._cur.execute("""
-            SELECT PageID, Total
-            FROM TfidfTotals
-            WHERE PageID IN (%s);
-        """ % var_string)
-        return self._cur.fetchall()
+    def get_page_totals(self, page_id_list):
+        """
+        Returns a list of (PageID, PageName, Length, Total)
+        Total is the sum of the page tfidf values if the TfidfTotals table
+        is available, otherwise it is None.
+        """
+        pages = self._lookup_pages(page_id_list)
+        return [(page_id, ) + data for (page_id, data) in pages.items()]
 
     def get_corpus_size(self):
         """
         Returns the size of the corpus which excludes all unprocessed pages.
+        The value is only retrieved from the database the first time.
         """
-        self._cur.execute('SELECT Size FROM CorpusSize;')
-        (corpus, ) = self._cur.fetchone()
-        self._cur.fetchall()
+        if self._corpus_size is None:
+            ((self._corpus_size, ), ) = self._select('SELECT Size FROM CorpusSize;')
 
-        return corpus
+        return self._corpus_size
 
-    def generate_normalised_link_matrix(self, pages, page_id_lists, mode='count'):
-        if mode not in ('count', 'single'):
-            raise ValueError('Unrecognized mode: %s' % mode)
+    def load_link_graph(self):
+        """
+        Loads all page links into memory so that link matrices are built without
+        querying the database. Returns the number of links loaded.
+        """
+        self._link_graph = PageLinkGraph.from_links(self._stream("""
+            SELECT PageID, TargetPageID, Counter
+            FROM PageLinks;
+        """))
 
-        size = len(pages)
-        link_matrix = np.zeros(shape=(size, size))
+        return len(self._link_graph)
 
-        # Build an index of page links
-        page_index = dict([(b, a) for a, b in enumerate(pages)])
+    def _page_link_arrays(self, page_id_list):
+        """
+        Returns arrays of the PageID, TargetPageID and Counter of all links from the specified pages.
+        """
+        if self._link_graph is not None:
+            return self._link_graph.get_links(page_id_list)
 
-        for page_ids in page_id_lists:
-            if page_ids:
-                current_pages = set(page_ids)
+        page_links = self.get_page_links(page_id_list)
+        if not page_links:
+            return np.zeros(0), np.zeros(0), np.zeros(0)
 
-                page_links = self.get_page_links(page_ids)
-                for page_id, target_page_id, counter in page_links:
-                    if target_page_id in page_index and target_page_id not in current_pages:
-                        i = page_index[target_page_id]
-                        j = page_index[page_id]
-                        if mode == 'count':
-                            link_matrix[i, j] += counter
-                        elif mode == 'single':
-                            link_matrix[i, j] = 1
+        return np.asarray(page_links).T
 
-        return link_matrix
+    def generate_normalised_link_matrix(self, pages, page_id_lists, mode='count', sparse=False):
+        """
+        Generates a matrix containing the links between a target page (row) and the
+        incoming page (column) in each cell. Links between pages retrieved for the
+        same term are ignored, the remaining links are counted once per page list.
+        A scipy.sparse.csr_matrix is returned if sparse is True.
+        :param page_id_lists list of pages retrieved for each term
+        """
+        if mode not in ('count', 'single'):
+            raise ValueError('Unrecognized mode: %s' % mode)
+
+        page_id_lists = [set(page_ids) for page_ids in page_id_lists]
+
+        # Fetch the links of all page lists in a single query
+        sources, targets, counts = self._page_link_arrays(set().union(*page_id_lists))
+        link_matrix = build_link_matrix(pages, sources, targets, counts, page_id_lists, mode)
 
-    def generate_link_matrix(self, page_id_list, mode='count'):
+        return link_matrix if sparse else link_matrix.toarray()
+
+    def generate_link_matrix(self, page_id_list, mode='count', sparse=False):
         """
         Generates a matrix containing the number of links between
         a target page (row) and link from an incoming page (column) in each cell.
         Only pages specified in the page_id_list will be included in the matrix.
+        A scipy.sparse.csr_matrix is returned if sparse is True.
         """
-        size = len(page_id_list)
-        link_matrix = np.zeros(shape=(size, size))
-
-        # Build an index of page links
-        page_index = dict([(b, a) for a, b in enumerate(page_id_list)])
-        page_links = self.get_page_links(page_id_list)
+        sources, targets, counts = self._page_link_arrays(page_id_list)
+        link_matrix = build_link_matrix(page_id_list, sources, targets, counts, mode=mode)
 
-        for page_id, target_page_id, counter in page_links:
-            if target_page_id in page_index:
-                i = page_index[target_page_id]
-                j = page_index[page_id]
-                if mode == 'count':
-                    link_matrix[i, j] = counter
-                elif mode == 'log':
-                    link_matrix[i, j] = math.log(counter) + 1 if counter else 0
-                elif mode == 'single':
-                    link_matrix[i, j] = 1
-
-        return link_matrix
+        return link_matrix if sparse else link_matrix.toarray()
 
     def visit_article(self, page_id):
         """
@@ -289,133 +609,206 @@ class WikiIndex(object):
         page_name = page_name.replace(' ', '_')
         webbrowser.open('http://en.wikipedia.org/wiki/%s' % urllib.quote(page_name))
 
-    def word_concepts(self, text, title=None, n=15, m=25, alpha=0.5, min_tfidf=0.5, r=40, second_order='augmented'):
+    def word_concepts(self, text, title=None, n=15, m=25, alpha=0.5, min_tfidf=0.5, r=40, second_order='augmented',
+                      steps=10):
         """
         Returns a list of word concepts associated with the text ranked in descending order by
-        how similar to the original text the concepts are.
+        how similar to the original text the concepts are. The time spent in each stage is
+        accumulated in the timings attribute.
         :param m number of top terms to use for the query vector
         :param alpha weight assigned to second order ranking
         :param r number of pages to retrieve per term query
         :param n number of top terms to use for page retrieval
+        :param second_order augmented, original, pagerank or none
+        :param steps number of propagation steps used by the pagerank second order ranking
         """
-        term_list = Counter(word_tokenize(text, stopwords=stopwords))
-        query_norm = math.log(1 + sum(term_list.values()))
+        return self.word_concepts_batch(
+            [text], [title], n=n, m=m, alpha=alpha, min_tfidf=min_tfidf, r=r, second_order=second_order, steps=steps
+        )[0]
 
-        # Nothing that can be done
-        if query_norm == 0:
-            return None, None, None
+    def word_concepts_batch(self, texts, titles=None, n=15, m=25, alpha=0.5, min_tfidf=0.5, r=40,
+                            second_order='augmented', steps=10):
+        """
+        Returns the word concepts of each text in the same form and order as word_concepts.
+        Terms, pages, term occurrences and links are fetched for all the texts at once in a
+        few large queries rather than once per text, after which each text is scored against
+        the shared data. See word_concepts for a description of the parameters.
+        :param titles list with the title of each text, or None
+        """
+        if titles is None:
+            titles = [None] * len(texts)
 
-        # Boost the score of terms in the articles title
-        if title is not None:
-            title_tokens = Counter(word_tokenize(title, stopwords=stopwords))
-            for term, count in title_tokens.items():
-                term_list[term] += 2 * count
+        with self._timer('tokenize'):
+            queries = [self._query_terms(text, title) for text, title in zip(texts, titles)]
 
-        term_names = dict([(b, a) for a, b in self.get_term_ids(term_list)])
-        document_frequencies = dict(self.get_document_frequencies(term_names))
-        corpus_size = self.get_corpus_size()
+        vocabulary = set()
+        for query in queries:
+            if query is not None:
+                vocabulary.update(query[0])
 
-        # Generate and filter the query vector
-        term_weights = {}
-        for term_id in term_names:
-            term_name = term_names[term_id]
-            if term_id in document_frequencies:
-                df = document_frequencies[term_id]
-                tf = term_list[term_name]
-
-                # Filter terms to remove low weighted terms
-                weight = tfidf(tf, df, corpus_size) / query_norm
-                if weight > min_tfidf:
-                    term_weights[term_id] = weight
-
-        # Determine which are the most representative terms
-        top_terms = term_weights.items()
-        top_terms.sort(key=lambda x: x[1], reverse=True)
+        with self._timer('terms'):
+            term_data = self.get_term_data(vocabulary)
+            corpus_size = self.get_corpus_size()
 
-        # Lookup table of term->index
-        term_index = dict([(b, a) for a, (b, c) in enumerate(top_terms[:m])])
+        term_ids = dict([(a, b) for a, b, c in term_data])
+        term_names = dict([(b, a) for a, b, c in term_data])
+        document_frequencies = dict([(b, c) for a, b, c in term_data])
 
-        query_vector = np.asarray([b for (a, b) in top_terms[:m]])
-        query_vector_norm = norm(query_vector)
+        # Determine which are the most representative terms of each text
+        top_terms = [
+            None if query is None else self._top_terms(query, term_ids, document_frequencies, corpus_size, min_tfidf)
+            for query in queries
+        ]
 
-        pages_list_results = []
+        retrieval_terms = set()
+        for terms in top_terms:
+            if terms:
+                retrieval_terms.update([a for (a, b) in terms[:n]])
 
         # larger value of n means possibly more accuracy but at the cost of speed
-        pages = set()
-        for term_id, term_weight in top_terms[:n]:
-            related_pages = self.get_documents(term_id, min_tfidf=1.0, limit=r)
-            temp_list = []
-
-            for (page_id, ) in related_pages:
-                temp_list.append(page_id)
-                pages.add(page_id)
-
-            pages_list_results.append(temp_list)
-
-        term_occurrences = self.get_term_occurrences(pages, term_index.keys())
-        page_data = self.get_page_data(pages)
+        with self._timer('documents'):
+            related_pages = {}
+            for term_id, page_id, _ in self.get_top_documents(retrieval_terms, min_tfidf=1.0, limit=r):
+                related_pages.setdefault(term_id, []).append(page_id)
 
-        page_vectors = {}
-        for page_id, term_id, tf in term_occurrences:
-            df = document_frequencies[term_id]
-            index = term_index[term_id]
-            weight = tfidf(tf, df, corpus_size)
+        pages = set()
+        query_terms = set()
+        for terms in top_terms:
+            if terms:
+                query_terms.update([a for (a, b) in terms[:m]])
+                for term_id, _ in terms[:n]:
+                    pages.update(related_pages.get(term_id, []))
 
-            if page_id not in page_vectors:
-                page_vectors[page_id] = np.zeros(query_vector.size)
+        occurrences = links = page_data = None
+        if pages:
+            with self._timer('occurrences'):
+                occurrences = _RowGroups(self.get_term_occurrences(pages, query_terms))
 
-            page_vectors[page_id][index] = weight
+            with self._timer('pages'):
+                page_data = dict([(row[0], row) for row in self.get_page_totals(pages)])
 
-        if self.supports_table('TfidfTotals'):
-            tfidf_totals = dict(self.get_tfidf_totals(pages))
-        else:
-            tfidf_totals = None
+            if second_order != 'none':
+                with self._timer('links'):
+                    links = _RowGroups(np.column_stack(self._page_link_arrays(pages)))
 
         results = []
-        for page_id, page_name, page_length in page_data:
-            page_vector = page_vectors[page_id]
-
-            if self.supports_table('TfidfTotals'):
-                page_vector /= math.log(tfidf_totals[page_id])
+        for terms in top_terms:
+            if terms is None:
+                results.append((None, None, None))
+            elif not terms:
+                results.append(([], [], np.asarray([])))
             else:
-                page_vector /= math.log(page_length)
-
-            similarity = np.dot(page_vector, query_vector) / (norm(page_vector) * query_vector_norm)
-            results.append(SearchResult(page_id, page_name, page_vector, similarity))
+                pages_list_results = [related_pages.get(term_id, []) for term_id, _ in terms[:n]]
+                search_results = self._rank_pages(
+                    terms[:m], pages_list_results, document_frequencies, corpus_size,
+                    occurrences, page_data, links, alpha, second_order, steps
+                )
+                results.append((
+                    search_results, [term_names[tid] for tid, _ in terms[:m]], np.asarray([b for (a, b) in terms[:m]])
+                ))
+
+        return results
+
+    def _query_terms(self, text, title=None):
+        """
+        Returns a Counter of the terms in the text, with the terms in the title boosted,
+        along with the norm of the query. Returns None if the text has no terms.
+        """
+        term_list = Counter(word_tokenize(text, stopwords=stopwords))
+        query_norm = math.log(1 + sum(term_list.values()))
 
-        if results and second_order != 'none':
-            # Second order ranking stuff
-            link_matrix = self.generate_normalised_link_matrix([sr.page_id for sr in results], pages_list_results, mode='single')
-            weights = np.asarray([sr.weight for sr in results])
-            incoming = link_matrix.sum(axis=1)
-            outgoing = link_matrix.sum(axis=0)
+        # Nothing that can be done
+        if query_norm == 0:
+            return None
 
-            if second_order == 'augmented':
+        # Boost the score of terms in the articles title
+        if title is not None:
+            title_tokens = Counter(word_tokenize(title, stopwords=stopwords))
+            for term, count in title_tokens.items():
+                term_list[term] += 2 * count
 
-                # Consider changing as incoming == 0 are already removed below
-                weights[(incoming + outgoing < 2)] = 0
+        return term_list, query_norm
 
-                norm_weights = weights * incoming
+    def _top_terms(self, query, term_ids, document_frequencies, corpus_size, min_tfidf):
+        """
+        Returns a list of (TermID, Weight) of the query terms sorted in descending order by weight.
+        Terms with a weight lower than min_tfidf are removed.
+        """
+        term_list, query_norm = query
 
-                nonzero = outgoing > 0
-                norm_weights[nonzero] /= outgoing[nonzero]
+        # Generate and filter the query vector
+        term_weights = {}
+        for term_name, tf in term_list.items():
+            if term_name not in term_ids:
+                continue
 
-                A = alpha * np.dot(link_matrix, norm_weights)
-                A *= weights ** 2
-                A += (1 - alpha) * weights
-            elif second_order == 'original':
-                A = alpha * np.dot(link_matrix, weights)
-                A += weights
+            term_id = term_ids[term_name]
+            df = document_frequencies[term_id]
 
-            # Assign newly calculated weights
-            for i in xrange(len(results)):
-                results[i].weight = A[i]
-                results[i].incoming = incoming[i]
-                results[i].outgoing = outgoing[i]
+            # Filter terms to remove low weighted terms
+            weight = tfidf(tf, df, corpus_size) / query_norm
+            if weight > min_tfidf:
+                term_weights[term_id] = weight
 
-            # Link matrix wont be returned in the right order because of resorting!!!!
-            results.sort(key=lambda x: x.weight, reverse=True)
+        # Ties are broken by TermID so that every text orders its terms in the same way
+        top_terms = term_weights.items()
+        top_terms.sort(key=lambda x: (-x[1], x[0]))
 
-        term_sequence = sorted(term_index.items(), key=lambda x: x[1])
+        return top_terms
 
-        return results, [term_names[tid] for tid, index in term_sequence], query_vector
+    def _rank_pages(self, terms, pages_list_results, document_frequencies, corpus_size, occurrences, page_data,
+                    links, alpha, second_order, steps):
+        """
+        Returns a list of SearchResult for the pages retrieved for a single query ranked
+        in descending order by weight.
+        :param terms list of (TermID, Weight) which make up the query vector
+        :param occurrences term occurrences of the retrieved pages grouped by PageID
+        :param page_data dictionary of PageID -> (PageID, PageName, Length, Total)
+        :param links page links of the retrieved pages grouped by PageID
+        """
+        pages = set()
+        for page_ids in pages_list_results:
+            pages.update(page_ids)
+
+        if not pages:
+            return []
+
+        with self._timer('scoring'):
+            page_ids = [page_id for page_id in sorted(pages) if page_id in page_data]
+            term_ids = [a for (a, b) in terms]
+            query_vector = np.asarray([b for (a, b) in terms])
+
+            page_matrix = tfidf_matrix(
+                page_ids, term_ids, occurrences.select(page_ids),
+                [document_frequencies[tid] for tid in term_ids], corpus_size
+            )
+
+            # Normalise by the sum of the page tfidf values, or the page length if unavailable
+            totals = np.asarray([c if d is None else d for (a, b, c, d) in (page_data[p] for p in page_ids)], dtype=float)
+            page_matrix /= np.log(totals)[:, np.newaxis]
+
+            weights = cosine_similarity(page_matrix, query_vector)
+
+        incoming = outgoing = None
+        if page_ids and second_order != 'none':
+            with self._timer('links'):
+                page_links = links.select(page_ids)
+                link_matrix = build_link_matrix(
+                    page_ids, page_links[:, 0], page_links[:, 1], page_links[:, 2], pages_list_results, mode='single'
+                )
+
+            with self._timer('second_order'):
+                weights, incoming, outgoing = second_order_ranking(
+                    weights, link_matrix, alpha, second_order, steps
+                )
+
+        # Stable sort in descending order of weight
+        results = []
+        for i in np.argsort(-weights, kind='mergesort'):
+            sr = SearchResult(page_ids[i], page_data[page_ids[i]][1], page_matrix[i], weights[i])
+            if incoming is not None:
+                sr.incoming = incoming[i]
+                sr.outgoing = outgoing[i]
+            results.append(sr)
+
+        return results
@@ -0,0 +1,442 @@
+"""
+Offline snapshot of a Wikipedia index. The tables required by word_concepts are
+exported from the database into a directory of numpy arrays which can then be
+memory mapped by WikiSnapshot, a WikiIndex which does not require a database.
+
+All IDs are renumbered to dense indices when the snapshot is written:
+    * Terms and Pages are stored as utf-8 blobs with offsets and a permutation
+      sorted by name for binary search lookups.
+    * TfidfValues are stored as CSR postings per term sorted by descending Tfidf.
+    * TermOccurrences and PageLinks are stored as CSR postings per page.
+"""
+
+import os
+import json
+import datetime
+import threading
+import numpy as np
+
+from array import array
+from collections import Counter
+
+from index.cache import LRUCache
+from index.wikiindex import WikiIndex
+from index.linkgraph import PageLinkGraph, _ranges
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_META = 'meta.json'
+
+SNAPSHOT_ARRAYS = (
+    'term_names', 'term_offsets', 'term_order', 'term_frequencies',
+    'page_names', 'page_offsets', 'page_order', 'page_lengths', 'page_totals',
+    'tfidf_indptr', 'tfidf_pages', 'tfidf_values',
+    'occurrence_indptr', 'occurrence_terms', 'occurrence_counts',
+    'link_indptr', 'link_targets', 'link_counts',
+)
+
+
+def _columns(rows, typecodes):
+    """
+    Reads an iterable of rows into one array per column.
+    """
+    columns = [array(t) for t in typecodes]
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+
+    return [np.frombuffer(c, dtype=c.typecode).copy() if len(c) else np.zeros(0, dtype=c.typecode) for c in columns]
+
+
+def _map_ids(db_ids, values):
+    """
+    Maps database IDs in values to their position in the sorted db_ids array.
+    Returns the mapped IDs and a boolean mask of the values which were found.
+    """
+    positions = np.searchsorted(db_ids, values)
+    positions[positions == len(db_ids)] = 0
+    found = db_ids[positions] == values if len(db_ids) else np.zeros(len(values), dtype=bool)
+
+    return positions, found
+
+
+def _to_csr(n, row_ids, sort_keys, *columns):
+    """
+    Sorts the columns by row and then by sort_keys and returns the row
+    pointers followed by the sorted columns.
+    """
+    order = np.lexsort((sort_keys, row_ids))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(row_ids, minlength=n))
+
+    return (indptr, ) + tuple(c[order] for c in columns)
+
+
+def _encode_names(names):
+    """
+    Returns the utf-8 blob, offsets and name sorted permutation of a list of names.
+    """
+    encoded = [name.encode('utf8') if isinstance(name, unicode) else name for name in names]
+
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8) if encoded else np.zeros(0, dtype=np.uint8)
+    order = np.asarray(sorted(xrange(len(encoded)), key=encoded.__getitem__), dtype=np.int32)
+
+    return blob, offsets, order
+
+
+def write_snapshot(path, corpus_size, terms, pages, document_frequencies=(), tfidf_values=(),
+                   tfidf_totals=(), term_occurrences=(), page_links=(), tables=None):
+    """
+    Writes a snapshot to the directory at the specified path. Each argument is an
+    iterable of rows in the same format as the respective database table.
+    :param terms (TermID, TermName)
+    :param pages (PageID, PageName, Length)
+    :param document_frequencies (TermID, DocumentFrequency)
+    :param tfidf_values (TermID, PageID, Tfidf)
+    :param tfidf_totals (PageID, Total)
+    :param term_occurrences (TermID, PageID, Counter)
+    :param page_links (PageID, TargetPageID, Counter)
+    :param tables list of tables supported by the snapshot, defaults to all of them
+    """
+    columns = {
+        'DocumentFrequencies': _columns(document_frequencies, 'll'),
+        'TfidfValues': _columns(tfidf_values, 'lld'),
+        'TfidfTotals': _columns(tfidf_totals, 'ld'),
+        'TermOccurrences': _columns(term_occurrences, 'lll'),
+        'PageLinks': _columns(page_links, 'lll'),
+    }
+
+    if tables is None:
+        tables = ['Terms', 'Pages'] + sorted(columns.keys())
+
+    _write_columns(path, corpus_size, list(terms), list(pages), columns, tables)
+
+
+def export_snapshot(wiki_index, path):
+    """
+    Exports the tables of a database backed WikiIndex into a snapshot at the
+    specified path. Rows are streamed from the database with a server side cursor.
+    """
+    def read_table(sql, table, typecodes):
+        if not wiki_index.supports_table(table):
+            return _columns((), typecodes)
+
+        return _columns(wiki_index._stream(sql), typecodes)
+
+    terms = list(wiki_index._stream('SELECT TermID, TermName FROM Terms'))
+    pages = list(wiki_index._stream('SELECT PageID, PageName, Length FROM Pages'))
+
+    columns = {
+        'DocumentFrequencies': read_table('SELECT TermID, DocumentFrequency FROM DocumentFrequencies', 'DocumentFrequencies', 'll'),
+        'TfidfValues': read_table('SELECT TermID, PageID, Tfidf FROM TfidfValues', 'TfidfValues', 'lld'),
+        'TfidfTotals': read_table('SELECT PageID, Total FROM TfidfTotals', 'TfidfTotals', 'ld'),
+        'TermOccurrences': read_table('SELECT TermID, PageID, Counter FROM TermOccurrences', 'TermOccurrences', 'lll'),
+        'PageLinks': read_table('SELECT PageID, TargetPageID, Counter FROM PageLinks', 'PageLinks', 'lll'),
+    }
+
+    tables = ['Terms', 'Pages'] + [t for t in sorted(columns.keys()) if wiki_index.supports_table(t)]
+
+    _write_columns(path, wiki_index.get_corpus_size(), terms, pages, columns, tables)
+
+
+def _write_columns(path, corpus_size, terms, pages, columns, tables):
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    arrays = {}
+
+    # Terms and Pages are ordered by their database ID
+    terms.sort()
+    term_db_ids = np.asarray([a for a, b in terms], dtype=np.int64)
+    arrays['term_names'], arrays['term_offsets'], arrays['term_order'] = _encode_names([b for a, b in terms])
+    n_terms = len(terms)
+
+    pages.sort()
+    page_db_ids = np.asarray([a for a, b, c in pages], dtype=np.int64)
+    arrays['page_names'], arrays['page_offsets'], arrays['page_order'] = _encode_names([b for a, b, c in pages])
+    arrays['page_lengths'] = np.asarray([c for a, b, c in pages], dtype=np.int32)
+    n_pages = len(pages)
+
+    term_ids, dfs = columns['DocumentFrequencies']
+    term_ids, found = _map_ids(term_db_ids, term_ids)
+    arrays['term_frequencies'] = np.zeros(n_terms, dtype=np.int32)
+    arrays['term_frequencies'][term_ids[found]] = dfs[found]
+
+    page_ids, totals = columns['TfidfTotals']
+    page_ids, found = _map_ids(page_db_ids, page_ids)
+    arrays['page_totals'] = np.empty(n_pages, dtype=np.float64)
+    arrays['page_totals'].fill(np.nan)
+    arrays['page_totals'][page_ids[found]] = totals[found]
+
+    # Rows which reference unknown terms or pages are discarded
+    term_ids, page_ids, values = columns['TfidfValues']
+    term_ids, found_terms = _map_ids(term_db_ids, term_ids)
+    page_ids, found_pages = _map_ids(page_db_ids, page_ids)
+    found = found_terms & found_pages
+    arrays['tfidf_indptr'], arrays['tfidf_pages'], arrays['tfidf_values'] = _to_csr(
+        n_terms, term_ids[found], -values[found],
+        page_ids[found].astype(np.int32), values[found].astype(np.float32)
+    )
+
+    term_ids, page_ids, counts = columns['TermOccurrences']
+    term_ids, found_terms = _map_ids(term_db_ids, term_ids)
+    page_ids, found_pages = _map_ids(page_db_ids, page_ids)
+    found = found_terms & found_pages
+    arrays['occurrence_indptr'], arrays['occurrence_terms'], arrays['occurrence_counts'] = _to_csr(
+        n_pages, page_ids[found], term_ids[found],
+        term_ids[found].astype(np.int32), counts[found].astype(np.uint16)
+    )
+
+    page_ids, target_ids, counts = columns['PageLinks']
+    page_ids, found_pages = _map_ids(page_db_ids, page_ids)
+    target_ids, found_targets = _map_ids(page_db_ids, target_ids)
+    found = found_pages & found_targets
+    arrays['link_indptr'], arrays['link_targets'], arrays['link_counts'] = _to_csr(
+        n_pages, page_ids[found], target_ids[found],
+        target_ids[found].astype(np.int32), counts[found].astype(np.uint16)
+    )
+
+    for name in SNAPSHOT_ARRAYS:
+        np.save(os.path.join(path, name + '.npy'), arrays[name])
+
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'date': unicode(datetime.datetime.now()),
+        'corpus-size': int(corpus_size),
+        'terms': n_terms,
+        'pages': n_pages,
+        'tables': ['CorpusSize'] + list(tables),
+    }
+
+    with open(os.path.join(path, SNAPSHOT_META), 'w') as fp:
+        json.dump(meta, fp, indent=4)
+
+
+class _NameTable(object):
+    """
+    Read only view of names stored as a utf-8 blob with offsets. Names are
+    looked up with a binary search over the name sorted permutation.
+    """
+
+    def __init__(self, blob, offsets, order):
+        self._blob = buffer(blob) if len(blob) else ''
+        self._offsets = offsets
+        self._order = order
+
+    def __len__(self):
+        return len(self._order)
+
+    def _encoded(self, name_id):
+        return self._blob[self._offsets.item(name_id):self._offsets.item(name_id + 1)]
+
+    def get_name(self, name_id):
+        return self._encoded(name_id).decode('utf8')
+
+    def get_id(self, name):
+        """
+        Returns the ID of the specified name or None if it does not exist.
+        """
+        if isinstance(name, unicode):
+            name = name.encode('utf8')
+
+        lo, hi = 0, len(self._order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._encoded(self._order.item(mid)) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < len(self._order) and self._encoded(self._order.item(lo)) == name:
+            return self._order.item(lo)
+        return None
+
+
+class WikiSnapshot(WikiIndex):
+    """
+    WikiIndex which answers all queries from a snapshot written by write_snapshot
+    or export_snapshot instead of a database. All arrays are memory mapped by default
+    so opening a snapshot is instant and pages are only read from disk when needed.
+    Term and Page IDs are the dense indices assigned when the snapshot was written.
+    """
+
+    def __init__(self, path, mmap=True):
+        """
+        :param path directory the snapshot was written to
+        :param mmap memory map the arrays rather than loading them into memory
+        """
+        with open(os.path.join(path, SNAPSHOT_META), 'r') as fp:
+            self.meta = json.load(fp)
+
+        if self.meta['version'] != SNAPSHOT_VERSION:
+            raise ValueError('Unsupported snapshot version: %s' % self.meta['version'])
+
+        # Memory mapped arrays are viewed as plain ndarrays which are much faster to index
+        mmap_mode = 'r' if mmap else None
+        for name in SNAPSHOT_ARRAYS:
+            setattr(self, '_' + name, np.asarray(np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)))
+
+        self._terms = _NameTable(self._term_names, self._term_offsets, self._term_order)
+        self._pages = _NameTable(self._page_names, self._page_offsets, self._page_order)
+
+        self._path = path
+        self._available_tables = set(self.meta['tables'])
+        self.timings = Counter()
+        self._timings_lock = threading.Lock()
+
+        # Lookups are cheap enough that the caches are disabled
+        self._term_cache = LRUCache(0)
+        self._frequency_cache = LRUCache(0)
+        self._page_cache = LRUCache(0)
+        self._corpus_size = self.meta['corpus-size']
+
+        # Page links are stored in the same layout used by PageLinkGraph
+        self._link_graph = PageLinkGraph(self._link_indptr, self._link_targets, self._link_counts)
+
+    def __repr__(self):
+        return '<WikiSnapshot %s>' % self._path
+
+    def close(self):
+        pass
+
+    def warm_up(self, n=10000):
+        return 0
+
+    def load_link_graph(self):
+        return len(self._link_graph)
+
+    def get_corpus_size(self):
+        """
+        Returns the size of the corpus which excludes all unprocessed pages.
+        """
+        return self.meta['corpus-size']
+
+    def get_document_frequencies(self, term_id_list):
+        """
+        Returns a list of (TermID, DocumentFrequency)
+        """
+        return [
+            (term_id, int(self._term_frequencies[term_id]))
+            for term_id in set(term_id_list) if self._term_frequencies[term_id]
+        ]
+
+    def get_term_ids(self, term_name_list):
+        """
+        Returns a list of (TermName, TermID)
+        """
+        results = [(term_name, self._terms.get_id(term_name)) for term_name in set(term_name_list)]
+        return [(a, b) for (a, b) in results if b is not None]
+
+    def get_term_names(self, term_id_list):
+        """
+        Returns a list of (TermID, TermName)
+        """
+        return [(term_id, self._terms.get_name(term_id)) for term_id in set(term_id_list)]
+
+    def get_term_data(self, term_name_list):
+        """
+        Returns a list of (TermName, TermID, DocumentFrequency)
+        Only terms which have a document frequency are returned.
+        """
+        return [
+            (term_name, term_id, int(self._term_frequencies[term_id]))
+            for (term_name, term_id) in self.get_term_ids(term_name_list) if self._term_frequencies[term_id]
+        ]
+
+    def get_page_ids(self, page_name_list):
+        """
+        Returns a list of (PageName, PageID)
+        """
+        results = [(page_name, self._pages.get_id(page_name)) for page_name in set(page_name_list)]
+        return [(a, b) for (a, b) in results if b is not None]
+
+    def get_page_names(self, page_id_list):
+        """
+        Returns a list of (PageID, PageName)
+        """
+        return [(page_id, self._pages.get_name(page_id)) for page_id in set(page_id_list)]
+
+    def get_page_data(self, page_id_list):
+        """
+        Returns a list of (PageID, PageName, Length)
+        """
+        return [(a, b, c) for (a, b, c, d) in self.get_page_totals(page_id_list)]
+
+    def get_tfidf_totals(self, page_id_list):
+        """
+        Returns a list of (PageID, Total)
+        """
+        return [(a, d) for (a, b, c, d) in self.get_page_totals(page_id_list) if d is not None]
+
+    def get_page_totals(self, page_id_list):
+        """
+        Returns a list of (PageID, PageName, Length, Total)
+        Total is None if the page has no tfidf total.
+        """
+        results = []
+        for page_id in set(page_id_list):
+            total = self._page_totals[page_id]
+            results.append((
+                page_id, self._pages.get_name(page_id), int(self._page_lengths[page_id]),
+                None if np.isnan(total) else float(total)
+            ))
+
+        return results
+
+    def get_page_links(self, page_id_list):
+        """
+        Returns a list of (PageID, TargetPageID, LinkCounter)
+        """
+        page_ids, target_ids, counts = self._link_graph.get_links(page_id_list)
+        return zip(page_ids.tolist(), target_ids.tolist(), counts.tolist())
+
+    def get_documents(self, term_id, min_tfidf=1.0, limit=200):
+        """
+        Returns a list of (PageID)
+        Results are limited to the specified value and only pages with
+        a Tfidf larger than min_tfidf are returned. Returned results are
+        sorted in descending order by Tfidf.
+        """
+        return [(page_id, ) for (_, page_id, _) in self.get_top_documents([term_id], min_tfidf, limit)]
+
+    def get_top_documents(self, term_id_list, min_tfidf=1.0, limit=200):
+        """
+        Returns a list of (TermID, PageID, Tfidf)
+        Up to limit pages are returned per term.
+        """
+        results = []
+        for term_id in term_id_list:
+            start = self._tfidf_indptr[term_id]
+            end = min(self._tfidf_indptr[term_id + 1], start + limit)
+
+            # Postings are sorted in descending order by Tfidf
+            values = self._tfidf_values[start:end]
+            end = start + np.count_nonzero(values > min_tfidf)
+
+            results.extend(zip(
+                [term_id] * (end - start), self._tfidf_pages[start:end].tolist(), values[:end - start].tolist()
+            ))
+
+        return results
+
+    def get_term_occurrences(self, page_id_list, term_id_list):
+        """
+        Returns a list of (PageID, TermID, Counter)
+        """
+        indices, page_ids = _ranges(self._occurrence_indptr, list(set(page_id_list)))
+        term_ids = self._occurrence_terms[indices]
+
+        mask = np.in1d(term_ids, list(set(term_id_list)))
+        return zip(page_ids[mask].tolist(), term_ids[mask].tolist(), self._occurrence_counts[indices[mask]].tolist())
+
+    def get_tfidf_values(self, page_id_list, term_id_list):
+        """
+        Returns a list of (PageID, TermID, Tfidf)
+        """
+        indices, term_ids = _ranges(self._tfidf_indptr, list(set(term_id_list)))
+        page_ids = self._tfidf_pages[indices]
+
+        mask = np.in1d(page_ids, list(set(page_id_list)))
+        return zip(page_ids[mask].tolist(), term_ids[mask].tolist(), self._tfidf_values[indices[mask]].tolist())
@@ -10,10 +10,25 @@ import textparser
 from goose import Configuration, Goose
 from HTMLParser import HTMLParser
 
-from datasource import load_data_source
-from index.hashedindex import HashedIndex, load_meta
+from datasource import load_data_source, generate_manifest, compare_manifests
+from index.hashedindex import HashedIndex, load_meta, hash_parameters, build_index
 from utils import search_files
 
+
+def extract_tokens(url_path):
+    # Runs in the indexing worker processes which inherit the globals below
+    if not os.path.exists(url_path):
+        return None
+
+    with open(url_path, 'r') as html_file:
+        html_text = html_file.read()
+
+    text = unicode(_goose.extract(raw_html=html_text).cleaned_text)
+    text = _parser.unescape(text)
+
+    return textparser.word_tokenize(text, stemmer=_stemmer)
+
+
 if __name__ == '__main__':
 
     import time
@@ -36,72 +51,84 @@ if __name__ == '__main__':
     force_reindex = False
     parameters = {
         'samples': 800,
+        'seed': 0,
         'subreddit': 'python',
         'min_frequency': 2,
+        'max_frequency': None,
         'stemmer': str(_stemmer),
         'data_path': data_path,
-        'mode': 'tfidf',
+        'mode': 'tfidf',  # tfidf, count, tf, sublinear, bm25, tfidf_l2
     }
 
-    save_path = '/home/michaela/Development/%s_sr.json.bz2' % parameters['subreddit']
+    # Only these parameters affect the contents of the saved index. Changes in
+    # the selected pages are applied incrementally using the saved manifest.
+    index_parameters = {
+        'stemmer': parameters['stemmer'],
+        'data_path': parameters['data_path'],
+    }
+
+    save_path = '/home/michaela/Development/%s_sr.idx' % parameters['subreddit']
+    page_path = os.path.join(data_path, 'pages')
 
     print(parameters)
-    print('Available pages: ', len(list(search_files(os.path.join(data_path, 'pages')))))
+    print('Available pages: ', len(list(search_files(page_path))))
+
+    data = load_data_source(
+        data_path,
+        subreddit=parameters['subreddit'],
+        page_samples=parameters['samples'],
+        seed=parameters['seed'],
+    )
+    manifest = generate_manifest(page_path, data)
 
     sr_index = HashedIndex()
 
     if os.path.exists(save_path):
-        meta = load_meta(save_path, compressed=True)
+        meta = load_meta(save_path)
     else:
         meta = None
         force_reindex = True
 
-    if force_reindex or meta['parameters'] != parameters:
+    if force_reindex or meta.get('parameters-hash') != hash_parameters(index_parameters):
         print('State File Parameters out of date. Re-Indexing...')
+        added, changed, removed = list(manifest), [], []
+    else:
+        meta = sr_index.load_binary(save_path)
+        added, changed, removed = compare_manifests(meta['manifest'], manifest)
 
-        t0 = time.time()
-        sr_index.clear()
-
-        page_path = os.path.join(data_path, 'pages')
-
-        data = load_data_source(
-            data_path,
-            subreddit=parameters['subreddit'],
-            page_samples=parameters['samples'],
-        )
-
-        for rel_path, label in data.items():
-            url_path = os.path.join(page_path, rel_path)
+    print('Pages added: %d, changed: %d, removed: %d' % (len(added), len(changed), len(removed)))
 
-            if os.path.exists(url_path):
-                with open(url_path, 'r') as html_file:
-                    html_text = html_file.read()
+    if added or changed or removed:
+        t0 = time.time()
 
-                text = unicode(_goose.extract(raw_html=html_text).cleaned_text)
-                text = _parser.unescape(text)
+        # Pages which produced no tokens are in the manifest but were never indexed
+        indexed = set(sr_index.documents())
+        sr_index.remove_documents([rel_path for rel_path in changed + removed if rel_path in indexed])
 
-                for token in textparser.word_tokenize(text, stemmer=_stemmer):
-                    sr_index.add_term_occurrence(token, rel_path)
+        # Parse and tokenize the new pages using every available core
+        sr_index.merge(build_index(
+            [(rel_path, os.path.join(page_path, rel_path)) for rel_path in added + changed],
+            extract_tokens,
+        ))
 
         print('Indexing Runtime: {}'.format(time.time() - t0))
-        print('Original shape: (%d, %d)' % (len(sr_index.documents()), len(sr_index.terms())))
-
-        t0 = time.time()
-
-        sr_index.prune(min_frequency=parameters['min_frequency'], max_frequency=parameters['max_frequency'])
-        sr_index.save(save_path, compressed=True, text_class=data, parameters=parameters)
 
-        print('Pruning Runtime: {}'.format(time.time() - t0))
+        # The index is saved before pruning so that it can be updated incrementally
+        sr_index.save_binary(save_path, text_class=data, parameters=index_parameters, manifest=manifest)
     else:
         print('State File is up to date')
-        meta = sr_index.load(save_path, compressed=True)
-        data = meta['text_class']
+
+    print('Original shape: (%d, %d)' % (len(sr_index.documents()), len(sr_index.terms())))
+
+    t0 = time.time()
+    sr_index.prune(min_frequency=parameters['min_frequency'], max_frequency=parameters['max_frequency'])
+    print('Pruning Runtime: {}'.format(time.time() - t0))
 
     print()
     print('Generating feature matrix')
 
     t0 = time.time()
-    X = sr_index.generate_feature_matrix(mode=parameters['mode'])
+    X = sr_index.generate_feature_matrix(mode=parameters['mode'], sparse=True)
     sr_index.freeze()  # Prevent more terms from being added
 
     print('generation runtime = {}'.format(time.time() - t0))
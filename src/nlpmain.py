@@ -70,6 +70,8 @@ if __name__ == '__main__':
         db_params = load_db_params('wsd.db.json')
         with WikiIndex(**db_params) as wiki:
 
+            articles = []
+
             data_labels = load_data_source(parameters['data_path'], parameters['subreddit'], parameters['n_samples'])
             for index, (rel_path, label) in enumerate(data_labels.iteritems()):
                 abs_path = os.path.join(pages_path, rel_path)
@@ -81,24 +83,34 @@ if __name__ == '__main__':
                     article = goose.extract(raw_html=html_text)
                     print(article.title, '(%s)' % label)
 
-                    text = article.cleaned_text
+                    if len(article.cleaned_text) > 500:
+                        articles.append((rel_path, article))
+                    else:
+                        print('Document is of insufficient length')
 
-                    if len(text) > 500:
-                        search_results, terms, query_vector = wiki.word_concepts(text, article.title, **parameters['word_concepts'])
+                    print()
 
-                        if search_results:
-                            results[rel_path] = [(sr.page_id, sr.weight) for sr in search_results[:parameters['concepts']]]
+            # Word concepts of all pages are generated together so that shared terms are only fetched once
+            word_concepts = wiki.word_concepts_batch(
+                [extracted.cleaned_text for (_, extracted) in articles],
+                [extracted.title for (_, extracted) in articles],
+                **parameters['word_concepts']
+            )
 
-                            for search_result in search_results[:parameters['concepts']]:
-                                concepts.add(search_result.page_id)
+            for (rel_path, article), (search_results, terms, query_vector) in zip(articles, word_concepts):
+                print(article.title, '(%s)' % data_labels[rel_path])
 
-                            print(search_results[:parameters['concepts']])
-                        else:
-                            print('No word concepts returned')
-                    else:
-                        print('Document is of insufficient length')
+                if search_results:
+                    results[rel_path] = [(sr.page_id, sr.weight) for sr in search_results[:parameters['concepts']]]
 
-                    print()
+                    for search_result in search_results[:parameters['concepts']]:
+                        concepts.add(search_result.page_id)
+
+                    print(search_results[:parameters['concepts']])
+                else:
+                    print('No word concepts returned')
+
+                print()
 
         # Save the generated data to a JSON file
         with open(index_path, 'w') as fp:
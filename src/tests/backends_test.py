@@ -0,0 +1,548 @@
+import os
+import math
+import shutil
+import tempfile
+import unittest
+import threading
+
+import numpy as np
+
+from collections import Counter
+
+import wiki_setup
+
+from index.backends import SQLiteBackend, MySQLBackend, get_backend, _tsv_field
+from index.bulkwriter import BulkWriter, IDMap
+from index.wikiindex import WikiIndex, _pad, tfidf_matrix, cosine_similarity
+from textparser import tfidf
+
+
+def test_get_backend():
+    assert isinstance(get_backend('sqlite', db='test.db'), SQLiteBackend)
+    assert isinstance(get_backend(user='root', passwd='', host='localhost', db='test'), MySQLBackend)
+
+
+def test_transactional():
+    assert SQLiteBackend('test.db').transactional
+    assert MySQLBackend('root', '', 'localhost', 'test', engine='InnoDB').transactional
+    assert not MySQLBackend('root', '', 'localhost', 'test', engine='MYISAM').transactional
+
+
+def test_pad():
+    assert _pad([]) == []
+    assert _pad([1]) == [1]
+    assert _pad([1, 2, 3]) == [1, 2, 3, 3]
+    assert len(_pad(range(9))) == 16
+
+
+def test_tfidf_matrix():
+    occurrences = [(10, 1, 3), (10, 2, 1), (20, 2, 5), (30, 1, 2), (20, 9, 4)]
+    matrix = tfidf_matrix([20, 10], [2, 1], occurrences, [2, 4], 10)
+
+    assert matrix.shape == (2, 2)
+    assert matrix[0, 0] == tfidf(5, 2, 10)
+    assert matrix[0, 1] == 0
+    assert matrix[1, 0] == tfidf(1, 2, 10)
+    assert matrix[1, 1] == tfidf(3, 4, 10)
+
+    assert tfidf_matrix([10], [1], [], [2], 10).shape == (1, 1)
+
+
+def test_cosine_similarity():
+    matrix = np.asarray([[1.0, 0.0], [0.0, 0.0], [2.0, 2.0]])
+    similarity = cosine_similarity(matrix, np.asarray([1.0, 1.0]))
+
+    assert np.allclose(similarity, [math.sqrt(0.5), 0.0, 1.0])
+
+
+def test_term_ranges():
+    term_frequencies = [(1, 2), (2, 3), (4, 10), (5, 1), (7, 1)]
+    assert list(wiki_setup._term_ranges(term_frequencies, 5)) == [(1, 2), (4, 4), (5, 7)]
+    assert list(wiki_setup._term_ranges([], 5)) == []
+
+
+def test_term_chunks():
+    chunks = [np.asarray(chunk) for chunk in ([[1, 1], [1, 2], [2, 1]], [[2, 2]], [[2, 3], [3, 1]], [[4, 1]])]
+    regrouped = [chunk.tolist() for chunk in wiki_setup._term_chunks(chunks)]
+
+    assert regrouped == [[[1, 1], [1, 2]], [[2, 1], [2, 2], [2, 3]], [[3, 1]], [[4, 1]]]
+    assert list(wiki_setup._term_chunks([])) == []
+
+
+def test_sql():
+    assert SQLiteBackend('test.db').sql('{insert_ignore} INTO Terms') == 'INSERT OR IGNORE INTO Terms'
+    assert MySQLBackend('root', '', 'localhost', 'test').sql('{insert_ignore} INTO Terms') == 'INSERT IGNORE INTO Terms'
+
+
+def test_name_key():
+    assert SQLiteBackend('test.db').name_key(u'Caf\xe9') == u'Caf\xe9'
+
+    backend = MySQLBackend('root', '', 'localhost', 'test')
+    assert backend.name_key(u'Caf\xe9 ') == backend.name_key('cafe') == u'cafe'
+
+
+def test_tsv_field():
+    assert _tsv_field(None) == '\\N'
+    assert _tsv_field(10) == '10'
+    assert _tsv_field(u'a\tb\\c\n\xe9') == 'a\\tb\\\\c\\n\xc3\xa9'
+
+
+def test_id_map():
+    ids = IDMap(MySQLBackend('root', '', 'localhost', 'test').name_key, 6)
+    assert ids.get(u'Caf\xe9') == (1, True)
+    assert ids.get('Caf\xc3\xa9') == (1, False)
+    assert ids.get('CAFE') == (1, False)
+    assert ids.get('Tea') == (2, True)
+
+    ids.add('Coffee', 10)
+    assert ids.get('coffee') == (10, False)
+    assert ids.get('Milk') == (11, True)
+    assert len(ids) == 4
+
+    # Names are truncated to the length of their column
+    assert ids.get('Coffees') == (10, False)
+
+
+class SQLiteBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.backend = SQLiteBackend(os.path.join(self.path, 'wiki.db'))
+        self.connection = self.backend.connect()
+        self.cur = self.backend.cursor(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.path)
+
+    def test_wal(self):
+        self.cur.execute('PRAGMA journal_mode;')
+        assert self.cur.fetchone() == ('wal', )
+
+    def test_parameter_style(self):
+        self.cur.execute('CREATE TABLE Test (Value INT)')
+        self.cur.executemany('INSERT INTO Test VALUES (%s)', [(1, ), (2, )])
+        self.cur.execute('SELECT Value FROM Test WHERE Value = %s', (2, ))
+        assert self.cur.fetchall() == [(2, )]
+
+    def test_log(self):
+        self.cur.execute('SELECT LOG(10), LOG(0)')
+        assert self.cur.fetchone() == (math.log(10), None)
+
+    def test_get_tables(self):
+        self.cur.execute('CREATE TABLE Test (Value INT)')
+        assert self.backend.get_tables(self.cur) == set(['Test'])
+
+    def test_bulk_insert(self):
+        self.cur.execute('CREATE TABLE Test (Key INT PRIMARY KEY, Value TEXT)')
+        self.backend.bulk_insert(self.cur, 'Test', ('Key', 'Value'), [(1, 'a'), (2, 'b')])
+        self.backend.bulk_insert(self.cur, 'Test', ('Key', 'Value'), [(2, 'c'), (3, 'd')], ignore=True)
+
+        self.cur.execute('SELECT Key, Value FROM Test ORDER BY Key')
+        assert self.cur.fetchall() == [(1, 'a'), (2, 'b'), (3, 'd')]
+
+
+class BulkWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        backend = SQLiteBackend(os.path.join(self.path, 'wiki.db'))
+        self.connection = backend.connect()
+
+        wiki_setup.backend = backend
+        wiki_setup.cur = backend.cursor(self.connection)
+        wiki_setup.setup()
+
+        self.cur = wiki_setup.cur
+        self.writer = BulkWriter(backend, self.cur, max_rows=5)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.path)
+
+    def _pages(self):
+        self.cur.execute('SELECT PageID, PageName, Length, Processed FROM Pages ORDER BY PageID')
+        return self.cur.fetchall()
+
+    def test_add_page(self):
+        assert self.writer.add_page('Python', 10, {'snake': 2}, {'Guido': 1})
+        assert self.writer.add_page('Guido', 20, {'dutch': 3, 'snake': 2}, {'Snake': 2})
+        assert not self.writer.add_page('Python', 30, {'language': 2}, {})
+        self.writer.flush()
+
+        assert self._pages() == [(1, 'Python', 10, 1), (2, 'Guido', 20, 1), (3, 'Snake', 0, 0)]
+
+        self.cur.execute('SELECT TermID, TermName FROM Terms ORDER BY TermID')
+        assert self.cur.fetchall() == [(1, 'snake'), (2, 'dutch')]
+
+        self.cur.execute('SELECT TermID, PageID, Counter FROM TermOccurrences')
+        assert sorted(self.cur.fetchall()) == [(1, 1, 2), (1, 2, 2), (2, 2, 3)]
+
+        self.cur.execute('SELECT PageID, TargetPageID, Counter FROM PageLinks')
+        assert sorted(self.cur.fetchall()) == [(1, 2, 1), (2, 3, 2)]
+
+        # Pages which were linked to are updated once they are processed
+        assert self.writer.add_page('Snake', 40, {'venom': 2}, {})
+        self.writer.flush()
+        assert self._pages()[2] == (3, 'Snake', 40, 1)
+
+    def test_collation(self):
+        class CollatingBackend(SQLiteBackend):
+            name_key = MySQLBackend.name_key.__func__
+
+        writer = BulkWriter(CollatingBackend(':memory:'), self.cur)
+
+        links = {'Guido': 2, 'guido': 1, 'Guido ': 1, 'Snake': 1}
+        assert writer.add_page('Python', 10, {'snake': 2, 'Snake': 1}, links)
+        assert not writer.add_page('PYTHON', 10, {}, {})
+        writer.flush()
+
+        self.cur.execute('SELECT PageID, TargetPageID, Counter FROM PageLinks')
+        assert sorted(self.cur.fetchall()) == [(1, 2, 4), (1, 3, 1)]
+
+        self.cur.execute('SELECT TermID, PageID, Counter FROM TermOccurrences')
+        assert self.cur.fetchall() == [(1, 1, 3)]
+
+    def test_database_collation(self):
+        # Names which only the database collation considers equal, like a sharp s and an s in MySQL
+        self.cur.execute('DROP TABLE Pages')
+        self.cur.execute("""
+            CREATE TABLE Pages (
+                PageID INTEGER PRIMARY KEY,
+                PageName VARCHAR(250) UNIQUE NOT NULL COLLATE NOCASE,
+                Length SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+                Processed BOOL NOT NULL DEFAULT 0
+            )
+        """)
+
+        assert self.writer.add_page('Python', 10, {'snake': 3}, {'Guido': 2, 'Snake': 1})
+        self.writer.flush()
+
+        assert self.writer.add_page('Java', 10, {'coffee': 3}, {'guido': 1, 'GUIDO': 1, 'python': 1})
+        assert self.writer.add_page('snake', 20, {'venom': 3}, {'Python': 1})
+        assert self.writer.add_page('PYTHON', 30, {'language': 3}, {})
+        self.writer.flush()
+
+        # Linked pages are resolved to the existing page and the duplicate processed page is dropped
+        pages = dict([(page_id, (name, length, processed)) for (page_id, name, length, processed) in self._pages()])
+        assert sorted(pages.values()) == [('Guido', 0, 0), ('Java', 10, 1), ('Python', 10, 1), ('snake', 20, 1)]
+
+        self.cur.execute('SELECT PageID, TargetPageID, Counter FROM PageLinks')
+        assert sorted([(pages[p][0], pages[t][0], c) for (p, t, c) in self.cur.fetchall()]) == [
+            ('Java', 'Guido', 2), ('Java', 'Python', 1), ('Python', 'Guido', 2), ('Python', 'snake', 1), ('snake', 'Python', 1)
+        ]
+
+        self.cur.execute('SELECT TermName, PageID, Counter FROM TermOccurrences JOIN Terms USING (TermID)')
+        assert sorted([(t, pages[p][0], c) for (t, p, c) in self.cur.fetchall()]) == [
+            ('coffee', 'Java', 3), ('snake', 'Python', 3), ('venom', 'snake', 3)
+        ]
+
+        # Names are resolved to the existing pages from then on
+        names = dict([(name, page_id) for (page_id, (name, length, processed)) in pages.items()])
+        assert self.writer.page_ids.get('PYTHON') == (names['Python'], False)
+        assert self.writer.page_ids.get('GUIDO') == (names['Guido'], False)
+
+    def test_truncated_names(self):
+        assert self.writer.add_page('a' * 300, 10, {'b' * 50: 2, 'b' * 45: 2}, {'a' * 260: 1})
+        assert not self.writer.add_page('a' * 250 + 'c', 10, {}, {})
+        self.writer.flush()
+
+        assert self._pages() == [(1, 'a' * 250, 10, 1)]
+
+        self.cur.execute('SELECT TermID, TermName FROM Terms')
+        assert self.cur.fetchall() == [(1, 'b' * 40)]
+
+        self.cur.execute('SELECT PageID, TargetPageID, Counter FROM PageLinks')
+        assert self.cur.fetchall() == [(1, 1, 1)]
+
+    def test_load(self):
+        self.writer.add_page('Python', 10, {'snake': 2}, {'Snake': 1})
+        self.writer.flush()
+
+        writer = BulkWriter(self.writer.backend, self.cur)
+        writer.load()
+
+        assert writer.is_processed(1) and not writer.is_processed(2)
+        assert not writer.add_page('Python', 10, {'snake': 2}, {})
+        assert writer.add_page('Guido', 20, {'snake': 2, 'dutch': 2}, {'Snake': 1})
+        writer.flush()
+
+        assert self._pages() == [(1, 'Python', 10, 1), (2, 'Snake', 0, 0), (3, 'Guido', 20, 1)]
+
+        # Counters of the terms written before continuing are carried over
+        assert writer.term_count(1) == 4
+        assert writer.rare_terms() == [2]
+
+        self.cur.execute('SELECT TermID, TermName FROM Terms ORDER BY TermID')
+        assert self.cur.fetchall() == [(1, 'snake'), (2, 'dutch')]
+
+        self.cur.execute('SELECT TermID, PageID, Counter FROM TermOccurrences')
+        assert sorted(self.cur.fetchall()) == [(1, 1, 2), (1, 3, 2), (2, 3, 2)]
+
+    def test_continue_interrupted_flush(self):
+        self.writer.add_page('Python', 10, {'snake': 2}, {'Snake': 1})
+        self.writer.flush()
+        self.writer.add_page('Guido', 20, {'snake': 2, 'dutch': 3}, {'Python': 2})
+        self.writer.flush()
+
+        def tables():
+            self.cur.execute('SELECT TermID, PageID, Counter FROM TermOccurrences')
+            occurrences = sorted(self.cur.fetchall())
+            self.cur.execute('SELECT PageID, TargetPageID, Counter FROM PageLinks')
+            return self._pages(), occurrences, sorted(self.cur.fetchall())
+
+        expected = tables()
+
+        # A flush interrupted on an engine without transactions leaves a page with some of its rows
+        self.cur.execute('UPDATE Pages SET Processed = 0 WHERE PageID = 3')
+        self.cur.execute('DELETE FROM PageLinks WHERE PageID = 3')
+
+        writer = BulkWriter(self.writer.backend, self.cur)
+        writer.load()
+
+        # Occurrences of pages which are not marked as processed are not counted
+        assert writer.term_count(1) == 2
+
+        assert writer.add_page('Guido', 20, {'snake': 2, 'dutch': 3}, {'Python': 2})
+        writer.flush()
+
+        assert tables() == expected
+        assert writer.term_count(1) == 4
+
+    def test_prune(self):
+        self.writer.add_page('Python', 10, {'rare': 2, 'common': 2, 'frequent': 5}, {})
+        assert self.writer.rare_terms() == [1, 2]
+
+        self.writer.add_page('Snake', 10, {'common': 2}, {})
+        assert self.writer.rare_terms() == [1]
+
+        wiki_setup.writer = self.writer
+        wiki_setup.prune()
+
+        self.cur.execute('SELECT TermName FROM Terms ORDER BY TermName')
+        assert self.cur.fetchall() == [('common', ), ('frequent', )]
+
+        self.cur.execute('SELECT PageID, Counter FROM TermOccurrences ORDER BY PageID, Counter')
+        assert self.cur.fetchall() == [(1, 2), (1, 5), (2, 2)]
+
+
+def _page_text(words):
+    # Pages need at least MIN_PAGE_LENGTH terms to be indexed
+    return ' '.join(words * (wiki_setup.MIN_PAGE_LENGTH // len(words) + 1))
+
+
+class SQLiteWikiIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db = os.path.join(self.path, 'wiki.db')
+
+        backend = SQLiteBackend(self.db)
+        connection = backend.connect()
+
+        wiki_setup.backend = backend
+        wiki_setup.cur = backend.cursor(connection)
+        wiki_setup.setup()
+        wiki_setup.writer = BulkWriter(backend, wiki_setup.cur, min_term_count=wiki_setup.MIN_TERM_COUNT)
+
+        pages = [
+            ('Python', _page_text(['python', 'python', 'language', 'programming', 'guido']), {'Guido': 2}),
+            ('Snake', _page_text(['snake', 'snake', 'python', 'reptile', 'venom']), {'Python': 1, 'Reptile': 1}),
+            ('Guido', _page_text(['guido', 'guido', 'python', 'dutch', 'programming']), {'Python': 3}),
+        ]
+        for title, text, links in pages:
+            wiki_setup.add_page_index(text.split(), title, Counter(links))
+
+        wiki_setup.prune()
+        wiki_setup.post_setup()
+        connection.commit()
+        connection.close()
+
+        self.wiki = WikiIndex(db=self.db, backend='sqlite')
+
+    def tearDown(self):
+        self.wiki.close()
+        shutil.rmtree(self.path)
+
+    def test_supports_table(self):
+        assert self.wiki.supports_table('TfidfTotals')
+        assert self.wiki.supports_table('DocumentFrequencies')
+
+    def test_corpus_size(self):
+        assert self.wiki.get_corpus_size() == 3
+
+    def test_page_links(self):
+        page_ids = dict(self.wiki.get_page_ids(['Python', 'Guido', 'Reptile']))
+        assert 'Reptile' in page_ids
+
+        links = self.wiki.get_page_links([page_ids['Python']])
+        assert links == [(page_ids['Python'], page_ids['Guido'], 2)]
+
+    def test_link_graph(self):
+        page_ids = [b for (a, b) in self.wiki.get_page_ids(['Python', 'Snake', 'Guido', 'Reptile'])]
+        expected = self.wiki.generate_link_matrix(page_ids)
+
+        assert self.wiki.load_link_graph() == 4
+        assert (self.wiki.generate_link_matrix(page_ids) == expected).all()
+        assert self.wiki.generate_link_matrix(page_ids, sparse=True).nnz == 4
+
+    def test_term_data(self):
+        term_data = dict((a, c) for (a, b, c) in self.wiki.get_term_data(['python', 'guido', 'missing']))
+        assert term_data == {'python': 3, 'guido': 2}
+
+    def test_top_documents(self):
+        term_ids = dict(self.wiki.get_term_ids(['guido', 'snake']))
+        results = self.wiki.get_top_documents(term_ids.values(), min_tfidf=0.0)
+
+        pages = dict(self.wiki.get_page_names([b for (a, b, c) in results]))
+        assert sorted((a, pages[b]) for (a, b, c) in results) == sorted([
+            (term_ids['guido'], 'Guido'), (term_ids['guido'], 'Python'), (term_ids['snake'], 'Snake')
+        ])
+
+        # Results for each term are ordered by descending tfidf
+        guido = [c for (a, b, c) in results if a == term_ids['guido']]
+        assert guido == sorted(guido, reverse=True)
+
+    def test_top_postings(self):
+        assert self.wiki.supports_table('TopPostings')
+
+        term_ids = [b for (a, b) in self.wiki.get_term_ids(['python', 'guido', 'snake', 'programming'])]
+        for min_tfidf, limit in ((0.0, 200), (0.0, 1), (0.5, 2), (100.0, 200)):
+            expected = sorted(self.wiki._top_documents(term_ids, min_tfidf, limit))
+            results = sorted(self.wiki.get_top_documents(term_ids, min_tfidf, limit))
+
+            assert [(a, b) for (a, b, c) in results] == [(a, b) for (a, b, c) in expected]
+            assert np.allclose([c for (a, b, c) in results], [c for (a, b, c) in expected])
+
+        (guido_id, ) = [b for (a, b) in self.wiki.get_term_ids(['guido'])]
+        tfidf_values = [c for (a, b, c) in self.wiki.get_top_documents([guido_id], min_tfidf=0.0)]
+        assert len(tfidf_values) == 2
+        assert tfidf_values == sorted(tfidf_values, reverse=True)
+
+        assert self.wiki.get_documents(guido_id, min_tfidf=0.0, limit=1) == \
+            [(b, ) for (a, b, c) in self.wiki._top_documents([guido_id], 0.0, 1)]
+
+    def test_truncated_top_postings(self):
+        connection = self.wiki.backend.connect()
+        wiki_setup.cur = self.wiki.backend.cursor(connection)
+
+        # Keep a single page per term so that longer results are read from TfidfValues
+        top_postings, wiki_setup.TOP_POSTINGS = wiki_setup.TOP_POSTINGS, 1
+        batch, wiki_setup.TOP_POSTINGS_BATCH = wiki_setup.TOP_POSTINGS_BATCH, 2
+        try:
+            wiki_setup.top_postings_setup()
+            connection.commit()
+        finally:
+            wiki_setup.TOP_POSTINGS = top_postings
+            wiki_setup.TOP_POSTINGS_BATCH = batch
+            connection.close()
+
+        # All three pages of python have a Tfidf of 0
+        (python_id, ) = [b for (a, b) in self.wiki.get_term_ids(['python'])]
+        assert len(self.wiki.get_top_documents([python_id], -1.0, 1)) == 1
+
+        for limit in (2, 3, 4):
+            results = self.wiki.get_top_documents([python_id], -1.0, limit)
+            assert sorted(results) == sorted(self.wiki._top_documents([python_id], -1.0, limit))
+            assert len(results) == min(limit, 3)
+
+    def _post_setup_tables(self, connection):
+        cur = connection.cursor()
+        tables = {}
+        for table in ('DocumentFrequencies', 'TfidfValues', 'TfidfTotals', 'TopPostings'):
+            cur.execute('SELECT * FROM %s' % table)
+            tables[table] = sorted(cur.fetchall())
+
+        return tables
+
+    def test_streamed_post_setup(self):
+        connection = self.wiki.backend.connect()
+        wiki_setup.cur = self.wiki.backend.cursor(connection)
+
+        expected = self._post_setup_tables(connection)
+
+        batch, wiki_setup.STREAMED_BATCH = wiki_setup.STREAMED_BATCH, 2
+        try:
+            wiki_setup.post_setup(streamed=True)
+            connection.commit()
+        finally:
+            wiki_setup.STREAMED_BATCH = batch
+
+        tables = self._post_setup_tables(connection)
+        connection.close()
+
+        assert tables['DocumentFrequencies'] == expected['DocumentFrequencies']
+        assert [(a, b) for (a, b, c) in tables['TfidfValues']] == [(a, b) for (a, b, c) in expected['TfidfValues']]
+        assert np.allclose([c for (a, b, c) in tables['TfidfValues']], [c for (a, b, c) in expected['TfidfValues']])
+        assert [a for (a, b) in tables['TfidfTotals']] == [a for (a, b) in expected['TfidfTotals']]
+        assert np.allclose([b for (a, b) in tables['TfidfTotals']], [b for (a, b) in expected['TfidfTotals']])
+        assert [(a, b) for (a, b, c) in tables['TopPostings']] == [(a, b) for (a, b, c) in expected['TopPostings']]
+
+        term_ids = [b for (a, b) in self.wiki.get_term_ids(['python', 'guido', 'snake'])]
+        results = self.wiki.get_top_documents(term_ids, min_tfidf=0.0)
+        assert sorted((a, b) for (a, b, c) in results) == \
+            sorted((a, b) for (a, b, c) in self.wiki._top_documents(term_ids, 0.0, 200))
+
+    def test_word_concepts(self):
+        results, terms, query_vector = self.wiki.word_concepts('snake venom reptile', min_tfidf=0.0)
+        assert results[0].page_name == 'Snake'
+
+        for second_order in ('augmented', 'original', 'pagerank', 'none'):
+            results = self.wiki.word_concepts('snake venom reptile', min_tfidf=0.0, second_order=second_order)[0]
+            weights = [sr.weight for sr in results]
+            assert weights == sorted(weights, reverse=True)
+
+    def test_word_concepts_batch(self):
+        texts = ['snake venom reptile', 'guido programming language', 'the', 'python snake']
+        titles = [None, 'Python', None, 'Reptile']
+
+        batch = self.wiki.word_concepts_batch(texts, titles, min_tfidf=0.0)
+        assert len(batch) == len(texts)
+        assert batch[2] == (None, None, None)
+
+        for text, title, (results, terms, query_vector) in zip(texts, titles, batch):
+            expected = self.wiki.word_concepts(text, title, min_tfidf=0.0)
+            if expected[0] is None:
+                continue
+
+            assert [(sr.page_id, sr.weight) for sr in results] == [(sr.page_id, sr.weight) for sr in expected[0]]
+            assert terms == expected[1]
+            assert query_vector.tolist() == expected[2].tolist()
+
+        assert self.wiki.word_concepts_batch([]) == []
+
+    def test_chunked(self):
+        wiki = WikiIndex(db=self.db, backend='sqlite', chunk_size=2, cache_size=0)
+        names = ['python', 'guido', 'snake', 'language', 'missing']
+
+        assert sorted(wiki.get_term_data(names)) == sorted(self.wiki.get_term_data(names))
+
+        term_ids = [b for (a, b) in wiki.get_term_ids(names)]
+        assert sorted(wiki.get_top_documents(term_ids, min_tfidf=0.0)) == \
+            sorted(self.wiki.get_top_documents(term_ids, min_tfidf=0.0))
+
+        page_ids = [b for (a, b) in wiki.get_page_ids(['Python', 'Snake', 'Guido'])]
+        assert sorted(wiki.get_term_occurrences(page_ids, term_ids)) == \
+            sorted(self.wiki.get_term_occurrences(page_ids, term_ids))
+
+        wiki.close()
+
+    def test_threads(self):
+        expected = self.wiki.word_concepts('snake venom reptile', min_tfidf=0.0)[0]
+        self.wiki.clear_caches()
+
+        results = []
+
+        def worker():
+            for _ in xrange(5):
+                results.append(self.wiki.word_concepts('snake venom reptile', min_tfidf=0.0)[0])
+
+        threads = [threading.Thread(target=worker) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(results) == 20
+        for result in results:
+            assert [sr.page_id for sr in result] == [sr.page_id for sr in expected]
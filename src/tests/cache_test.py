@@ -0,0 +1,63 @@
+import unittest
+
+from index.cache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LRUCache(maxsize=3)
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.put('c', 3)
+
+    def test_get(self):
+        assert self.cache.get('a') == 1
+        assert self.cache.get('z') is None
+        assert self.cache.get('z', 0) == 0
+        assert self.cache.hits == 1
+        assert self.cache.misses == 2
+
+    def test_eviction(self):
+        self.cache.put('d', 4)
+        assert len(self.cache) == 3
+        assert 'a' not in self.cache
+        assert 'd' in self.cache
+
+    def test_eviction_least_recently_used(self):
+        # Reading 'a' makes 'b' the least recently used entry
+        self.cache.get('a')
+        self.cache.put('d', 4)
+        assert 'a' in self.cache
+        assert 'b' not in self.cache
+
+    def test_put_existing(self):
+        self.cache.put('a', 10)
+        assert len(self.cache) == 3
+        assert self.cache.get('a') == 10
+
+    def test_none_values(self):
+        self.cache.put('n', None)
+        found, missing = self.cache.lookup(['n', 'x'])
+        assert found == {'n': None}
+        assert missing == ['x']
+
+    def test_lookup(self):
+        found, missing = self.cache.lookup(['a', 'c', 'x', 'y'])
+        assert found == {'a': 1, 'c': 3}
+        assert missing == ['x', 'y']
+        assert self.cache.hits == 2
+        assert self.cache.misses == 2
+
+    def test_zero_size(self):
+        cache = LRUCache(maxsize=0)
+        cache.put('a', 1)
+        assert len(cache) == 0
+        assert 'a' not in cache
+
+    def test_clear(self):
+        self.cache.get('a')
+        self.cache.clear()
+        assert len(self.cache) == 0
+        assert self.cache.hits == 0
+        assert self.cache.misses == 0
@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 from datasource import *
 
 from url import Url
@@ -49,3 +52,24 @@ def test_get_path_from_url_with_querystring():
     assert get_path_from_url(
         '', Url('http://youtube.com/watch?v=ghsu3u43')
     ) == 'youtube.com/watch?v=ghsu3u43%$%'
+
+
+def test_generate_manifest():
+    pages_dir = tempfile.mkdtemp()
+    for name, content in (('a%$%', 'Page A'), ('b%$%', 'Page B')):
+        with open(os.path.join(pages_dir, name), 'w') as fp:
+            fp.write(content)
+
+    manifest = generate_manifest(pages_dir, ['a%$%', 'b%$%', 'missing%$%'])
+
+    assert sorted(manifest.keys()) == ['a%$%', 'b%$%']
+    assert manifest['a%$%'] != manifest['b%$%']
+    assert manifest == generate_manifest(pages_dir, ['a%$%', 'b%$%'])
+
+
+def test_compare_manifests():
+    old_manifest = {'a': '1', 'b': '2', 'c': '3'}
+    new_manifest = {'a': '1', 'b': '4', 'd': '5'}
+
+    assert compare_manifests(old_manifest, new_manifest) == (['d'], ['b'], ['c'])
+    assert compare_manifests(new_manifest, new_manifest) == ([], [], [])
@@ -1,12 +1,19 @@
 from __future__ import division
 
+import os
 import unittest
 import tempfile
+import numpy as np
 
 from index.hashedindex import *
 from testutils import unordered_list_cmp
 
 
+def split_tokens(text):
+    # Module level tokenizer which can be passed to worker processes
+    return text.split() if text else None
+
+
 class HashedIndexTest(unittest.TestCase):
     # Note that generate_document_vector and generate_feature_matrix tests
     # are considered interrelated and test cases are therefore not repeated
@@ -328,3 +335,406 @@ class HashedIndexTest(unittest.TestCase):
         assert meta['documents'] == len(self.index.documents())
         assert meta['terms'] == len(self.index.terms())
         assert meta['custom'] == {'sometest': [1, 2, 4, 8]}
+
+    def test_load_meta_stale(self):
+        path = tempfile.mktemp()
+        self.index.save(path, comment='Old')
+
+        # The index is replaced without updating its meta data file
+        with open(path + META_EXTENSION) as fp:
+            meta_file = fp.read()
+
+        self.index.add_document('document3.txt', ['new'])
+        self.index.save(path, comment='New')
+
+        with open(path + META_EXTENSION, 'w') as fp:
+            fp.write(meta_file)
+
+        meta = load_meta(path)
+        assert meta['comment'] == 'New'
+        assert meta['documents'] == 3
+
+    def test_generate_sparse_feature_matrix(self):
+        for mode in ('tfidf', 'count', 'tf'):
+            dense = self.index.generate_feature_matrix(mode=mode)
+            matrix = self.index.generate_feature_matrix(mode=mode, sparse=True)
+
+            assert matrix.format == 'csr'
+            assert matrix.shape == dense.shape
+            assert matrix.nnz == 4
+            assert (matrix.toarray() == dense).all()
+
+    def test_generate_sparse_feature_matrix_invalid(self):
+        self.assertRaises(ValueError, self.index.generate_feature_matrix, mode='invalid', sparse=True)
+
+    def test_generate_sparse_feature_matrix_empty(self):
+        matrix = HashedIndex().generate_sparse_feature_matrix()
+        assert matrix.shape == (0, 0)
+        assert matrix.nnz == 0
+
+    def test_generate_document_vector_matches_feature_matrix(self):
+        instances = self.index.documents()
+
+        for mode in ('tfidf', 'count', 'tf', 'sublinear', 'bm25', 'tfidf_l2'):
+            matrix = self.index.generate_feature_matrix(mode=mode)
+            for doc in instances:
+                vector = self.index.generate_document_vector(doc, mode=mode)
+                assert np.allclose(vector, matrix[instances.index(doc)])
+
+    def test_generate_document_vector_after_update(self):
+        self.index.generate_document_vector('document1.txt', mode='count')
+
+        # Document vectors reflect changes made after a previous call
+        self.index.add_document('document3.txt', ['phone', 'malta'])
+        self.index.add_term_occurrence('phone', 'document1.txt')
+        self.index.prune(min_frequency=2)
+
+        features = self.index.terms()
+        vector = self.index.generate_document_vector('document1.txt', mode='count')
+
+        assert vector.shape == (len(features),)
+        assert vector[features.index('malta')] == 5.0
+        assert vector[features.index('phone')] == 1.0
+        assert np.allclose(
+            self.index.generate_document_vector('document3.txt'),
+            self.index.generate_feature_matrix()[self.index.documents().index('document3.txt')]
+        )
+
+    def test_get_weighting_engine(self):
+        engine = self.index.get_weighting_engine()
+
+        assert engine.shape == (2, 3)
+        assert (engine.generate_matrix('count') == self.index.generate_feature_matrix(mode='count')).all()
+        assert (engine.generate_matrix('tfidf') == self.index.generate_feature_matrix(mode='tfidf')).all()
+
+    def test_get_term_id(self):
+        assert self.index.get_term_id('word') == 0
+        assert self.index.get_term_id('malta') == 1
+        assert self.index.get_term_id('phone') == 2
+        assert self.index.term_vocabulary().get_name(1) == 'malta'
+
+        self.assertRaises(IndexError, self.index.get_term_id, 'doesnotexist')
+
+    def test_get_document_id(self):
+        assert self.index.get_document_id('document1.txt') == 0
+        assert self.index.get_document_id('document2.txt') == 1
+        assert self.index.document_vocabulary().get_name(1) == 'document2.txt'
+
+        self.assertRaises(IndexError, self.index.get_document_id, 'doesnotexist.txt')
+
+    def test_add_term_occurrence_out_of_order(self):
+        self.index.add_term_occurrence('word', 'document3.txt')
+        self.index.add_term_occurrence('word', 'document1.txt')
+        self.index.add_term_occurrence('phone', 'document1.txt')
+
+        assert self.index.get_term_frequency('word', 'document1.txt') == 4
+        assert self.index.get_term_frequency('word', 'document3.txt') == 1
+        assert self.index.get_term_frequency('phone', 'document1.txt') == 1
+        assert self.index['phone'] == {'document1.txt': 1, 'document2.txt': 4}
+
+    def test_get_postings_arrays(self):
+        term_ids, doc_ids, counts = self.index.get_postings_arrays()
+
+        assert term_ids.tolist() == [0, 0, 1, 2]
+        assert doc_ids.tolist() == [0, 1, 0, 1]
+        assert counts.tolist() == [3, 2, 5, 4]
+
+    def test_prune_compacts_term_ids(self):
+        self.index.prune(min_frequency=2)
+
+        assert self.index.terms() == ['word']
+        assert self.index.get_term_id('word') == 0
+        assert self.index.get_document_frequencies().tolist() == [2]
+        assert self.index.generate_feature_matrix(mode='count').shape == (2, 1)
+
+    def test_add_document(self):
+        index2 = HashedIndex()
+        index2.add_document('document1.txt', ['word'] * 3 + ['malta'] * 5)
+        index2.add_document('document2.txt', ['phone', 'word', 'phone', 'phone', 'word', 'phone'])
+
+        assert index2 == self.index
+        assert index2.get_document_length('document1.txt') == 8
+        assert index2.get_term_frequency('phone', 'document2.txt') == 4
+
+    def test_add_document_existing(self):
+        self.index.add_document('document1.txt', ['word', 'phone'])
+
+        assert self.index.get_term_frequency('word', 'document1.txt') == 4
+        assert self.index.get_term_frequency('phone', 'document1.txt') == 1
+        assert self.index.get_document_length('document1.txt') == 10
+
+    def test_add_document_frozen(self):
+        self.index.freeze()
+        self.index.add_document('document3.txt', ['word', 'myword', 'myword'])
+
+        assert 'myword' not in self.index
+        assert 'document3.txt' in self.index.documents()
+        assert self.index.get_term_frequency('word', 'document3.txt') == 1
+        assert self.index.get_document_length('document3.txt') == 1
+
+    def test_add_document_empty(self):
+        self.index.add_document('document3.txt', [])
+        self.index.add_document('document3.txt', iter([]))
+
+        # Documents without tokens are not added, as with add_term_occurrence
+        assert 'document3.txt' not in self.index.documents()
+        assert self.index.generate_feature_matrix().shape == (2, 3)
+
+    def test_add_documents(self):
+        index2 = HashedIndex()
+        index2.add_documents([
+            ('document1.txt', ['word'] * 3 + ['malta'] * 5),
+            ('document2.txt', ['word'] * 2 + ['phone'] * 4),
+        ])
+
+        assert index2 == self.index
+
+    def test_save_load_binary(self):
+        path = tempfile.mktemp()
+        self.index.save_binary(path)
+
+        for mmap in (True, False):
+            index2 = HashedIndex()
+            index2.load_binary(path, mmap=mmap)
+
+            assert self.index == index2
+            assert index2.terms() == self.index.terms()
+            assert index2.documents() == self.index.documents()
+            assert index2.get_term_frequency('malta', 'document1.txt') == 5
+            assert index2.get_document_length('document2.txt') == 6
+            assert (index2.generate_feature_matrix() == self.index.generate_feature_matrix()).all()
+
+    def test_save_load_binary_modify(self):
+        path = tempfile.mktemp()
+        self.index.save_binary(path)
+
+        index2 = HashedIndex()
+        index2.load_binary(path)
+
+        index2.add_term_occurrence('word', 'document1.txt')
+        index2.add_document('document3.txt', ['phone', 'new'])
+        index2.prune(min_frequency=2)
+
+        self.index.add_term_occurrence('word', 'document1.txt')
+        self.index.add_document('document3.txt', ['phone', 'new'])
+        self.index.prune(min_frequency=2)
+
+        assert self.index == index2
+        assert index2.get_term_frequency('word', 'document1.txt') == 4
+
+    def test_save_load_binary_empty(self):
+        path = tempfile.mktemp()
+        HashedIndex().save_binary(path)
+
+        index2 = HashedIndex()
+        index2.load_binary(path)
+
+        assert index2.terms() == []
+        assert index2.documents() == []
+
+    def test_save_load_binary_meta(self):
+        path = tempfile.mktemp()
+        self.index.save_binary(path, comment='Testing Comment', custom={'sometest': [1, 2, 3]})
+
+        meta = HashedIndex().load_binary(path)
+
+        assert meta['comment'] == 'Testing Comment'
+        assert meta['terms'] == 3
+        assert meta['custom'] == {'sometest': [1, 2, 3]}
+
+    def test_load_binary_invalid(self):
+        path = tempfile.mktemp()
+        self.index.save(path)
+
+        self.assertRaises(IOError, HashedIndex().load_binary, path)
+
+    def test_convert_json_index(self):
+        json_path = tempfile.mktemp()
+        binary_path = tempfile.mktemp()
+        self.index.save(json_path, compressed=True, comment='Data')
+
+        convert_json_index(json_path, binary_path, compressed=True)
+
+        index2 = HashedIndex()
+        meta = index2.load_binary(binary_path)
+
+        assert self.index == index2
+        assert meta['comment'] == 'Data'
+
+    def test_load_binary_meta(self):
+        path = tempfile.mktemp()
+        self.index.save_binary(path, comment='Data')
+
+        meta = load_binary_meta(path)
+
+        assert meta['comment'] == 'Data'
+        assert meta['documents'] == 2
+
+    def test_load_meta_binary(self):
+        path = tempfile.mktemp()
+        self.index.save_binary(path, comment='Data', parameters={'mode': 'tfidf'})
+
+        meta = load_meta(path)
+
+        assert meta['comment'] == 'Data'
+        assert meta['parameters'] == {'mode': 'tfidf'}
+        assert meta['parameters-hash'] == hash_parameters({'mode': 'tfidf'})
+
+    def test_load_meta_compressed(self):
+        path = tempfile.mktemp()
+        self.index.save(path, compressed=True, comment='Data')
+
+        assert os.path.exists(path + META_EXTENSION)
+        assert load_meta(path, compressed=True)['comment'] == 'Data'
+
+    def test_load_meta_without_meta_file(self):
+        path = tempfile.mktemp()
+        self.index.save(path, comment='Data')
+        os.remove(path + META_EXTENSION)
+
+        assert load_meta(path)['comment'] == 'Data'
+
+    def test_hash_parameters(self):
+        assert hash_parameters({'a': 1, 'b': [1, 2]}) == hash_parameters({'b': [1, 2], 'a': 1})
+        assert hash_parameters({'a': 1}) != hash_parameters({'a': 2})
+
+    def test_prune_max_frequency(self):
+        self.index.add_document('document3.txt', ['phone', 'text'])
+
+        self.index.prune(min_frequency=1, max_frequency=1)
+        assert unordered_list_cmp(self.index.terms(), ['malta', 'text'])
+
+    def test_prune_max_frequency_proportion(self):
+        self.index.prune(min_frequency=1, max_frequency=0.5)
+        assert unordered_list_cmp(self.index.terms(), ['malta', 'phone'])
+
+    def test_prune_max_terms(self):
+        self.index.add_document('document3.txt', ['phone', 'text'])
+
+        self.index.prune(min_frequency=1, max_terms=2)
+        assert self.index.terms() == ['word', 'phone']
+        assert self.index.get_term_frequency('phone', 'document2.txt') == 4
+
+    def test_prune_stop_terms(self):
+        self.index.prune(min_frequency=1, stop_terms=['word', 'doesnotexist'])
+        assert self.index.terms() == ['malta', 'phone']
+
+        # Document lengths are not affected by pruning
+        assert self.index.get_document_length('document1.txt') == 8
+
+    def test_merge(self):
+        index1 = HashedIndex()
+        index1.add_document('document1.txt', ['word'] * 3 + ['malta'] * 5)
+
+        index2 = HashedIndex()
+        index2.add_document('document2.txt', ['word'] * 2 + ['phone'] * 4)
+
+        index1.merge(index2)
+
+        assert index1 == self.index
+        assert index1.terms() == self.index.terms()
+        assert index1.documents() == self.index.documents()
+
+    def test_merge_overlapping(self):
+        index2 = HashedIndex()
+        index2.add_document('document3.txt', ['phone'])
+        index2.add_document('document1.txt', ['word', 'phone', 'text'])
+
+        self.index.merge(index2)
+
+        assert self.index.get_term_frequency('word', 'document1.txt') == 4
+        assert self.index.get_term_frequency('phone', 'document1.txt') == 1
+        assert self.index.get_term_frequency('phone', 'document3.txt') == 1
+        assert self.index.get_document_length('document1.txt') == 11
+        assert self.index['phone'] == {'document1.txt': 1, 'document2.txt': 4, 'document3.txt': 1}
+
+    def test_merge_frozen(self):
+        index2 = HashedIndex()
+        index2.add_document('document3.txt', ['phone', 'myword', 'myword'])
+
+        self.index.freeze()
+        self.index.merge(index2)
+
+        assert 'myword' not in self.index
+        assert self.index.get_document_length('document3.txt') == 1
+
+    def test_build_index(self):
+        documents = [
+            ('document%d.txt' % i, ' '.join(['word%d' % (j % (i + 2)) for j in xrange(20)]))
+            for i in xrange(10)
+        ]
+        documents.append(('empty.txt', None))
+
+        serial = HashedIndex()
+        for document, text in documents:
+            if text is not None:
+                serial.add_document(document, text.split())
+
+        for processes, shards in ((1, 1), (1, 3), (2, None), (3, 4)):
+            index = build_index(documents, split_tokens, processes=processes, shards=shards)
+
+            assert index == serial
+            assert index.terms() == serial.terms()
+            assert index.documents() == serial.documents()
+            assert 'empty.txt' not in index.documents()
+
+    def test_remove_document(self):
+        self.index.add_document('document3.txt', ['phone', 'text'])
+        self.index.remove_document('document1.txt')
+
+        assert self.index.documents() == ['document2.txt', 'document3.txt']
+        assert self.index.get_document_id('document3.txt') == 1
+        assert 'malta' not in self.index
+        assert self.index['word'] == {'document2.txt': 2}
+        assert self.index['phone'] == {'document2.txt': 4, 'document3.txt': 1}
+        assert self.index.get_document_length('document3.txt') == 2
+
+        expected = HashedIndex()
+        expected.add_document('document2.txt', ['word'] * 2 + ['phone'] * 4)
+        expected.add_document('document3.txt', ['phone', 'text'])
+
+        assert self.index == expected
+
+    def test_remove_documents(self):
+        self.index.remove_documents(['document1.txt', 'document2.txt'])
+
+        assert self.index.documents() == []
+        assert self.index.terms() == []
+
+    def test_remove_document_exceptions(self):
+        self.assertRaises(IndexError, self.index.remove_document, 'doesnotexist.txt')
+
+    def test_remove_document_binary(self):
+        path = tempfile.mktemp()
+        self.index.save_binary(path)
+
+        index2 = HashedIndex()
+        index2.load_binary(path)
+        index2.remove_document('document2.txt')
+        self.index.remove_document('document2.txt')
+
+        assert index2 == self.index
+
+        # Saving over the memory mapped file should not affect the loaded index
+        index2.save_binary(path)
+        assert index2 == self.index
+
+    def test_update_document(self):
+        self.index.update_document('document1.txt', ['word', 'text', 'text'])
+
+        assert self.index.documents() == ['document1.txt', 'document2.txt']
+        assert 'malta' not in self.index
+        assert self.index.get_term_frequency('word', 'document1.txt') == 1
+        assert self.index.get_term_frequency('text', 'document1.txt') == 2
+        assert self.index.get_document_length('document1.txt') == 3
+
+    def test_update_document_same_terms(self):
+        self.index.update_document('document2.txt', ['phone'])
+
+        assert self.index.terms() == ['word', 'malta', 'phone']
+        assert self.index['phone'] == {'document2.txt': 1}
+        assert self.index['word'] == {'document1.txt': 3}
+
+    def test_update_document_new(self):
+        self.index.update_document('document3.txt', ['phone'])
+        assert self.index.get_term_frequency('phone', 'document3.txt') == 1
@@ -0,0 +1,80 @@
+import numpy as np
+
+from index.linkgraph import PageLinkGraph, build_link_matrix, personalised_pagerank, second_order_ranking
+
+LINKS = [(1, 2, 3), (2, 1, 1), (2, 3, 2), (3, 1, 1), (4, 1, 5)]
+
+
+def _link_arrays(links):
+    return [np.asarray(column) for column in zip(*links)]
+
+
+def test_build_link_matrix():
+    sources, targets, counts = _link_arrays(LINKS)
+
+    matrix = build_link_matrix([1, 2, 3], sources, targets, counts)
+    assert matrix.toarray().tolist() == [[0, 1, 1], [3, 0, 0], [0, 2, 0]]
+
+    matrix = build_link_matrix([3, 1], sources, targets, counts, mode='single')
+    assert matrix.toarray().tolist() == [[0, 0], [1, 0]]
+
+    matrix = build_link_matrix([1, 2], sources, targets, counts, mode='log')
+    assert np.allclose(matrix.toarray(), [[0, 1], [np.log(3) + 1, 0]])
+
+
+def test_build_link_matrix_page_lists():
+    sources, targets, counts = _link_arrays(LINKS)
+
+    # Links within the same list are ignored, others are counted once per list
+    page_id_lists = [[1, 2], [2, 3], [1, 3], [2]]
+    matrix = build_link_matrix([1, 2, 3], sources, targets, counts, page_id_lists)
+    assert matrix.toarray().tolist() == [[0, 2, 1], [3, 0, 0], [0, 4, 0]]
+
+    matrix = build_link_matrix([1, 2, 3], sources, targets, counts, page_id_lists, mode='single')
+    assert matrix.toarray().tolist() == [[0, 1, 1], [1, 0, 0], [0, 1, 0]]
+
+
+def test_page_link_graph():
+    graph = PageLinkGraph.from_links(LINKS)
+    assert len(graph) == 5
+
+    sources, targets, counts = graph.get_links([2, 4, 10])
+    assert zip(sources, targets, counts) == [(2, 1, 1), (2, 3, 2), (4, 1, 5)]
+
+    sources, targets, counts = graph.get_links([])
+    assert len(sources) == len(targets) == len(counts) == 0
+
+
+def test_personalised_pagerank():
+    sources, targets, counts = _link_arrays(LINKS)
+    matrix = build_link_matrix([1, 2, 3, 4], sources, targets, counts, mode='single')
+    weights = np.asarray([0.2, 0.0, 0.5, 0.3])
+
+    # Without following links the rank is the personalisation vector
+    assert np.allclose(personalised_pagerank(matrix, weights, alpha=0.0), weights)
+
+    rank = personalised_pagerank(matrix, weights, alpha=0.5, steps=20)
+    assert np.isclose(rank.sum(), weights.sum())
+    assert rank[1] > 0
+
+    assert personalised_pagerank(matrix, np.zeros(4)).tolist() == [0, 0, 0, 0]
+
+
+def test_second_order_ranking():
+    sources, targets, counts = _link_arrays(LINKS)
+    matrix = build_link_matrix([1, 2, 3], sources, targets, counts, mode='single')
+    weights = np.asarray([0.5, 0.25, 0.125])
+
+    original, incoming, outgoing = second_order_ranking(weights, matrix, 0.5, 'original')
+    assert np.allclose(original, weights + 0.5 * matrix.toarray().dot(weights))
+    assert incoming.tolist() == [2, 1, 1]
+    assert outgoing.tolist() == [1, 2, 1]
+
+    augmented, _, _ = second_order_ranking(weights, matrix.toarray(), 0.5, 'augmented')
+    assert np.allclose(second_order_ranking(weights, matrix, 0.5, 'augmented')[0], augmented)
+
+    pagerank, _, _ = second_order_ranking(weights, matrix, 0.5, 'pagerank', steps=5)
+    assert np.isclose(pagerank.sum(), weights.sum())
+
+    # The weights are not modified
+    assert weights.tolist() == [0.5, 0.25, 0.125]
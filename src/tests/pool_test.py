@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import shutil
+import tempfile
+import threading
+import unittest
+
+from index.pool import ConnectionPool
+from index.backends import SQLiteBackend
+
+
+class DisconnectingBackend(SQLiteBackend):
+    # Treats operations on a closed connection as a lost connection
+
+    def is_disconnect(self, error):
+        return isinstance(error, sqlite3.ProgrammingError)
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.backend = DisconnectingBackend(os.path.join(self.path, 'test.db'))
+        self.pool = ConnectionPool(self.backend, size=2)
+
+        with self.pool.connection() as connection:
+            connection.execute('CREATE TABLE Test (Value INT)')
+            connection.execute('INSERT INTO Test VALUES (1)')
+            connection.commit()
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.path)
+
+    def test_execute(self):
+        assert self.pool.execute('SELECT Value FROM Test WHERE Value = %s', (1, )) == [(1, )]
+
+    def test_iterate(self):
+        assert list(self.pool.iterate('SELECT Value FROM Test')) == [(1, )]
+
+    def test_reuse(self):
+        for _ in xrange(5):
+            self.pool.execute('SELECT Value FROM Test')
+        assert self.pool._created == 1
+
+    def test_size(self):
+        results = []
+
+        def worker():
+            for _ in xrange(20):
+                results.append(self.pool.execute('SELECT Value FROM Test'))
+
+        threads = [threading.Thread(target=worker) for _ in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(results) == 160
+        assert all(r == [(1, )] for r in results)
+        assert self.pool._created <= 2
+
+    def test_reconnect(self):
+        with self.pool.connection() as connection:
+            connection.close()
+
+        # The closed connection is discarded and the statement retried on a new one
+        assert self.pool.execute('SELECT Value FROM Test') == [(1, )]
+        assert self.pool._created == 1
+
+    def test_error(self):
+        self.assertRaises(sqlite3.OperationalError, self.pool.execute, 'SELECT Missing FROM Test')
+
+        # Connections are returned to the pool after other errors
+        assert self.pool._created == 1
+        assert self.pool.execute('SELECT Value FROM Test') == [(1, )]
+
+    def test_abandoned_iterate(self):
+        pool = ConnectionPool(self.backend, size=1)
+
+        rows = pool.iterate('SELECT Value FROM Test')
+        assert rows.next() == (1, )
+        rows.close()
+
+        # The connection held by the closed iterator is returned to the pool
+        assert pool.execute('SELECT Value FROM Test') == [(1, )]
+        assert pool._created == 1
+        pool.close()
+
+    def test_interrupted_connection(self):
+        def interrupt():
+            with self.pool.connection():
+                raise KeyboardInterrupt
+
+        self.assertRaises(KeyboardInterrupt, interrupt)
+        assert len(self.pool._idle) == 1
+
+    def test_discard_wakes_waiter(self):
+        pool = ConnectionPool(self.backend, size=1)
+        results = []
+
+        waiter = threading.Thread(target=lambda: results.append(pool.execute('SELECT Value FROM Test')))
+        waiter.daemon = True
+
+        def lose_connection():
+            with pool.connection() as connection:
+                # The waiter blocks while the only connection is checked out
+                waiter.start()
+                waiter.join(0.1)
+                assert waiter.is_alive()
+
+                connection.close()
+                connection.execute('SELECT Value FROM Test')
+
+        self.assertRaises(sqlite3.ProgrammingError, lose_connection)
+
+        # Discarding the lost connection lets the waiter create a replacement
+        waiter.join(5)
+        assert not waiter.is_alive()
+        assert results == [[(1, )]]
+        pool.close()
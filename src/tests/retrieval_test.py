@@ -0,0 +1,71 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+
+from index.hashedindex import HashedIndex
+from index.retrieval import *
+
+
+class RankedRetrievalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = HashedIndex()
+        self.index.add_document('python.txt', ['python', 'code', 'code', 'snake'])
+        self.index.add_document('snake.txt', ['snake', 'snake', 'reptile', 'venom'])
+        self.index.add_document('java.txt', ['java', 'code', 'coffee'])
+        self.index.add_document('other.txt', ['weather', 'rain'])
+
+    def test_search_tfidf(self):
+        retrieval = RankedRetrieval(self.index)
+        results = retrieval.search(['snake', 'venom'])
+
+        assert [doc for doc, score in results] == ['snake.txt', 'python.txt']
+        assert results[0][1] > results[1][1]
+
+    def test_search_matches_cosine(self):
+        retrieval = RankedRetrieval(self.index)
+        matrix = self.index.generate_feature_matrix(mode='tfidf')
+        documents = self.index.documents()
+
+        query = ['code', 'python', 'snake', 'doesnotexist']
+        query_vector = np.zeros(len(self.index.terms()))
+        for term in query:
+            if term in self.index:
+                query_vector[self.index.get_term_id(term)] = np.log10(5 / (1 + self.index.get_document_frequency(term)))
+
+        for doc, score in retrieval.search(query, k=10):
+            vector = matrix[documents.index(doc)]
+            expected = np.dot(vector, query_vector) / (np.linalg.norm(vector) * np.linalg.norm(query_vector))
+            assert np.allclose(score, expected)
+
+    def test_search_bm25(self):
+        retrieval = RankedRetrieval(self.index, mode='bm25')
+        results = retrieval.search(['code'])
+
+        assert sorted(doc for doc, score in results) == ['java.txt', 'python.txt']
+        assert all(score > 0 for doc, score in results)
+
+    def test_search_k(self):
+        retrieval = RankedRetrieval(self.index)
+        assert len(retrieval.search(['code', 'snake'], k=1)) == 1
+        assert len(retrieval.search(['code', 'snake'], k=10)) == 3
+
+    def test_search_no_results(self):
+        retrieval = RankedRetrieval(self.index)
+        assert retrieval.search(['doesnotexist']) == []
+        assert retrieval.search([]) == []
+
+    def test_invalid_mode(self):
+        self.assertRaises(ValueError, RankedRetrieval, self.index, mode='count')
+
+    def test_snapshot(self):
+        retrieval = RankedRetrieval(self.index)
+        expected = retrieval.search(['venom', 'snake'])
+
+        # Pruning renumbers the terms of the index and adding documents introduces new ones
+        self.index.prune(min_frequency=2)
+        self.index.add_document('viper.txt', ['viper', 'venom'])
+
+        assert retrieval.search(['venom', 'snake']) == expected
+        assert retrieval.search(['viper']) == []
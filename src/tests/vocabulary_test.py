@@ -0,0 +1,40 @@
+import unittest
+
+from index.vocabulary import *
+
+
+class VocabularyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.vocabulary = Vocabulary(['apple', 'banana', 'cherry'])
+
+    def test_add(self):
+        assert self.vocabulary.add('apple') == 0
+        assert self.vocabulary.add('date') == 3
+        assert len(self.vocabulary) == 4
+
+    def test_get_id(self):
+        assert self.vocabulary.get_id('banana') == 1
+        self.assertRaises(KeyError, self.vocabulary.get_id, 'doesnotexist')
+
+    def test_get_name(self):
+        assert self.vocabulary.get_name(2) == 'cherry'
+
+    def test_contains(self):
+        assert 'apple' in self.vocabulary
+        assert 'Apple' not in self.vocabulary
+
+    def test_names(self):
+        assert self.vocabulary.names() == ['apple', 'banana', 'cherry']
+        assert list(self.vocabulary) == ['apple', 'banana', 'cherry']
+
+    def test_compact(self):
+        mapping = self.vocabulary.compact([True, False, True])
+
+        assert mapping.tolist() == [0, -1, 1]
+        assert self.vocabulary.names() == ['apple', 'cherry']
+        assert self.vocabulary.get_id('cherry') == 1
+        assert 'banana' not in self.vocabulary
+
+        # IDs continue to be allocated densely
+        assert self.vocabulary.add('date') == 2
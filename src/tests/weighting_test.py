@@ -0,0 +1,70 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+
+from math import log10
+
+from index.weighting import *
+
+
+class WeightingEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        # Two documents of length 8 and 6 over three terms
+        self.engine = WeightingEngine(
+            term_ids=[0, 0, 1, 2],
+            doc_ids=[0, 1, 0, 1],
+            counts=[3, 2, 5, 4],
+            document_lengths=[8, 6],
+            n_terms=3,
+        )
+
+    def test_document_frequencies(self):
+        assert self.engine.document_frequencies.tolist() == [2, 1, 1]
+
+    def test_shape(self):
+        assert self.engine.shape == (2, 3)
+        assert self.engine.generate_matrix().shape == (2, 3)
+
+    def test_count(self):
+        assert self.engine.weights('count').tolist() == [3, 2, 5, 4]
+
+    def test_tf(self):
+        assert self.engine.weights('tf').tolist() == [3 / 8, 2 / 6, 5 / 8, 4 / 6]
+
+    def test_tfidf(self):
+        weights = self.engine.weights('tfidf')
+        assert weights[0] == 3 * log10(3 / 3)
+        assert weights[2] == 5 * log10(3 / 2)
+
+    def test_sublinear(self):
+        weights = self.engine.weights('sublinear')
+        assert weights[2] == (1 + log10(5)) * log10(3 / 2)
+        assert (weights <= self.engine.weights('tfidf') + 1e-12).all()
+
+    def test_bm25(self):
+        weights = self.engine.weights('bm25')
+        assert (weights > 0).all()
+
+        # Rarer terms should be weighted higher for the same document
+        assert weights[2] > weights[0]
+
+        # Term frequency saturates with larger k1 values
+        assert (self.engine.weights('bm25', k1=0.0) <= weights).all()
+
+    def test_tfidf_l2(self):
+        matrix = self.engine.generate_matrix('tfidf_l2')
+        norms = np.sqrt((matrix ** 2).sum(axis=1))
+        assert np.allclose(norms, [1.0, 1.0])
+
+    def test_sparse_matches_dense(self):
+        for mode in MODES:
+            dense = self.engine.generate_matrix(mode)
+            sparse = self.engine.generate_matrix(mode, sparse=True)
+            assert sparse.format == 'csr'
+            assert (sparse.toarray() == dense).all()
+
+    def test_invalid_mode(self):
+        self.assertRaises(ValueError, self.engine.weights, 'invalid')
+        self.assertRaises(ValueError, self.engine.generate_matrix, None)
@@ -1,6 +1,19 @@
 # coding=utf-8
 
-from wiki_setup import _re_link_pattern
+import os
+import bz2
+import shutil
+import multiprocessing
+import tempfile
+import unittest
+
+from collections import Counter
+from distutils.spawn import find_executable
+
+import wiki_setup
+
+from wiki_setup import _re_link_pattern, _chunks, _bounded_imap, split_wiki_pages, parse_wiki_page, extract_wiki_pages, \
+    process_page, process_pages
 
 
 def test_link_pattern_test():
@@ -11,3 +24,117 @@ def test_link_pattern_test():
     assert _re_link_pattern.findall('[[Queen (band)|Queen]]') == ['Queen (band)']
     assert _re_link_pattern.findall('[[Target page#Target section|display text]]') == ['Target page']
     assert _re_link_pattern.findall(u'[[Göta Canal]]') == [u'Göta Canal']
+
+
+def _write_dump(path, pages):
+    with bz2.BZ2File(path, 'w') as fp:
+        fp.write('<mediawiki>\n')
+        for page in pages:
+            title, text = page[:2]
+            header = page[2] if len(page) > 2 else ''
+            fp.write('  <page>\n    <title>%s</title>\n%s    <revision>\n      <text>%s</text>\n    </revision>\n  </page>\n' % (title, header, text))
+        fp.write('</mediawiki>\n')
+
+
+class SplitWikiPagesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.dump = os.path.join(self.path, 'dump.xml.bz2')
+
+        self.text = ' '.join(['apple banana [[Fruit]]'] * 100)
+        _write_dump(self.dump, [
+            ('Apple', self.text), ('Template:Fruit', self.text), ('Short', 'apple'), ('Banana', self.text),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_split(self):
+        pages = list(split_wiki_pages(self.dump))
+        assert [parse_wiki_page(page) for (offset, page) in pages] == list(extract_wiki_pages(self.dump))
+        assert [title for (title, text, ns, redirect) in extract_wiki_pages(self.dump)] == ['Apple', 'Template:Fruit', 'Short', 'Banana']
+        assert parse_wiki_page(pages[2][1]) == ('Short', 'apple', 0, False)
+
+        # Offsets are increasing positions in the decompressed dump
+        offsets = [offset for (offset, page) in pages]
+        assert offsets == sorted(offsets)
+
+    def test_blocks(self):
+        pages = list(split_wiki_pages(self.dump))
+
+        # Pages and tags are split across many blocks
+        block_size, wiki_setup.DUMP_BLOCK_SIZE = wiki_setup.DUMP_BLOCK_SIZE, 3
+        try:
+            assert list(split_wiki_pages(self.dump)) == pages
+            assert list(split_wiki_pages(self.dump, pages[1][0])) == pages[2:]
+        finally:
+            wiki_setup.DUMP_BLOCK_SIZE = block_size
+
+    def test_namespaces(self):
+        _write_dump(self.dump, [
+            ('Apple', self.text, '    <ns>0</ns>\n'),
+            ('Talk:Apple', self.text, '    <ns>1</ns>\n'),
+            ('Apples', 'x', '    <ns>0</ns>\n    <redirect title="Apple" />\n'),
+            ('Banana', self.text.replace('apple', '&lt;redirect&gt;'), '    <ns>0</ns>\n'),
+        ])
+
+        assert [(title, ns, redirect) for (title, text, ns, redirect) in extract_wiki_pages(self.dump)] == [
+            ('Apple', 0, False), ('Talk:Apple', 1, False), ('Apples', 0, True), ('Banana', 0, False)
+        ]
+        assert [title for (title, text, ns, redirect) in extract_wiki_pages(self.dump, articles_only=True)] == ['Apple', 'Banana']
+
+        results = [process_page(page) for page in split_wiki_pages(self.dump, articles_only=False)]
+        assert [title for (offset, title, terms, links) in results if terms is not None] == ['Apple', 'Banana']
+
+    def test_decompressor(self):
+        if find_executable('bzip2') is None:
+            raise unittest.SkipTest('bzip2 is not installed')
+
+        pages = list(split_wiki_pages(self.dump))
+        assert list(split_wiki_pages(self.dump, decompressor='bzip2')) == pages
+        assert list(split_wiki_pages(self.dump, pages[0][0], decompressor='bzip2')) == pages[1:]
+
+        # The decompressor is stopped when the pages are not all read
+        assert next(split_wiki_pages(self.dump, decompressor='bzip2')) == pages[0]
+
+    def test_resume(self):
+        pages = list(split_wiki_pages(self.dump))
+        for i, (offset, page) in enumerate(pages):
+            assert list(split_wiki_pages(self.dump, offset)) == pages[i + 1:]
+
+    def test_process_page(self):
+        results = [process_page(page) for page in split_wiki_pages(self.dump)]
+        assert [title for (offset, title, terms, links) in results] == ['Apple', 'Template:Fruit', 'Short', 'Banana']
+
+        offset, title, terms, links = results[0]
+        assert terms['apple'] == 100
+        assert links == Counter({'Fruit': 100})
+
+        # Meta pages and short pages are ignored
+        assert results[1][2:] == (None, None)
+        assert results[2][2:] == (None, None)
+
+        assert process_pages([page for page in split_wiki_pages(self.dump)][:2]) == results[:2]
+
+
+def test_chunks():
+    assert list(_chunks(xrange(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(_chunks([], 2)) == []
+
+
+def test_bounded_imap():
+    pool = multiprocessing.Pool(2)
+    try:
+        chunks = _chunks(xrange(23), 3)
+        assert list(_bounded_imap(pool, sorted, chunks, 2)) == range(23)
+
+        # Chunks are only read from the input a window ahead of the results consumed
+        items = iter(xrange(100))
+        results = _bounded_imap(pool, sorted, _chunks(items, 3), 2)
+        assert results.next() == 0
+        assert items.next() == 12
+
+        assert list(_bounded_imap(pool, sorted, [], 2)) == []
+    finally:
+        pool.terminate()
@@ -0,0 +1,120 @@
+# coding=utf-8
+import shutil
+import tempfile
+import unittest
+
+from index.wikisnapshot import WikiSnapshot, write_snapshot
+
+# Database IDs are deliberately sparse and out of order
+TERMS = [(10, u'python'), (4, u'snake'), (7, u'language'), (12, u'göta'), (20, u'orphan')]
+PAGES = [(3, u'Python (programming language)', 400), (9, u'Pythonidae', 300), (5, u'Göta Canal', 250), (11, u'Unprocessed', 0)]
+DOCUMENT_FREQUENCIES = [(10, 2), (4, 1), (7, 1), (12, 1)]
+TERM_OCCURRENCES = [(10, 3, 20), (10, 9, 5), (4, 9, 12), (7, 3, 8), (12, 5, 9)]
+TFIDF_VALUES = [(10, 3, 2.5), (10, 9, 1.5), (4, 9, 4.0), (7, 3, 3.0), (12, 5, 5.0)]
+TFIDF_TOTALS = [(3, 5.5), (9, 5.5), (5, 5.0)]
+PAGE_LINKS = [(3, 9, 2), (9, 3, 1), (5, 3, 1), (3, 11, 4)]
+
+
+class WikiSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        write_snapshot(
+            self.path, 3, TERMS, PAGES,
+            document_frequencies=DOCUMENT_FREQUENCIES,
+            tfidf_values=TFIDF_VALUES,
+            tfidf_totals=TFIDF_TOTALS,
+            term_occurrences=TERM_OCCURRENCES,
+            page_links=PAGE_LINKS,
+        )
+        self.snapshot = WikiSnapshot(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def term_id(self, name):
+        return dict(self.snapshot.get_term_ids([name]))[name]
+
+    def page_id(self, name):
+        return dict(self.snapshot.get_page_ids([name]))[name]
+
+    def test_supports_table(self):
+        assert self.snapshot.supports_table('TfidfTotals')
+        assert self.snapshot.supports_table('CorpusSize')
+        assert not self.snapshot.supports_table('TermOccurrencesTemp')
+
+    def test_corpus_size(self):
+        assert self.snapshot.get_corpus_size() == 3
+
+    def test_term_ids(self):
+        results = dict(self.snapshot.get_term_ids([u'python', u'göta', u'missing']))
+        assert sorted(results.keys()) == [u'göta', u'python']
+
+        for name, term_id in results.items():
+            assert self.snapshot.get_term_names([term_id]) == [(term_id, name)]
+
+    def test_term_data(self):
+        results = self.snapshot.get_term_data([u'python', u'snake', u'orphan'])
+        assert sorted((a, c) for (a, b, c) in results) == [(u'python', 2), (u'snake', 1)]
+
+    def test_document_frequencies(self):
+        term_id = self.term_id(u'python')
+        orphan_id = self.term_id(u'orphan')
+        assert self.snapshot.get_document_frequencies([term_id, orphan_id]) == [(term_id, 2)]
+
+    def test_page_totals(self):
+        results = dict((a, (b, c, d)) for (a, b, c, d) in self.snapshot.get_page_totals(
+            [self.page_id(u'Göta Canal'), self.page_id(u'Unprocessed')]
+        ))
+        assert sorted(results.values()) == [(u'Göta Canal', 250, 5.0), (u'Unprocessed', 0, None)]
+
+    def test_top_documents(self):
+        term_id = self.term_id(u'python')
+        python_id = self.page_id(u'Python (programming language)')
+        pythonidae_id = self.page_id(u'Pythonidae')
+
+        results = self.snapshot.get_top_documents([term_id], min_tfidf=1.0)
+        assert results == [(term_id, python_id, 2.5), (term_id, pythonidae_id, 1.5)]
+
+        assert self.snapshot.get_top_documents([term_id], min_tfidf=2.0) == results[:1]
+        assert self.snapshot.get_top_documents([term_id], min_tfidf=0.0, limit=1) == results[:1]
+        assert self.snapshot.get_documents(term_id, min_tfidf=1.0) == [(python_id, ), (pythonidae_id, )]
+
+    def test_term_occurrences(self):
+        python_id = self.term_id(u'python')
+        snake_id = self.term_id(u'snake')
+        page_id = self.page_id(u'Pythonidae')
+
+        results = self.snapshot.get_term_occurrences([page_id], [python_id, snake_id])
+        assert sorted(results) == sorted([(page_id, python_id, 5), (page_id, snake_id, 12)])
+
+        assert self.snapshot.get_term_occurrences([page_id], [self.term_id(u'language')]) == []
+
+    def test_tfidf_values(self):
+        term_id = self.term_id(u'snake')
+        page_id = self.page_id(u'Pythonidae')
+        assert self.snapshot.get_tfidf_values([page_id], [term_id]) == [(page_id, term_id, 4.0)]
+
+    def test_page_links(self):
+        page_id = self.page_id(u'Python (programming language)')
+        results = self.snapshot.get_page_links([page_id])
+        assert sorted((self.snapshot.get_page_names([b])[0][1], c) for (a, b, c) in results) == [
+            (u'Pythonidae', 2), (u'Unprocessed', 4)
+        ]
+
+    def test_link_matrix(self):
+        page_ids = [self.page_id(u'Python (programming language)'), self.page_id(u'Pythonidae')]
+        assert self.snapshot.generate_link_matrix(page_ids).tolist() == [[0, 1], [2, 0]]
+
+    def test_no_mmap(self):
+        snapshot = WikiSnapshot(self.path, mmap=False)
+        assert snapshot.get_term_data([u'python']) == self.snapshot.get_term_data([u'python'])
+
+    def test_word_concepts(self):
+        results, terms, query_vector = self.snapshot.word_concepts(
+            'python snake python language snake python', min_tfidf=0.0
+        )
+        assert len(terms) == len(query_vector)
+        assert results
+        assert results[0].page_name == u'Pythonidae'
+        assert 'documents' in self.snapshot.timings
@@ -2,30 +2,50 @@
 from __future__ import print_function
 
 import re
+import bz2
 import sys
 import nltk
 import time
-import MySQLdb
-import itertools
+import signal
+import subprocess
+import multiprocessing
+
+import numpy as np
 
 # lxml is much much faster than bs4
 from lxml import etree
 
+from itertools import groupby, islice
 from collections import Counter
+from contextlib import contextmanager
 from textparser import word_tokenize, NullStemmer
 from WikiExtractor import clean as clean_wiki_markup
 
-from utils import load_db_params, to_csv, load_stopwords
+from utils import load_db_params, load_stopwords
+from index.backends import SQLiteBackend, get_backend
+from index.bulkwriter import BulkWriter
+from index.postings import pack_postings, POSTING_DTYPE
 
 MIN_PAGE_SIZE = 1 * 1024  # 1 KB min size
 MIN_PAGE_LENGTH = 200  # Minimum Page Length in terms
+MIN_TERM_COUNT = 3  # Minimum number of times a term occurs across all pages to be indexed
+
+TOP_POSTINGS = 200  # Number of pages stored per term in TopPostings
+TOP_POSTINGS_BATCH = 1000000  # Maximum number of TfidfValues rows read at once when creating TopPostings
+STREAMED_BATCH = 1000000  # Number of TermOccurrences rows read at once by streamed_post_setup
 
 # NOTE ABOUT CORPUS SIZE
-# Just reading the entire Wikipedia corpus takes 1 hour 15 minutes
+# Just reading the entire Wikipedia corpus takes 1 hour 15 minutes, most of which is spent decompressing
+# it when split_wiki_pages is not given a parallel decompressor
+
+DUMP_BLOCK_SIZE = 1024 * 1024  # Number of decompressed bytes read from the dump at once
 
 # List of Page titles to ignore when they have the following prefix
 IGNORE_LIST = ('List of', 'MediaWiki:', 'Module:', 'Draft:', 'Wikipedia:', 'Template:', 'File:', 'Category:', 'Help:', 'Portal:')
 
+# Namespace of a page in the header of its <page> block, 0 for articles
+_re_namespace_pattern = re.compile(r'<ns>(-?\d+)</ns>')
+
 # Wikipedia inner link pattern
 # http://en.wikipedia.org/wiki/Wikipedia:Tutorial/Wikipedia_links
 _re_link_pattern = re.compile(
@@ -41,11 +61,11 @@ _re_link_pattern = re.compile(
 def corpus_size_setup():
     cur.execute('DROP TABLE IF EXISTS CorpusSize;')
 
-    cur.execute("""
+    cur.execute(backend.sql("""
       CREATE TABLE CorpusSize (
         Size INT NOT NULL
-      ) ENGINE=%s CHARACTER SET=utf8;
-    """, (engine, ))
+      ) {table_options};
+    """))
 
     cur.execute("""
         INSERT INTO CorpusSize
@@ -55,16 +75,20 @@ def corpus_size_setup():
     """)
 
 
-def document_frequencies_setup():
+def create_document_frequencies():
     cur.execute('DROP TABLE IF EXISTS DocumentFrequencies;')
 
-    cur.execute("""
+    cur.execute(backend.sql("""
         CREATE TABLE DocumentFrequencies (
           TermID INT PRIMARY KEY,
           DocumentFrequency INT NOT NULL,
           FOREIGN KEY (TermID) REFERENCES Terms(TermID)
-        ) ENGINE=%s CHARACTER SET=utf8;
-    """, (engine, ))
+        ) {table_options};
+    """))
+
+
+def document_frequencies_setup():
+    create_document_frequencies()
 
     cur.execute("""
       INSERT INTO DocumentFrequencies
@@ -74,43 +98,121 @@ def document_frequencies_setup():
     """)
 
 
-def tfidf_values_setup():
+def create_tfidf_values():
     cur.execute('DROP TABLE IF EXISTS TfidfValues;')
 
-    cur.execute("""
+    cur.execute(backend.sql("""
         CREATE TABLE TfidfValues (
           TermID INT NOT NULL,
           PageID INT NOT NULL,
           Tfidf FLOAT NOT NULL,
           PRIMARY KEY (TermID, PageID),
           FOREIGN KEY (TermID) REFERENCES Terms(TermID),
-          FOREIGN KEY (PageID) REFERENCES Pages(PageID),
-          INDEX (Tfidf)
-        ) ENGINE=%s CHARACTER SET=utf8;
-    """, (engine, ))
+          FOREIGN KEY (PageID) REFERENCES Pages(PageID)
+        ) {table_options};
+    """))
+
+
+def tfidf_values_setup():
+    create_tfidf_values()
 
     cur.execute("""
       INSERT INTO TfidfValues
       SELECT
         T1.TermID,
         T1.PageID,
-        ((1 + LOG(Counter)) / LOG(Length)) * LOG((SELECT Size FROM CorpusSize)/DocumentFrequency)
+        ((1 + LOG(Counter)) / LOG(Length)) * LOG((SELECT Size FROM CorpusSize) * 1.0 / DocumentFrequency)
       FROM TermOccurrences T1
       INNER JOIN DocumentFrequencies T2 ON T1.TermID = T2.TermID
       INNER JOIN Pages T3 ON T1.PageID = T3.PageID;
     """)
 
+    backend.create_indexes(cur, 'TfidfValues')
 
-def tfidf_totals_setup():
-    cur.execute('DROP TABLE IF EXISTS TfidfTotals;')
+
+def _term_ranges(term_frequencies, max_rows):
+    """
+    Groups a list of (TermID, DocumentFrequency) sorted by TermID into ranges of
+    (FirstTermID, LastTermID) which cover at most max_rows rows unless they consist
+    of a single term.
+    """
+    first = last = None
+    rows = 0
+
+    for term_id, document_frequency in term_frequencies:
+        if first is not None and rows + document_frequency > max_rows:
+            yield first, last
+            first = None
+
+        if first is None:
+            first, rows = term_id, 0
+
+        last = term_id
+        rows += document_frequency
+
+    if first is not None:
+        yield first, last
+
+
+def create_top_postings():
+    cur.execute('DROP TABLE IF EXISTS TopPostings;')
+
+    # Complete is set when all the pages of the term fit in Postings
+    cur.execute(backend.sql("""
+        CREATE TABLE TopPostings (
+          TermID INT PRIMARY KEY,
+          Complete BOOL NOT NULL,
+          Postings BLOB NOT NULL,
+          FOREIGN KEY (TermID) REFERENCES Terms(TermID)
+        ) {table_options};
+    """))
+
+
+def top_postings_setup():
+    create_top_postings()
 
     cur.execute("""
+        SELECT TermID, DocumentFrequency
+        FROM DocumentFrequencies
+        ORDER BY TermID;
+    """)
+    term_frequencies = cur.fetchall()
+    document_frequencies = dict(term_frequencies)
+
+    for first, last in _term_ranges(term_frequencies, TOP_POSTINGS_BATCH):
+        # Only the top postings of a single term which exceeds the batch size are read
+        cur.execute("""
+            SELECT TermID, PageID, Tfidf
+            FROM TfidfValues
+            WHERE TermID BETWEEN %%s AND %%s
+            ORDER BY TermID, Tfidf DESC
+            %s;
+        """ % ('LIMIT %d' % TOP_POSTINGS if first == last else ''), (first, last))
+
+        rows = []
+        for term_id, postings in groupby(cur.fetchall(), key=lambda x: x[0]):
+            postings = [(b, c) for (a, b, c) in islice(postings, TOP_POSTINGS)]
+            rows.append((term_id, document_frequencies[term_id] <= TOP_POSTINGS, backend.binary(pack_postings(postings))))
+
+        cur.executemany("""
+            INSERT INTO TopPostings (TermID, Complete, Postings)
+            VALUES (%s, %s, %s);
+        """, rows)
+
+
+def create_tfidf_totals():
+    cur.execute('DROP TABLE IF EXISTS TfidfTotals;')
+
+    cur.execute(backend.sql("""
         CREATE TABLE TfidfTotals (
           PageID INT PRIMARY KEY,
-          Total FLOAT NOT NULL,
-          INDEX (Total)
-        ) ENGINE=%s CHARACTER SET=utf8;
-    """, (engine, ))
+          Total FLOAT NOT NULL
+        ) {table_options};
+    """))
+
+
+def tfidf_totals_setup():
+    create_tfidf_totals()
 
     cur.execute("""
         INSERT INTO TfidfTotals
@@ -119,47 +221,183 @@ def tfidf_totals_setup():
         GROUP BY PageID;
     """)
 
+    backend.create_indexes(cur, 'TfidfTotals')
+
+
+def _fetch_arrays(cursor, size):
+    """
+    Yields the rows of the executed query as 2d integer arrays of at most size rows.
+    """
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+
+        yield np.array(rows, dtype=np.int64)
+
+
+def _term_chunks(chunks):
+    """
+    Regroups chunks of rows sorted by their first column so that the rows
+    with the same value in the first column are always in the same chunk.
+    """
+    carry = None
+
+    for chunk in chunks:
+        if carry is not None:
+            chunk = np.concatenate((carry, chunk))
+
+        # Start of the rows of the last value, which may continue in the next chunk
+        last = np.searchsorted(chunk[:, 0], chunk[-1, 0])
+        carry = chunk[last:]
+
+        if last > 0:
+            yield chunk[:last]
+
+    if carry is not None:
+        yield carry
+
+
+def streamed_post_setup():
+    """
+    Alternative to the DocumentFrequencies, TfidfValues, TopPostings and TfidfTotals
+    steps of post_setup which reads TermOccurrences once in primary key order and
+    computes the tables with numpy instead of grouping and joining in the database.
+    Memory is bounded by STREAMED_BATCH rows (or the rows of the most frequent term)
+    along with two values per page. TermOccurrences is read with its own connection
+    so must be committed beforehand.
+    """
+    create_document_frequencies()
+    create_tfidf_values()
+    create_top_postings()
+    create_tfidf_totals()
+
+    cur.execute('SELECT Size FROM CorpusSize;')
+    (corpus_size, ) = cur.fetchone()
+    cur.fetchall()
+
+    # The derived tables are written with cur while TermOccurrences is streamed
+    reader = backend.connect()
+    try:
+        reader_cur = backend.cursor(reader, streaming=True)
+
+        reader_cur.execute('SELECT PageID, Length FROM Pages WHERE Processed = 1;')
+        pages = np.concatenate(list(_fetch_arrays(reader_cur, STREAMED_BATCH)) or [np.zeros((0, 2), dtype=np.int64)])
+
+        size = pages[:, 0].max() + 1 if len(pages) else 0
+        log_lengths = np.zeros(size)
+        log_lengths[pages[:, 0]] = np.log(pages[:, 1])
+        totals = np.zeros(size)
+        has_values = np.zeros(size, dtype=bool)
+        del pages
+
+        reader_cur.execute("""
+            SELECT TermID, PageID, Counter
+            FROM TermOccurrences
+            ORDER BY TermID, PageID;
+        """)
+
+        for chunk in _term_chunks(_fetch_arrays(reader_cur, STREAMED_BATCH)):
+            term_ids, page_ids, counters = chunk[:, 0], chunk[:, 1], chunk[:, 2]
+
+            starts = np.flatnonzero(np.r_[True, term_ids[1:] != term_ids[:-1]])
+            document_frequencies = np.diff(np.r_[starts, len(term_ids)])
+
+            # Mirrors the calculation in tfidf_values_setup
+            idf = np.log(corpus_size * 1.0 / document_frequencies)
+            tfidf = (1 + np.log(counters)) / log_lengths[page_ids] * np.repeat(idf, document_frequencies)
+
+            chunk_pages, inverse = np.unique(page_ids, return_inverse=True)
+            totals[chunk_pages] += np.bincount(inverse, tfidf)
+            has_values[chunk_pages] = True
+
+            backend.bulk_insert(cur, 'DocumentFrequencies', ('TermID', 'DocumentFrequency'), zip(
+                term_ids[starts].tolist(), document_frequencies.tolist()
+            ))
+            backend.bulk_insert(cur, 'TfidfValues', ('TermID', 'PageID', 'Tfidf'), zip(
+                term_ids.tolist(), page_ids.tolist(), tfidf.tolist()
+            ))
+
+            # Pages of each term by descending Tfidf, of which the first TOP_POSTINGS are kept
+            order = np.lexsort((page_ids, -tfidf, term_ids))
+            ranks = np.arange(len(order)) - np.repeat(starts, document_frequencies)
+            order = order[ranks < TOP_POSTINGS]
+
+            postings = np.empty(len(order), dtype=POSTING_DTYPE)
+            postings['page_id'] = page_ids[order]
+            postings['tfidf'] = tfidf[order]
+
+            ends = np.cumsum(np.minimum(document_frequencies, TOP_POSTINGS))
+            backend.bulk_insert(cur, 'TopPostings', ('TermID', 'Complete', 'Postings'), [
+                (term_id, document_frequency <= TOP_POSTINGS, backend.binary(postings[end - length:end].tostring()))
+                for (term_id, document_frequency, end, length) in zip(
+                    term_ids[starts].tolist(), document_frequencies.tolist(), ends.tolist(), np.diff(np.r_[0, ends]).tolist()
+                )
+            ])
+    finally:
+        reader.close()
+
+    page_ids = np.flatnonzero(has_values)
+    backend.bulk_insert(cur, 'TfidfTotals', ('PageID', 'Total'), zip(page_ids.tolist(), totals[page_ids].tolist()))
+
+    backend.create_indexes(cur, 'TfidfValues')
+    backend.create_indexes(cur, 'TfidfTotals')
+
+
+def post_setup(streamed=False):
+    """
+    Creates the tables derived from TermOccurrences which are used by WikiIndex.
+    :param streamed use streamed_post_setup rather than SQL statements
+    """
+    post_setup_start = time.time()
 
-def post_setup():
     print('Creating fast look up for CorpusSize')
     corpus_size_setup()
-    print('Creating fast look up for DocumentFrequencies')
-    document_frequencies_setup()
-    print('Creating fast look up for TfidfValues')
-    tfidf_values_setup()
-    print('Creating fast look up for TfidfTotals')
-    tfidf_totals_setup()
+
+    if streamed:
+        print('Creating fast look up for DocumentFrequencies, TfidfValues, TopPostings and TfidfTotals')
+        streamed_post_setup()
+    else:
+        print('Creating fast look up for DocumentFrequencies')
+        document_frequencies_setup()
+        print('Creating fast look up for TfidfValues')
+        tfidf_values_setup()
+        print('Creating fast look up for TopPostings')
+        top_postings_setup()
+        print('Creating fast look up for TfidfTotals')
+        tfidf_totals_setup()
+
+    print('Post setup took: %d seconds' % (time.time() - post_setup_start))
 
 
 def setup():
-    cur.execute('DROP TABLE IF EXISTS TermOccurrencesTemp;')
     cur.execute('DROP TABLE IF EXISTS TermOccurrences;')
     cur.execute('DROP TABLE IF EXISTS PageLinks;')
     cur.execute('DROP TABLE IF EXISTS Pages;')
     cur.execute('DROP TABLE IF EXISTS Terms;')
 
     # Using Unique will automatically use an index for PageName in MySQL
-    cur.execute("""
+    cur.execute(backend.sql("""
         CREATE TABLE IF NOT EXISTS Pages (
-            PageID INT AUTO_INCREMENT PRIMARY KEY,
+            PageID {primary_key},
             PageName VARCHAR(250) UNIQUE NOT NULL,
             Length SMALLINT UNSIGNED NOT NULL DEFAULT 0,
-            Processed BOOL NOT NULL DEFAULT FALSE,
+            Processed BOOL NOT NULL DEFAULT 0,
             CreationDate TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        ) ENGINE=%s CHARACTER SET=utf8;
-    """, (engine, ))
+        ) {table_options};
+    """))
 
     # Using Unique will automatically use an index for TermName in MySQL
-    cur.execute("""
+    cur.execute(backend.sql("""
         CREATE TABLE IF NOT EXISTS Terms (
-            TermID INT AUTO_INCREMENT PRIMARY KEY,
+            TermID {primary_key},
             TermName VARCHAR(40) NOT NULL UNIQUE,
             CreationDate TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        ) ENGINE=%s CHARACTER SET=utf8;
-    """, (engine, ))
+        ) {table_options};
+    """))
 
     # Table which provides information about links between pages
-    cur.execute("""
+    cur.execute(backend.sql("""
         CREATE TABLE IF NOT EXISTS PageLinks (
            PageID INT NOT NULL,
            TargetPageID INT NOT NULL,
@@ -167,199 +405,296 @@ def setup():
            FOREIGN KEY (PageID) REFERENCES Pages(PageID) ON DELETE CASCADE,
            FOREIGN KEY (TargetPageID) REFERENCES Pages(PageID) ON DELETE CASCADE,
            PRIMARY KEY (PageID, TargetPageID)
-        ) ENGINE=%s ROW_FORMAT=FIXED;
-    """, (engine, ))
+        ) {fixed_table_options};
+    """))
+    backend.create_indexes(cur, 'PageLinks')
 
-    cur.execute("""
+    cur.execute(backend.sql("""
         CREATE TABLE IF NOT EXISTS TermOccurrences (
             TermID INT NOT NULL,
             PageID INT NOT NULL,
             Counter SMALLINT UNSIGNED DEFAULT 0 NOT NULL,
             FOREIGN KEY (TermID) REFERENCES Terms(TermID) ON DELETE CASCADE,
             FOREIGN KEY (PageID) REFERENCES Pages(PageID) ON DELETE CASCADE,
-            PRIMARY KEY (TermID, PageID),
-            INDEX (Counter)
-        ) ENGINE=%s ROW_FORMAT=FIXED;
-    """, (engine, ))
-
-    # Mirrors TermOccurrences structure
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS TermOccurrencesTemp (
-            TermID INT NOT NULL,
-            PageID INT NOT NULL,
-            Counter INT DEFAULT 0 NOT NULL,
-            CreationDate TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             PRIMARY KEY (TermID, PageID)
-        ) ENGINE=%s ROW_FORMAT=FIXED;
-    """, (engine, ))
-
-
-def prune():
-    prune_start = time.time()
-
-    # Moves Items from the temporary TermOccurrences table to permanent storage
+        ) {fixed_table_options};
+    """))
+    backend.create_indexes(cur, 'TermOccurrences')
+
+    # Position in the decompressed dump up to which all pages have been indexed
+    cur.execute('DROP TABLE IF EXISTS Checkpoint;')
+    cur.execute(backend.sql("""
+        CREATE TABLE Checkpoint (
+            Offset BIGINT NOT NULL,
+            PageCount INT NOT NULL
+        ) {table_options};
+    """))
+
+
+def save_checkpoint(offset, page_count):
+    """
+    Records that all pages up to the offset have been indexed. Saved in the
+    same transaction as the pages so that a commit is never half recorded.
+    """
+    cur.execute('DELETE FROM Checkpoint;')
     cur.execute("""
-        INSERT INTO TermOccurrences
-        SELECT T1.TermID, T1.PageID, T1.Counter
-        FROM TermOccurrencesTemp AS T1
-        INNER JOIN (
-            SELECT TermID
-            FROM TermOccurrencesTemp
-            GROUP BY TermID
-            HAVING SUM(Counter) > 2
-        ) AS T2 ON T1.TermID = T2.TermID;
-    """)
+        INSERT INTO Checkpoint (Offset, PageCount)
+        VALUES (%s, %s);
+    """, (offset, page_count))
 
-    # Delete the terms which were not added
-    cur.execute("""
-        DELETE Terms
-        FROM Terms
-        LEFT JOIN TermOccurrences ON Terms.TermID = TermOccurrences.TermID
-        WHERE PageID IS NULL;
-    """)
 
-    print('Pruned %d terms' % cur.rowcount)
+def load_checkpoint():
+    """
+    Returns the (Offset, PageCount) of the last checkpoint, or (0, 0) if there is none.
+    """
+    cur.execute('SELECT Offset, PageCount FROM Checkpoint;')
+    rows = cur.fetchall()
 
-    # Clear out the temporary storage
-    cur.execute('DELETE FROM TermOccurrencesTemp;')
+    return rows[0] if rows else (0, 0)
 
-    print('Pruning took: %d seconds' % (time.time() - prune_start))
+
+def prune():
+    """
+    Writes the pages buffered by the writer and deletes the terms which never
+    occurred MIN_TERM_COUNT times, once all pages have been indexed.
+    """
+    print('Pruned %d terms' % writer.prune())
 
 
-# Perform a Bulk insert operation for significantly faster performance
+# Pages are buffered by the writer and added in bulk when it is flushed
 def add_page_index(terms, page, intra_links):
     term_list = Counter(terms)
     doc_length = sum(term_list.values())
 
     if doc_length >= MIN_PAGE_LENGTH:
-        cur.execute("""
-            SELECT PageID, Processed
-            FROM Pages
-            WHERE PageName=%s;
-        """, (page, ))
-        rows = cur.fetchone()
-        cur.fetchall()
-
-        if rows:
-            page_id, processed = rows
-            if processed:
-                return  # No decent way to resolve this conflict (Issue #76)
-            else:
-                cur.execute("""
-                    UPDATE Pages
-                    SET PageName=%s, Length=%s, Processed=TRUE
-                    WHERE PageID=%s;
-                """, (page, doc_length, page_id))
-        else:
-            # On duplicate command is a hack to prevent a select statement
-            cur.execute("""
-                INSERT IGNORE INTO Pages (PageName, Length, Processed)
-                VALUES (%s, %s, TRUE)
-            """, (page, doc_length))
-            page_id = cur.lastrowid
-
-            # There was a duplicate entry case
-            if page_id <= 0:
-                return
-
-        filtered_term_list = [a for (a, b) in term_list.items() if b > 1]
-        var_string = to_csv(filtered_term_list, separate=True)
-        cur.execute("""
-            INSERT IGNORE INTO Terms (TermName)
-            VALUES %s;
-        """ % var_string)
+        # Terms which only occur once in the page are not indexed
+        term_counts = dict([(a, b) for (a, b) in term_list.items() if b > 1])
+        writer.add_page(page, doc_length, term_counts, intra_links)
+
+
+@contextmanager
+def open_dump(corpus_path, decompressor=None):
+    """
+    Opens a bz2 compressed dump for reading. It is decompressed in this process unless
+    a decompressor command is given, such as lbzip2 or pbzip2 which decompress with
+    several threads, which is run as `decompressor -d -c corpus_path`.
+    """
+    if decompressor is None:
+        with bz2.BZ2File(corpus_path, 'r') as fp:
+            yield fp
+    else:
+        process = subprocess.Popen([decompressor, '-d', '-c', corpus_path], stdout=subprocess.PIPE, bufsize=-1)
+        try:
+            yield process.stdout
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+
+
+def _skip(fp, offset):
+    # Decompresses up to the offset without scanning any of the skipped pages
+    if isinstance(fp, bz2.BZ2File):
+        fp.seek(offset)
+    else:
+        while offset > 0:
+            block = fp.read(min(offset, DUMP_BLOCK_SIZE))
+            if not block:
+                break
+            offset -= len(block)
 
-        var_string = to_csv(filtered_term_list, separate=False)
-        cur.execute("""
-            SELECT TermID, TermName FROM Terms
-            WHERE TermName IN (%s);
-        """ % var_string)
 
-        term_results = cur.fetchall()
+def _page_header(page_xml):
+    """
+    Returns the (Namespace, Redirect) of a <page> block by scanning the bytes before
+    its <revision> element. Pages without a <ns> element are treated as articles.
+    """
+    end = page_xml.find('<revision>')
+    if end < 0:
+        end = len(page_xml)
+
+    match = _re_namespace_pattern.search(page_xml, 0, end)
+    namespace = int(match.group(1)) if match else 0
+
+    return namespace, page_xml.find('<redirect', 0, end) >= 0
+
+
+def split_wiki_pages(corpus_path, offset=0, articles_only=True, decompressor=None):
+    """
+    Yields (Offset, PageXML) for each <page> block of a bz2 compressed Wikipedia dump,
+    where Offset is the position in the decompressed dump just after the page. Reading
+    starts from the specified offset which must be one yielded for a previous page.
+    The dump is scanned in blocks of DUMP_BLOCK_SIZE bytes and pages are sliced from
+    each block without being decoded.
+    :param articles_only skip pages outside the article namespace and redirects
+    :param decompressor see open_dump
+    """
+    with open_dump(corpus_path, decompressor) as fp:
+        _skip(fp, offset)
+
+        # Position of buffer in the decompressed dump and of the next page in buffer
+        base, buffer, position = offset, '', 0
+
+        while True:
+            start = buffer.find('<page>', position)
+            end = buffer.find('</page>', start) if start >= 0 else -1
+
+            if end < 0:
+                block = fp.read(DUMP_BLOCK_SIZE)
+                if not block:
+                    break
+
+                # Keep the unfinished page, or enough bytes to match a <page> tag split across blocks
+                consumed = start if start >= 0 else max(position, len(buffer) - len('<page>') + 1)
+                base += consumed
+                buffer = buffer[consumed:] + block
+                position = 0
+                continue
+
+            position = end + len('</page>')
+            page_xml = buffer[start:position]
+
+            if articles_only and _page_header(page_xml) != (0, False):
+                continue
+
+            yield base + position, page_xml
+
+
+def parse_wiki_page(page_xml):
+    """
+    Returns the (Title, Text, Namespace, Redirect) of a <page> block, where
+    Redirect is True for pages which redirect to another page.
+    """
+    root = etree.XML(page_xml)
+
+    title = root.find('title').text
+    title = title.replace('\'', '')
+
+    content = root.find('revision/text').text
+    namespace = root.find('ns')
+
+    return title, content, int(namespace.text) if namespace is not None else 0, root.find('redirect') is not None
+
+
+def extract_wiki_pages(corpus_path, articles_only=False, decompressor=None):
+    """
+    Yields the (Title, Text, Namespace, Redirect) of each page in a bz2 compressed Wikipedia dump.
+    """
+    for _, page_xml in split_wiki_pages(corpus_path, articles_only=articles_only, decompressor=decompressor):
+        yield parse_wiki_page(page_xml)
+
 
-        if term_results:
-            termids = [(tid, term_list[name]) for (tid, name) in term_results]
+# Tokenizer settings of the worker processes, see _init_worker
+_worker_stemmer = NullStemmer()
+_worker_stopwords = set()
 
-            var_string = u'({},%s,%s),'.format(page_id) * len(term_results)
-            var_string = var_string[:-1]
 
-            cur.execute("""
-                INSERT INTO TermOccurrencesTemp (PageID, TermID, Counter)
-                VALUES %s;
-            """ % var_string, itertools.chain.from_iterable(termids))
+def _init_worker(stemmer, stopwords):
+    global _worker_stemmer, _worker_stopwords
 
-        var_string = u''
-        page_links = {}
+    _worker_stemmer = stemmer
+    _worker_stopwords = stopwords
 
-        for link, counter in intra_links.items():
-            cur.execute("""
-                INSERT INTO Pages (PageName, Processed)
-                VALUES (%s, FALSE)
-                ON DUPLICATE KEY UPDATE PageID=LAST_INSERT_ID(PageID);
-            """, (link, ))
+    # Interrupts are handled by the main process which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
 
-            # Handles conflicts gracefully using a dictionary
-            target_page_id = cur.lastrowid
-            if target_page_id not in page_links:
-                page_links[target_page_id] = 0
 
-            page_links[target_page_id] += counter
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
 
-        # Generate the link pairs from the built dictionary
-        for target_page_id, counter in page_links.items():
-            var_string += u'(%d,%d,%d),' % (page_id, target_page_id, counter)
+    if chunk:
+        yield chunk
 
-        # Perform one large batch insert rather than individual inserts
-        if var_string:
-            var_string = var_string[:-1]
-            cur.execute("""
-                INSERT INTO PageLinks (PageID, TargetPageID, Counter)
-                VALUES %s;
-            """ % var_string)
 
+def process_pages(pages):
+    return [process_page(page) for page in pages]
 
-def extract_wiki_pages(corpus_path):
-    is_page = False
-    text_buffer = ''
-    text = 'non-empty'
 
-    with bz2.BZ2File(corpus_path, 'r') as fp:
-        while text:
-            text = fp.readline()
+def _interruptible(results, timeout=24 * 60 * 60):
+    """
+    Yields the items of each list returned by Pool.imap. Waiting with a timeout
+    allows the main process to receive a KeyboardInterrupt while blocked on the workers.
+    """
+    while True:
+        try:
+            chunk = results.next(timeout)
+        except StopIteration:
+            return
 
-            if '<page>' in text:
-                is_page = True
+        for item in chunk:
+            yield item
 
-            if is_page:
-                text_buffer += text
 
-            if '</page>' in text:
-                tree = etree.ElementTree(etree.XML(text_buffer))
-                root = tree.getroot()
+def _bounded_imap(pool, func, chunks, window):
+    """
+    Yields the items of the lists returned by func for each chunk in order, like
+    _interruptible over Pool.imap. Only two windows of chunks are submitted to the pool
+    at a time, so that results which the main process has not written to the database
+    yet cannot accumulate in memory when the workers outpace it.
+    """
+    chunks = iter(chunks)
 
-                title = root.xpath('title')[0].text
-                title = title.replace('\'', '')
+    results = pool.imap(func, list(islice(chunks, window)))
+    while True:
+        # The workers process the next window while the results of the current one are consumed
+        following = list(islice(chunks, window))
+        following_results = pool.imap(func, following) if following else None
 
-                # Add the text of the page to the index
-                content = root.xpath('revision/text')[0].text
+        for item in _interruptible(results):
+            yield item
 
-                text_buffer = ''
-                is_page = False
+        if following_results is None:
+            return
 
-                yield title, content
+        results = following_results
+
+
+def process_page(page):
+    """
+    Parses and tokenizes a page yielded by split_wiki_pages. Run by the worker
+    processes of the indexing pipeline. Returns (Offset, Title, Terms, Links)
+    where Terms and Links are Counters, or None for pages which are ignored.
+    """
+    offset, page_xml = page
+    page_title, page_text, namespace, redirect = parse_wiki_page(page_xml)
+
+    if namespace != 0 or redirect:
+        return offset, page_title, None, None
+
+    if page_title.endswith('(disambiguation)') or page_title.startswith(IGNORE_LIST):
+        return offset, page_title, None, None
+
+    if not page_text or len(page_text) <= MIN_PAGE_SIZE:
+        return offset, page_title, None, None
+
+    intra_links = Counter(_re_link_pattern.findall(page_text))
+
+    clean_text = clean_wiki_markup(page_text)
+    terms = Counter(word_tokenize(clean_text, remove_urls=True, stopwords=_worker_stopwords, stemmer=_worker_stemmer))
+
+    return offset, page_title, terms, intra_links
 
 
 if __name__ == '__main__':
-    import bz2
     import argparse
 
     parser = argparse.ArgumentParser(description='Parse and Index a Wikipedia dump into an SQL database')
     parser.add_argument('path', help='Path to sql data dump compressed in bz2')
     parser.add_argument('--post-setup-only', help='Performs a post setup operation', action='store_true')
-    parser.add_argument('--cont', help='Continues previous terminated index process', action='store_true')
+    parser.add_argument('--cont', help='Continues previous terminated index process from its last checkpoint', action='store_true')
     parser.add_argument('--force', '-f', help='Forces setting up database without warning prompt', action='store_true')
     parser.add_argument('--engine', choices=('MYISAM', 'INNODB'), default='MYISAM', help='Specify what engine to create tables with')
+    parser.add_argument('--sqlite', metavar='DB_PATH', help='Build the index in a SQLite database file instead of the database in db.json')
     parser.add_argument('--stemmer', choices=('none', 'porter', 'lancaster'), default='none', help='Specify if a stemmer should be used')
+    parser.add_argument('--streamed-post-setup', help='Computes the post setup tables with numpy from a single read of TermOccurrences', action='store_true')
+    parser.add_argument('--decompressor', metavar='COMMAND', help='Decompress the dump with a parallel bzip2 command such as lbzip2 or pbzip2')
+    parser.add_argument('--workers', type=int, default=max(1, multiprocessing.cpu_count() - 1), help='Number of processes used to parse and tokenize pages')
 
     args = parser.parse_args()
 
@@ -376,73 +711,41 @@ if __name__ == '__main__':
     else:
         stemmer = NullStemmer()
 
-    last_page_id = None
-    last_page_title = None
+    if args.sqlite:
+        backend = SQLiteBackend(args.sqlite)
+    else:
+        params = load_db_params()
+        if params is None:
+            raise ValueError('Could not find db.json')
 
-    params = load_db_params()
-    if params is None:
-        raise ValueError('Could not find db.json')
+        if params.get('backend', 'mysql') == 'mysql':
+            params.update(charset='utf8', engine=engine)
+        backend = get_backend(**params)
 
-    connection = MySQLdb.connect(charset='utf8', **params)
-    connection.autocommit(False)
-    cur = connection.cursor(cursorclass=MySQLdb.cursors.SSCursor)
+    connection = backend.connect()
+    cur = backend.cursor(connection, streaming=True)
 
     if post_flag:
-        print('Performing a post setup operation on \'%s\'' % params['db'])
-        reply = raw_input('Are you sure you wish to start over \'%s\'? (Y/n): ' % params['db'])
+        print('Performing a post setup operation on \'%s\'' % backend)
+        reply = raw_input('Are you sure you wish to start over \'%s\'? (Y/n): ' % backend)
         if reply.lower() not in ('y', 'yes'):
             print('Aborting operation...')
             sys.exit(1)
 
-        post_setup()
+        post_setup(args.streamed_post_setup)
+        connection.commit()
         sys.exit(0)
 
     # Continue or perform fresh start
     if cont_flag:
-        print('Continuing previous index operation on \'%s\'' % params['db'])
-
-        cur.execute("""
-            SELECT PageID, PageName, CreationDate
-            FROM Pages
-            WHERE Processed = 1
-            ORDER BY CreationDate DESC
-            LIMIT 1;
-        """)
-
-        last_page_id, last_page_title, creation_date = cur.fetchone()
-        cur.fetchall()
-
-        print('Last indexed page was: %s (PageID %d on %s)' % (last_page_title, last_page_id, creation_date))
-
-        # Delete any lingering items which were half way through processing
-        cur.execute("""
-            DELETE TermOccurrencesTemp
-            FROM TermOccurrencesTemp
-            WHERE CreationDate >= %s;
-        """, (creation_date, ))
-
-        cur.execute("""
-            DELETE Terms
-            FROM Terms
-            WHERE CreationDate >= %s;
-        """, (creation_date, ))
-
-        cur.execute("""
-            DELETE Pages
-            FROM Pages
-            WHERE PageID = %s;
-        """, (last_page_id, ))
-
-        cur.execute("""
-            DELETE PageLinks
-            FROM PageLinks
-            WHERE PageID = %s
-        """, (last_page_id, ))
+        # Anything written after the checkpoint was never committed
+        offset, count = load_checkpoint()
+        print('Continuing previous index operation on \'%s\' after page %d (offset %d)' % (backend, count, offset))
     else:
-        print('Setting up \'%s\' database from scratch using %s' % (params['db'], engine))
+        print('Setting up \'%s\' database from scratch using %s' % (backend, backend.name))
 
         if not force:
-            reply = raw_input('Are you sure you wish to delete the database \'%s\' and start over? (Y/n): ' % params['db'])
+            reply = raw_input('Are you sure you wish to delete the database \'%s\' and start over? (Y/n): ' % backend)
             if reply.lower() not in ('y', 'yes'):
                 print('Aborting operation...')
                 sys.exit(1)
@@ -450,88 +753,95 @@ if __name__ == '__main__':
         setup()
         connection.commit()
 
+        offset, count = 0, 0
+
     # Reopen a new cursor to prevent commands out of syncs
     cur.close()
-    cur = connection.cursor(cursorclass=MySQLdb.cursors.SSCursor)
+    cur = backend.cursor(connection, streaming=True)
     t0 = time.time()
 
+    writer = BulkWriter(backend, cur, min_term_count=MIN_TERM_COUNT)
+    if cont_flag:
+        # Page and Term IDs are allocated in memory after those already committed
+        writer.load()
+
     # Settings dictionary that can be one day stored in a file
     settings = {
         'commit-freq': 200,
-        'prune-freq': 4000,
         'speed-freq': 100,
+        'chunk-size': 20,
+        'window-size': 50,
     }
 
-    count = 0
     speed = None
-    target = -1
 
     stopwords = load_stopwords('data/stopwords.txt')
 
     last_speed_update = time.time()
 
-    for page_title, page_text in extract_wiki_pages(path):
-        count += 1
+    # Pages are split from the dump in windows of chunks, parsed and tokenized
+    # by the worker processes and written in dump order by this process
+    pool = multiprocessing.Pool(args.workers, _init_worker, (stemmer, stopwords))
+    chunks = _chunks(split_wiki_pages(path, offset, decompressor=args.decompressor), settings['chunk-size'])
 
-        # If a target is set, break when reached
-        if count == target:
-            break
+    try:
+        for offset, page_title, terms, intra_links in _bounded_imap(pool, process_pages, chunks, settings['window-size']):
+            count += 1
 
-        print(count, page_title, end=' ')
+            print(count, page_title, end=' ')
 
-        if cont_flag:
-            if page_title == last_page_title:
-                cont_flag = False
-                print('(Found!)', end=' ')
-            else:
-                print('(Skipping)', end=' ')
-
-        if not cont_flag:
-            meta = False
-            if page_title.endswith('(disambiguation)') or page_title.startswith(IGNORE_LIST):
-                meta = True
-
-            if not meta and page_text and len(page_text) > MIN_PAGE_SIZE:
-                try:
-                    # Lower and strip required to ensure articles conflate correctly in the Counter object
-                    intra_links = Counter(_re_link_pattern.findall(page_text))
-
-                    clean_text = clean_wiki_markup(page_text)
-                    add_page_index(
-                        word_tokenize(clean_text, remove_urls=True, stopwords=stopwords, stemmer=stemmer),
-                        page_title, intra_links
-                    )
-                except MySQLdb.ProgrammingError as e:
-                    print('(Sql Error: %s)' % e.message)
-                else:
-                    print('(Processed)', end=' ')
+            if terms is not None:
+                add_page_index(terms, page_title, intra_links)
+                print('(Processed)', end=' ')
             else:
                 print('(Ignored)', end=' ')
 
-            # Prune the database from noisy terms every now and so often
-            if count % settings['prune-freq'] == 0:
-                prune()
-
             # Commit the changes made in large batches
             if count % settings['commit-freq'] == 0:
+                writer.flush()
+                save_checkpoint(offset, count)
                 connection.commit()
 
-        # Calculate speed regardless of state
-        if count % settings['speed-freq'] == 0:
-            # Print Estimated speed every commit
-            speed = settings['commit-freq'] / (time.time() - last_speed_update)
-            last_speed_update = time.time()
+            if count % settings['speed-freq'] == 0:
+                speed = settings['speed-freq'] / (time.time() - last_speed_update)
+                last_speed_update = time.time()
+
+            if speed:
+                print('(%d pages/sec)' % speed)
+            else:
+                print('(...)')
 
-        if speed:
-            print('(%d pages/sec)' % speed)
+        writer.flush()
+        save_checkpoint(offset, count)
+        connection.commit()
+    except KeyboardInterrupt:
+        # Uncommitted pages are indexed again when continuing from the last checkpoint
+        pool.terminate()
+        raise
+    except backend.errors as e:
+        # Rows are written in batches by the writer whose IDs no longer match the
+        # database once a batch fails, so indexing stops at the last checkpoint
+        pool.terminate()
+        connection.rollback()
+
+        print('(Sql Error: %s)' % e)
+        if backend.transactional:
+            print('Rolled back to the last checkpoint, which can be continued from with --cont')
         else:
-            print('(...)')
+            print('Pages written after the last checkpoint could not be rolled back by the %s engine' % backend.engine)
+            print('They are written again when continuing from the last checkpoint with --cont')
+        sys.exit(1)
+
+    pool.close()
+    pool.join()
 
     print('Finished reading from the Corpus, cleaning up...')
 
-    post_setup()
+    # Terms which occurred too rarely are only deleted once all pages are indexed
+    prune()
+    connection.commit()
 
-    cur.execute('DROP TABLE IF EXISTS TermOccurrencesTemp;')
+    post_setup(args.streamed_post_setup)
 
     connection.commit()
 
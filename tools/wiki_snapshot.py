@@ -0,0 +1,33 @@
+#! /usr/bin/python
+"""
+Exports the Wikipedia index stored in the database specified by db.json into an
+offline snapshot which can be opened with index.wikisnapshot.WikiSnapshot.
+"""
+from __future__ import print_function
+
+import time
+import argparse
+
+from utils import load_db_params
+from index.wikiindex import WikiIndex
+from index.wikisnapshot import WikiSnapshot, export_snapshot
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a Wikipedia index database into an offline snapshot')
+    parser.add_argument('path', help='Directory to write the snapshot to')
+    args = parser.parse_args()
+
+    params = load_db_params()
+    if params is None:
+        raise ValueError('Could not find db.json')
+
+    t0 = time.time()
+    with WikiIndex(**params) as wiki:
+        print('Exporting %s to %s' % (wiki, args.path))
+        export_snapshot(wiki, args.path)
+
+    snapshot = WikiSnapshot(args.path)
+    print('Exported %d terms and %d pages in %d seconds' % (
+        snapshot.meta['terms'], snapshot.meta['pages'], time.time() - t0
+    ))